@@ -12,16 +12,22 @@ import musicpy as mp
 
 from utils.app_utils.midi_audio import export_to_midi_as_bytes, play_audio
 from utils.parsers.chord_parser import ChordParser
-from utils.plotting import plot_chords
+from utils.operators.reconstruct import reconstruct_chord_json, reconstruct_drum_json
+from utils.parsers.drums import is_drum_json
+from utils.operators.track_builder import TrackBuilder
+from utils.operators.chord import apply_legato
+from utils.plotting import plot_chords, plot_drums
 from utils.app_utils.df_utils import df_to_grid
 
 STANDARD_NOTES = list(mp.database.standard2.keys())
 CHORD_TYPES = list(mp.database.chord_function_dict.keys())
+MAX_CACHED_FILES = 8 # files whose analyzed windows stay in session state
 
 def main(): 
     state['parsed_chord_midi'] = state.get('parsed_chord_midi', {})
     state['parsed_chord_json'] = state.get('parsed_chord_json', {})
     state['chord_parser'] = state.get('chord_parser', {})
+    state['chord_parser_cache'] = state.get('chord_parser_cache', {}) # analyzed windows per file, see ChordParser.segment_cache
     state['chord_data'] = state.get('chord_data', [])
 
     with st.sidebar:
@@ -86,13 +92,31 @@ def upload_chord_midi():
                     with st.form(f'Chord Parser Parameters for {name}'):
                         sample_rate = st.number_input('Sample Rate', min_value=0.5, max_value=8.0, value=1.0, step=0.5)
 
+                        # one pass over every window size instead of trying sample rates one by one
+                        if st.form_submit_button('Suggest sample rate'):
+                            resolutions = ChordParser(chord).analyze_resolutions()
+                            if resolutions is None:
+                                st.warning('Drum track. Sample rate does not apply, drums are parsed per bar.')
+                            else:
+                                st.info(f"Suggested sample rate: {resolutions['suggested_sample_rate']}")
+                                st.dataframe(pd.DataFrame({
+                                    f'{size} bar': {w['start']: w['chord'] for w in windows} 
+                                    for size, windows in resolutions['windows'].items()
+                                }))
+
                         if st.form_submit_button('Parse as chord'):
-                            cp = ChordParser(chord)
+                            segment_cache = file_segment_cache(name)
+                            cp = ChordParser(chord, segment_cache=segment_cache) # only re-analyzes windows not seen before
                             cp.deconstruct_bass(sample_rate=sample_rate)
 
-                            # store deconsstructed bass in state
-                            state['chord_parser'][name] = cp.deconstructed_bass
-                            st.success(f"Bass processing complete for {name}!")
+                            # drum tracks skip chord detection and give a drum pattern JSON instead
+                            if cp.deconstructed_drums is not None:
+                                state['chord_parser'][name] = cp.deconstructed_drums
+                                st.success(f"Drum pattern processing complete for {name}!")
+                            else:
+                                # store deconsstructed bass in state
+                                state['chord_parser'][name] = cp.deconstructed_bass
+                                st.success(f"Bass processing complete for {name}!")
 
         st.divider()
         st.subheader('Download processed content')
@@ -111,10 +135,19 @@ def upload_chord_midi():
 
                 st.code(json_data)
 
+                if is_drum_json(deconstructed):
+                    st.plotly_chart(plot_drums(deconstructed, title=name), use_container_width=True)
+
                 if play_button:
-                    cname = deconstructed[0].get('chord')
+                    cname = None if is_drum_json(deconstructed) else deconstructed[0].get('chord')
+
+                    if is_drum_json(deconstructed):
+                        chord = reconstruct_drum_json(deconstructed)
+                        audio = play_audio(chord)
+                        if audio is not None:
+                            st.audio(audio)
 
-                    if cname:
+                    elif cname:
                         chord = reconstruct_bass(deconstructed)
                         audio = play_audio(chord)
                         if audio is not None:
@@ -148,21 +181,13 @@ def upload_chord_json():
         for name, json_data in state['parsed_chord_json'].items():
             st.info(f"**File**: {name}")
 
-            cname = json_data[0].get('chord')
+            # parsed json is a drum pattern json
+            if is_drum_json(json_data):
+                chd = reconstruct_drum_json(json_data)
 
             # parsed json is a chord json
-            if cname:
-                chd = mp.chord('')
-                for sample in json_data: # json data is actually a list of dicts
-                    cname = sample.get('chord', 'Unknown')
-                    intervals = sample.get('intervals', [])
-                    pattern = sample.get('pattern', [])
-                    pitch = sample.get('pitch', 4)
-                    
-                    try:
-                        chd += mp.C(cname, pitch=pitch) @ pattern % (intervals, intervals)
-                    except Exception as e:
-                        print(f"Error parsing chord: {cname}")
+            elif json_data[0].get('chord'):
+                chd = reconstruct_chord_json(json_data, skip_errors=True) # json data is actually a list of dicts
 
             # parsed json is a note json
             else:
@@ -311,13 +336,7 @@ def iknowwhatimdoing():
 
             # if parsed json is a chord json    
             if cname: 
-                chd = mp.chord('')
-                for sample in json_data: 
-                    cname = sample.get('chord', 'Unknown')
-                    intervals = sample.get('intervals', [])
-                    pattern = sample.get('pattern', [])
-                    pitch = sample.get('pitch', 4)
-                    chd += mp.C(cname, pitch=pitch) @ pattern % (intervals, intervals)
+                chd = reconstruct_chord_json(json_data)
             
             #  if parsed json is a note json
             else:
@@ -409,12 +428,25 @@ def show_chord_df():
 
 
 
+
+
+def file_segment_cache(name:str):
+    """
+    Analyzed windows of one file, see ChordParser.segment_cache. Files are kept in least recently used order,
+    only the last MAX_CACHED_FILES keep their windows.
+    """
+    caches = state['chord_parser_cache']
+    caches[name] = caches.pop(name, {}) # move to the end, the most recently used
+    while len(caches) > MAX_CACHED_FILES:
+        del caches[next(iter(caches))]
+    return caches[name]
 
 
 def clear_cache():
     state['parsed_chord_midi'] = {}
     state['parsed_chord_json'] = {}
     state['chord_parser'] = {}
+    state['chord_parser_cache'] = {}
     state['chord_data'] = []
 
 
@@ -452,54 +484,20 @@ def download_json_no_refresh(fname, bytes):
 
 
 
-def apply_legato(chord):
-    total_duration = sum(chord.interval)  # Total duration of the chord progression
-    
-    for i, note in enumerate(chord.notes):
-        if i < len(chord.notes) - 1:
-            # Check the duration till the next non-zero interval
-            j = i + 1
-            while j < len(chord.notes) and chord.interval[j] == 0:
-                j += 1
-            if j < len(chord.notes):
-                # Extend the duration up to the start of the next note
-                note.duration = sum(chord.interval[i:j+1])
-            else:
-                # Extend to the end of the progression for the last note with zero interval
-                note.duration = total_duration - sum(chord.interval[:i])
-        else:
-            # Last note: ensure it spans to the end of the progression
-            note.duration = total_duration - sum(chord.interval[:i])
-
-    return chord
-
-
-
-
 def reconstruct_note_dict(note_dict):
-    chd  = mp.chord('')
+    builder = TrackBuilder()
     for dct in note_dict:
         notes = dct.get('notes', 'Unknown')
         note_str = ','.join(notes)
         interval = dct.get('interval', 0) 
-        chd += mp.chord(note_str, duration=interval) # implicitly already has legato
+        builder.append(mp.chord(note_str, duration=interval)) # implicitly already has legato
     
-    return chd
+    return builder.to_chord()
 
 
 def reconstruct_bass(deconstructed_bass):
     try:
-        chd = mp.chord('')
-        for c in deconstructed_bass:
-            cname = c.get('chord', 'Unknown')
-            pitch = c.get('pitch', 4)
-            intervals = c.get('intervals', [])
-            pattern = c.get('pattern', [])
-            try:
-                chd += mp.C(cname, pitch=pitch) @ pattern % (intervals, intervals)
-            except Exception as e:
-                chd += mp.chord(cname) @ pattern % (intervals, intervals)
-                
+        chd = reconstruct_chord_json(deconstructed_bass)
         chd = apply_legato(chd)
         return chd
     
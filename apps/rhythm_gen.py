@@ -7,9 +7,10 @@ import musicpy as mp
 from utils.app_utils.df_utils import df_to_grid
 from utils.app_utils.midi_audio import play_audio, export_to_midi_as_bytes, download_midi_no_refresh
 from utils.plotting import plot_chords
-from utils.constants import RHYTHM_VARIANTS, PATTERN_VARIANTS
+from utils.library import get_library
 from utils.generators.rhythm_generator import generate_rhythm_for_chord
 from utils.generators.chord_enhancer import ChordEnhancer
+from utils.operators.templates import get_template
 
 
 
@@ -25,6 +26,7 @@ def main():
     state['enhanced_chord_dict'] = state.get('enhanced_chord_dict', {})
     state['chord_enhancer_settings'] = state.get('chord_enhancer_settings', {})
     state['generated_enhanced_chord'] = state.get('generated_enhanced_chord', {})
+    state['chord_enhancer_cache'] = state.get('chord_enhancer_cache', {}) # built rows, reused between Generate clicks. LRU, see ChordEnhancer.MAX_CACHE_ROWS
 
     st.title('Rhythm Generator')
     with st.sidebar:
@@ -55,7 +57,7 @@ def main():
 # tab 1
 #------
 def chord_form_part():
-    rhythm_name_map = {rhythm['name']: rhythm for rhythm in RHYTHM_VARIANTS} # {'name': 'quarter', 'rhythm': 'b b b b', 'bars': 1} >> {'quarter': {'name': 'quarter', 'rhythm': 'b b b b', 'bars': 1}}
+    rhythm_name_map = get_library().rhythms # {'quarter': {'name': 'quarter', 'rhythm': 'b b b b', 'bars': 1}}
 
     selected_ts = st.selectbox('Select Time Signature', options=[None, '3/4', '4/4'], index=0, help='Warning: Changing time signature may cause errors. Currently only supports 4/4')
 
@@ -69,6 +71,7 @@ def chord_form_part():
 
     with c1:
         selected_rhythm = st.selectbox('Select rhythm', rhythm_name_map, index=2, help="Check JSON to view the beat. No support for custom rhythm for now.") 
+        st.caption('Similar: ' + ', '.join(name for name, _ in get_library().similar(selected_rhythm, k=3)))
     with c2: 
         selected_bars = st.number_input('Select number of bars', min_value=0, max_value=8, value=None, help="Tries to fit the rhythm within a range of selected bar")
     with c3:
@@ -168,8 +171,9 @@ def adv_part_contents_and_settings():
 
 
 def advanced_rhythm_part():
-    rhythm_name_map = {rhythm['name']: rhythm for rhythm in RHYTHM_VARIANTS}
-    pattern_name_map = {p['name']: p for p in PATTERN_VARIANTS}
+    library = get_library()
+    rhythm_name_map = library.rhythms
+    pattern_name_map = library.patterns
 
     # Prepare a mapping from display name to index
     chord_display_names = [f"{i}: {chord['chord_name']}" for i, chord in enumerate(state['enhanced_chord_dict'])]
@@ -279,9 +283,9 @@ def advanced_rhythm_part():
                     cr_str = rhythm_name_map[chord_rhythm]['rhythm']
                     br_str = rhythm_name_map[bass_rhythm]['rhythm']
 
-                    ce = ChordEnhancer()
-                    for dict in state['enhanced_chord_dict']:
-                        ce.add_chord(chord=mp.C(dict['chord_name']), chord_name=dict['chord_name']) 
+                    ce = ChordEnhancer(cache=state['chord_enhancer_cache'])
+                    chord_names = [dict['chord_name'] for dict in state['enhanced_chord_dict']]
+                    ce.add_chords([get_template(cname).to_chord() for cname in chord_names], chord_names=chord_names)
 
                     if chord_pattern in [None, []]:
                         ce.apply_rhythm(rhythm_str=cr_str, accent=chord_accent, bars=chord_bars, indices=chord_indices)
@@ -293,12 +297,10 @@ def advanced_rhythm_part():
                         ce.apply_bass(indices=bass_indices, rhythm=br_str, accent=bass_accent, pitch_diff=-2)
                     ce.reconcile_length()
 
-                    if ce.chord_df.empty:
+                    if len(ce) == 0:
                         st.error('No chords were generated. Check your settings.')
                         return
-                    co = mp.chord('')
-                    for c in ce.chord_df['chord_obj']:
-                        co += c
+                    co = ce.to_chord() # rows are only built here, unchanged ones come from the cache
                     state['generated_enhanced_chord'] = co
 
 
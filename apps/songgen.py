@@ -4,14 +4,16 @@ import musicpy as mp
 import json
 import traceback
 
-from utils.constants import RHYTHM_VARIANTS
 from utils.app_utils.midi_audio import play_audio, export_to_midi_as_bytes
-from utils.generators.generator import PopGenerator
+from utils.generators.batch import build_pop_generator, generate_batch, rank_batch, batch_piece
+from utils.operators.reconstruct import reconstruct_chord_json
 from utils.plotting import plot_chords
 
 
 def main():
     state['generator_params'] = state.get('generator_params', {})
+    state['generation_cache'] = state.get('generation_cache', {}) # generated parts per (parameters, seed), see PopGenerator.cache
+    state['song_variations'] = state.get('song_variations', []) # ranked BatchResults
 
     st.subheader('Song Generator')
     t1, t2 = st.tabs(['Setup', 'Generate'])
@@ -39,6 +41,9 @@ def main():
         with st.expander('Track Generator', expanded=True):
             track_generator()
 
+        with st.expander('Variations', expanded=False):
+            variation_generator()
+
         if state['generator_params'].get('song', None) is not None:
             song = state['generator_params']['song']
             with st.expander('MIDI Player', expanded=True):
@@ -69,6 +74,8 @@ def track_generator():
             with_chords = st.checkbox('Chords', value=True, disabled=True)
             with_bass = st.checkbox('Bass', value=True)
             with_melody = st.checkbox('Melody', value=True)
+        with c2:
+            seed = st.number_input('Seed', min_value=0, value=None, step=1, help='Same seed and parameters give the same song. Leave blank for a new song every time.')
 
         submit_button = st.form_submit_button('Generate Track')
 
@@ -78,51 +85,16 @@ def track_generator():
             return
         
         try:
-            bpm = state['generator_params'].get('bpm', 120)
-            length = state['generator_params'].get('length', 10)
-            melody_ins = state['generator_params'].get('melody_instrument', 25)
-            chord_ins = state['generator_params'].get('chord_instrument', 47)
-
-            chords = state['generator_params'].get('chord_list', [])
-            key = state['generator_params'].get('key', 'C')
-            mode = state['generator_params'].get('mode', 'major')
-            progression = state['generator_params'].get('progression', None)
-            chord_duration = state['generator_params'].get('chord_duration', 1)
-            chord_intervals = state['generator_params'].get('chord_intervals', [1/8, 0])
-
-            melody_octave = state['generator_params'].get('melody_octave', 3)
-            melody_durations = state['generator_params'].get('melody_durations', [3/8, 5/8, 1/8, 1/2, 1/4, mp.beat(1/2,1), mp.beat(1/8,1)])
-
-            bass_octave = state['generator_params'].get('bass_octave', 2)
-            bass_rhythms = state['generator_params'].get('bass_rhythms', RHYTHM_VARIANTS[0]['rhythm'])
-
-            pg = PopGenerator(
-                scale=mp.scale(key, mode),
-                length=length,
-                bpm=bpm,
-                chord_instrument=chord_ins,
-                melody_instrument=melody_ins,
-
-                chord_duration=chord_duration,
-                selected_chord_intervals=chord_intervals,
-                melody_durations=melody_durations,
-                melody_octave=melody_octave,
-
-                bass_octave=bass_octave,
-                bass_rhythms=bass_rhythms,
-            )
-            if chords != []:
+            if state['generator_params'].get('chord_list', []) != []:
                 st.info('Adding custom chords. Progression will be ignored')
-                for chorddict in chords:
-                    cname = chorddict['chord']
-                    intervals= chorddict['intervals']
-                    pattern = chorddict['pattern']
-                    pitch = chorddict['pitch'] 
-                    pg.add_chord(cname, pitch, pattern, interval=intervals)
-
             else:
                 st.info('No custom chords provided, generating from progression')
-                pg.set_chord_progressions(progression=progression)
+
+            pg = build_pop_generator(
+                state['generator_params'],
+                seed=None if seed is None else int(seed),
+                cache=state['generation_cache'] if seed is not None else None,
+            )
 
             song = pg.generate_all(
                 generate_chords=with_chords, 
@@ -139,6 +111,51 @@ def track_generator():
 
 
 
+def variation_generator():
+    if state['generator_params'] == {}:
+        st.error('You need to submit some paramaters first')
+        return
+
+    with st.form('Variation Generator'):
+        c1, c2, c3 = st.columns([1,1,1])
+        with c1:
+            num_variations = st.number_input('Variations', min_value=1, max_value=100, value=20, help='Songs generated in parallel from the same parameters, one per seed')
+        with c2:
+            first_seed = st.number_input('First seed', min_value=0, value=0, step=1)
+        with c3:
+            rank_by = st.selectbox('Rank by', options=['score', 'mean_leap', 'range', 'repetition'], help='Score prefers small leaps, a moderate range and some repetition. Metrics other than score are sorted low to high.')
+
+        submit_button = st.form_submit_button('Generate variations')
+
+    if submit_button:
+        params = {k: v for k, v in state['generator_params'].items() if k not in ['song']}
+        seeds = list(range(int(first_seed), int(first_seed) + int(num_variations)))
+        progress = st.progress(0.0, text='Generating variations')
+        results = []
+        try:
+            for result in generate_batch(params, seeds):
+                results.append(result)
+                progress.progress(len(results) / len(seeds), text=f'Generated {len(results)}/{len(seeds)}')
+        except Exception as e:
+            st.error(f'Error: {e}')
+            traceback.print_exc()
+            return
+        state['song_variations'] = rank_batch(results, key=rank_by, reverse=rank_by == 'score')
+
+    if state['song_variations'] != []:
+        st.dataframe(
+            [{'seed': r.seed, 'score': r.score, **r.metrics} for r in state['song_variations']],
+            use_container_width=True,
+        )
+        selected_seed = st.selectbox('Select variation', options=[r.seed for r in state['song_variations']], help='Loads the variation into the MIDI player. The same seed in Track Generator gives the same song.')
+        if st.button('Load variation'):
+            result = next(r for r in state['song_variations'] if r.seed == selected_seed)
+            state['generator_params']['song'] = batch_piece(state['generator_params'], result)
+            st.rerun()
+
+
+
+
 def select_basic_params_form():
     with st.form('Select Parameters'): 
         st.write('Basic parameters')
@@ -200,6 +217,7 @@ def select_melody_params_form():
         rest_list = [f'rest({duration})' for duration in AVAILABLE_DURATIONS]
         melody_duration_options = AVAILABLE_DURATIONS + rest_list
         selected_melody_durations = st.multiselect('Select melody duration', options=melody_duration_options, default=[0.1875, 0.375, 'rest(0.1875)'], help='Duration of melody notes. Rests are used to create a rest between notes. Randomized in list.')
+        selected_melody_mode = st.selectbox('Melody mode', options=['random', 'markov'], index=0, help='Random picks chord and scale notes with the durations above. Markov follows pitch and duration patterns learned from the jsons/ corpus and ignores the durations above.')
 
     
         if st.form_submit_button('Submit'):
@@ -209,6 +227,7 @@ def select_melody_params_form():
             
             state['generator_params']['melody_octave'] = selected_melody_octave
             state['generator_params']['melody_durations'] = selected_melody_durations
+            state['generator_params']['melody_mode'] = selected_melody_mode
 
     
 
@@ -239,13 +258,7 @@ def chord_json_form():
 
             # if parsed json is a chord json    
             if cname: 
-                chd = mp.chord('')
-                for sample in json_data: 
-                    cname = sample.get('chord', 'Unknown')
-                    intervals = sample.get('intervals', [])
-                    pattern = sample.get('pattern', [])
-                    pitch = sample.get('pitch', 4)
-                    chd += mp.C(cname, pitch=pitch) @ pattern % (intervals, intervals)
+                chd = reconstruct_chord_json(json_data) # validates the json before it is stored
 
         except Exception as e:
             st.error(f"Error parsing JSON: {e}")
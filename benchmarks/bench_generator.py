@@ -0,0 +1,52 @@
+"""
+PopGenerator timings per song length.
+
+    python -m benchmarks.bench_generator
+    python -m benchmarks.bench_generator --lengths 10 50 200 --repeats 5
+"""
+import io
+import time
+import random
+import argparse
+import statistics
+import contextlib
+import musicpy as mp
+
+from utils.generators.generator import PopGenerator
+
+
+def time_call(make_generator, method:str, repeats:int, seed:int=0):
+    """min and median seconds of one generator method, a fresh seeded generator per run."""
+    times = []
+    for _ in range(repeats):
+        random.seed(seed)
+        pg = make_generator()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            getattr(pg, method)()
+            times.append(time.perf_counter() - start)
+    return min(times), statistics.median(times)
+
+
+def bench(lengths:list, repeats:int, progression:int=6451):
+    def make_generator(length):
+        def make():
+            pg = PopGenerator(scale=mp.scale('C', 'major'), length=length)
+            with contextlib.redirect_stdout(io.StringIO()):
+                pg.set_chord_progressions(progression=progression)
+            return pg
+        return make
+
+    print(f'{"length":>8} {"method":<28} {"min ms":>10} {"median ms":>10}')
+    for length in lengths:
+        for method in ['generate_chord_and_melody', 'generate_all']:
+            best, median = time_call(make_generator(length), method, repeats)
+            print(f'{length:>8} {method:<28} {best * 1000:>10.1f} {median * 1000:>10.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lengths', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+    bench(args.lengths, args.repeats)
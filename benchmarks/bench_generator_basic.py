@@ -0,0 +1,70 @@
+"""
+generator_basic timings: the batch API against the per chord musicpy path it replaces.
+
+    python -m benchmarks.bench_generator_basic
+    python -m benchmarks.bench_generator_basic --progressions 1000 --repeats 3
+"""
+import time
+import argparse
+import statistics
+import musicpy as mp
+
+from utils.generators.generator_basic import generate_arp_batch, generate_chord_batch, generate_arp_from_scale, random_progressions
+from utils.operators.chord import join_chords
+
+
+PATTERN = [1, 2, 3, 1.1]
+
+
+def musicpy_json(scale, progressions, interval:float=1/8):
+    """Chord json the way generator_basic built it before the batch API: musicpy chords and mp.alg.detect per chord."""
+    jsons = []
+    for progression in progressions:
+        chords = scale % (progression, interval, interval, 4)
+        jsons.append([
+            {'chord': mp.alg.detect(chd).split(' ')[0], 'intervals': [interval] * len(PATTERN), 'pattern': PATTERN, 'pitch': chd.notes[0].num}
+            for chd in chords
+        ])
+    return jsons
+
+
+def musicpy_chords(scale, progressions, interval:float=1/8):
+    """One joined mp.chord per progression from scale % and @ pattern."""
+    return [join_chords([chd @ PATTERN % (interval, interval) for chd in scale % (progression, interval, interval, 4)]) for progression in progressions]
+
+
+def time_call(fn, repeats:int):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times), statistics.median(times)
+
+
+def bench(num_progressions:int, repeats:int):
+    scale = mp.scale('D', 'minor')
+    progressions = random_progressions(num_progressions, seed=0)
+    generate_arp_batch(scale, progressions[:1], pattern=PATTERN) # tables are built once per process, time warm calls
+
+    cases = [
+        ('musicpy + detect, json', lambda: musicpy_json(scale, progressions)),
+        ('musicpy, mp.chord', lambda: musicpy_chords(scale, progressions)),
+        ('generate_arp_from_scale loop, json', lambda: [generate_arp_from_scale(scale, p, 4, 1/8, pattern=PATTERN) for p in progressions]),
+        ('generate_arp_batch, NoteTable', lambda: generate_arp_batch(scale, progressions, 4, 1/8, pattern=PATTERN)),
+        ('generate_arp_batch, json', lambda: generate_arp_batch(scale, progressions, 4, 1/8, pattern=PATTERN, as_json=True)),
+        ('generate_chord_batch, NoteTable', lambda: generate_chord_batch(scale, progressions, 4)),
+    ]
+    print(f'{num_progressions} progressions, D minor, 4 notes, pattern {PATTERN}')
+    print(f'{"case":<38} {"min ms":>10} {"median ms":>10}')
+    for name, fn in cases:
+        best, median = time_call(fn, repeats)
+        print(f'{name:<38} {best * 1000:>10.1f} {median * 1000:>10.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--progressions', type=int, default=100)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+    bench(args.progressions, args.repeats)
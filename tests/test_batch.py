@@ -0,0 +1,33 @@
+from utils.constants import RHYTHM_VARIANTS
+from utils.generators.batch import build_pop_generator, generate_batch, rank_batch, _warm_worker
+from utils.operators.rhythm import compile_rhythm
+from utils.operators.templates import diatonic_table
+
+
+PARAMS = {'key': 'D', 'mode': 'minor', 'progression': '6451', 'length': 4}
+
+
+def test_default_bass_rhythms_is_a_list_of_rhythms():
+    pg = build_pop_generator(PARAMS, seed=1)
+    assert pg.bass_rhythms == [RHYTHM_VARIANTS[0]['rhythm']]
+
+
+def test_warm_worker_fills_rhythm_and_scale_caches():
+    compile_rhythm.cache_clear()
+    diatonic_table.cache_clear()
+    _warm_worker(PARAMS)
+
+    assert compile_rhythm.cache_info().currsize == 1
+    compile_rhythm(RHYTHM_VARIANTS[0]['rhythm'], 1)
+    assert compile_rhythm.cache_info().hits == 1
+
+    build_pop_generator(PARAMS, seed=1)
+    assert diatonic_table.cache_info().misses == 1 # set_chord_progressions() found the warmed table
+
+
+def test_generate_batch_is_reproducible():
+    first = rank_batch(generate_batch(PARAMS, seeds=[1, 2], max_workers=1))
+    second = rank_batch(generate_batch(PARAMS, seeds=[1, 2], max_workers=1))
+    assert [r.seed for r in first] == [r.seed for r in second]
+    for a, b in zip(first, second):
+        assert a.tables[2].degrees.tolist() == b.tables[2].degrees.tolist()
@@ -0,0 +1,86 @@
+import musicpy as mp
+
+from utils.generators.chord_enhancer import ChordEnhancer
+
+
+RHYTHMS = ['b b b b', 'b 0 b 0', 'b - b b', 'b b - -']
+
+
+def _build(cache, rhythm_str, max_cache_rows=10):
+    ce = ChordEnhancer(cache=cache, max_cache_rows=max_cache_rows)
+    ce.load_preset_chords()
+    ce.apply_rhythm(rhythm_str)
+    return ce, ce.to_chords()
+
+
+def test_cache_is_bounded():
+    cache = {}
+    for rhythm_str in RHYTHMS:
+        ce, _ = _build(cache, rhythm_str)
+        assert len(cache) <= 10
+
+    # the latest build is always kept
+    assert all(ce._row_key(i) in cache for i in range(len(ce)))
+
+
+def test_cache_reuses_recent_rows():
+    cache = {}
+    _, first = _build(cache, RHYTHMS[0])
+    _, again = _build(cache, RHYTHMS[0])
+    assert all(a is b for a, b in zip(first, again))
+
+    # two other builds push the first one out
+    _build(cache, RHYTHMS[1])
+    _build(cache, RHYTHMS[2])
+    _, rebuilt = _build(cache, RHYTHMS[0])
+    assert not any(a is b for a, b in zip(first, rebuilt))
+
+
+def test_latest_build_kept_when_larger_than_limit():
+    cache = {}
+    ce, chords = _build(cache, RHYTHMS[0], max_cache_rows=3)
+    assert len(cache) == len({ce._row_key(i) for i in range(len(ce))})
+
+
+def _notes(chord):
+    return [(str(n), float(n.duration)) for n in chord.notes], [float(i) for i in chord.interval]
+
+
+def _enhanced(*steps):
+    ce = ChordEnhancer()
+    ce.add_chords([mp.C('Am7', 3)], chord_names=['Am7'])
+    for step in steps:
+        if step == 'rhythm':
+            ce.apply_rhythm('b - b 0')
+        elif step == 'bass':
+            ce.apply_bass(rhythm='b 0 b 0')
+        else:
+            ce.reconcile_length()
+    return _notes(ce.to_chords()[0])
+
+
+def test_reconcile_runs_in_call_order():
+    bass_then_reconcile = _enhanced('rhythm', 'bass', 'reconcile')
+    reconcile_then_bass = _enhanced('rhythm', 'reconcile', 'bass')
+    assert bass_then_reconcile != reconcile_then_bass
+
+    # reconcile stretches the last notes sounding at that point, the bass is stacked later and left as is
+    names, _ = reconcile_then_bass
+    assert names[-2:] == [('G4', 0.5), ('A1', 0.25)]
+    names, _ = bass_then_reconcile
+    assert names[-2:] == [('G4', 0.25), ('A1', 0.5)]
+
+
+def test_reconcile_dropped_by_later_voice():
+    assert _enhanced('reconcile', 'rhythm') == _enhanced('rhythm')
+
+
+def test_reconcile_skips_rows_added_after():
+    ce = ChordEnhancer()
+    ce.add_chords([mp.C('Am7', 3)], chord_names=['Am7'])
+    ce.apply_rhythm('b - b 0')
+    ce.reconcile_length()
+    ce.add_chord(ce.chord_objs[0], chord_name='Am7')
+    ce.apply_rhythm('b - b 0', indices=[1])
+    first, second = ce.to_chords()
+    assert _notes(first) != _notes(second)
@@ -0,0 +1,33 @@
+import musicpy as mp
+
+from utils.parsers.chord_parser import ChordParser
+
+
+def _progression(chords):
+    track = mp.C(chords[0]) % (1, [0, 0, 1])
+    for name in chords[1:]:
+        track = track | mp.C(name) % (1, [0, 0, 1])
+    return track
+
+
+def test_segment_cache_is_bounded():
+    cache = {}
+    for chords in [['C', 'Am', 'F', 'G'], ['Dm', 'Em', 'Bdim', 'E'], ['A', 'D', 'B', 'Cm']]:
+        cp = ChordParser(_progression(chords), segment_cache=cache, max_cache_segments=5)
+        cp.deconstruct_bass(sample_rate=1)
+        assert len(cache) <= 5
+
+    # the latest parse is always kept
+    assert [w['chord'] for w in cp.deconstructed_bass] == [cache[key]['chord'] for key in list(cache)[-4:]]
+
+
+def test_segment_cache_reuses_windows():
+    cache = {}
+    first = ChordParser(_progression(['C', 'Am', 'F', 'G']), segment_cache=cache)
+    first.deconstruct_bass(sample_rate=1)
+    keys = list(cache)
+
+    again = ChordParser(_progression(['C', 'Am', 'F', 'G']), segment_cache=cache)
+    again.deconstruct_bass(sample_rate=1)
+    assert list(cache) == keys
+    assert again.deconstructed_bass == first.deconstructed_bass
@@ -0,0 +1,89 @@
+import pytest
+import numpy as np
+import musicpy as mp
+
+from utils.generators.generator_basic import generate_arp_batch, generate_chord_batch, random_progressions, shape_name
+from utils.operators.reconstruct import reconstruct_chord_json
+from utils.operators.track_builder import TrackBuilder
+
+
+PROGRESSIONS = ['6451', '12345678', '2516']
+
+
+def musicpy_arp(scale, progression, n_notes, interval, omit, inversion, pattern):
+    """The per chord musicpy path generate_arp_batch() replaces."""
+    chords = scale % (progression, interval, interval, n_notes)
+    for o in omit:
+        chords = [chord.omit(o) for chord in chords]
+    if inversion:
+        chords = [chord ^ inversion for chord in chords]
+    if pattern:
+        chords = [chord @ pattern % (interval, interval) for chord in chords]
+    return TrackBuilder().extend(chords).to_table()
+
+
+CASES = [
+    # key, mode, n_notes, omit, inversion, pattern
+    ('C', 'major', 4, [], None, []),
+    ('D', 'minor', 3, [], 1, [1, 2, 3, 1.1]),
+    ('F#', 'major', 4, [5], 2, [1, -1.1, 2, 3.1]),
+    ('Bb', 'dorian', 5, [], 1, []),
+    ('Eb', 'phrygian', 4, [5], None, [3, 2, 1, 2]),
+]
+
+
+@pytest.mark.parametrize('key, mode, n_notes, omit, inversion, pattern', CASES)
+def test_arp_batch_matches_musicpy(key, mode, n_notes, omit, inversion, pattern):
+    scale = mp.scale(key, mode)
+    tables = generate_arp_batch(scale, PROGRESSIONS, n_notes, 1/8, omit, inversion, pattern)
+    for progression, table in zip(PROGRESSIONS, tables):
+        expected = musicpy_arp(scale, progression, n_notes, 1/8, omit, inversion, pattern)
+        assert table.degrees.tolist() == expected.degrees.tolist()
+        assert np.allclose(table.intervals, expected.intervals)
+        assert np.allclose(table.durations, expected.durations)
+        assert np.allclose(table.onsets, expected.onsets)
+        if not pattern:
+            assert table.names.tolist() == expected.names.tolist() # same spelling as scale %
+
+
+@pytest.mark.parametrize('key, mode', [('C', 'major'), ('F#', 'minor')])
+def test_chord_batch_matches_musicpy(key, mode):
+    scale = mp.scale(key, mode)
+    tables = generate_chord_batch(scale, PROGRESSIONS, n_notes=3, duration=1)
+    for progression, table in zip(PROGRESSIONS, tables):
+        expected = TrackBuilder().extend(scale % (progression, 1, 0, 3)).to_table()
+        assert table.names.tolist() == expected.names.tolist()
+        assert table.nums.tolist() == expected.nums.tolist()
+        assert np.allclose(table.onsets, expected.onsets)
+        assert np.allclose(table.durations, expected.durations)
+
+
+@pytest.mark.parametrize('key, mode, n_notes, omit, inversion, pattern', CASES)
+def test_json_round_trips(key, mode, n_notes, omit, inversion, pattern):
+    scale = mp.scale(key, mode)
+    tables = generate_arp_batch(scale, PROGRESSIONS, n_notes, 1/8, omit, inversion, pattern)
+    jsons = generate_arp_batch(scale, PROGRESSIONS, n_notes, 1/8, omit, inversion, pattern, as_json=True)
+    for table, chord_json in zip(tables, jsons):
+        assert all(set(entry) == {'chord', 'intervals', 'pattern', 'pitch'} for entry in chord_json)
+        track = reconstruct_chord_json(chord_json)
+        assert [n.degree for n in track.notes] == table.degrees.tolist()
+        assert list(track.interval) == table.intervals.tolist()
+
+
+@pytest.mark.parametrize('names, nums, expected', [
+    (('C', 'E', 'G'), (4, 4, 4), ('C', 4)),
+    (('A', 'C', 'E', 'G'), (3, 4, 4, 4), ('Am7', 3)),
+    (('B', 'D', 'F', 'A'), (3, 4, 4, 4), ('Bm7b5', 3)),
+    (('G', 'B', 'D', 'F'), (2, 2, 3, 3), ('G7', 2)),
+    (('F', 'A', 'C', 'E', 'G'), (4, 4, 5, 5, 5), ('Fmaj9', 4)),
+    (('B', 'D', 'F', 'A', 'C'), (3, 4, 4, 4, 5), ('B3, D4, F4, A4, C5', 3)), # no chord type, literal notes
+])
+def test_shape_name(names, nums, expected):
+    degrees = tuple(mp.note(name, num).degree for name, num in zip(names, nums))
+    assert shape_name(names, nums, degrees) == expected
+
+
+def test_random_progressions_follow_the_seed():
+    assert random_progressions(20, seed=1) == random_progressions(20, seed=1)
+    assert random_progressions(20, seed=1) != random_progressions(20, seed=2)
+    assert all(p in mp.database.choose_chord_progressions_list for p in random_progressions(20, seed=3))
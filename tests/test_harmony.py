@@ -0,0 +1,37 @@
+import numpy as np
+import musicpy as mp
+
+from utils.parsers.harmony import beat_histogram, analyze_resolutions
+
+
+def test_beat_histogram_whole_note():
+    histogram = beat_histogram(mp.chord([mp.note('C', 4, duration=1)]))
+    assert histogram.shape == (4, 12)
+    assert np.allclose(histogram[:, 0], 0.25)
+
+
+def test_beat_histogram_respects_start_time():
+    track = mp.C('C') % (1, [0, 0, 1]) | mp.C('Am') % (1, [0, 0, 1])
+    shifted = mp.C('C') % (1, [0, 0, 1]) | mp.C('Am') % (1, [0, 0, 1])
+    shifted.start_time = 1
+
+    histogram = beat_histogram(track)
+    shifted_histogram = beat_histogram(shifted)
+    assert shifted_histogram.shape == (12, 12)
+    assert np.allclose(shifted_histogram[:4], 0) # first bar is the rest
+    assert np.allclose(shifted_histogram[4:], histogram)
+
+
+def test_resolutions_shift_with_start_time():
+    shifted = mp.C('C') % (1, [0, 0, 1]) | mp.C('Am') % (1, [0, 0, 1])
+    shifted.start_time = 1
+    windows = analyze_resolutions(shifted)['windows'][1]
+    assert [(w['chord'], w['start'], w['end']) for w in windows] == [('CM', 1, 2), ('Am', 2, 3)]
+
+
+def test_resolutions_default_windows_in_3_4():
+    waltz = mp.C('C') % (1, [0, 0, 1]) | mp.C('G') % (1, [0, 0, 1])
+    resolutions = analyze_resolutions(waltz, beats_per_bar=3)
+    assert list(resolutions['windows']) == [1, 2, 4] # half a bar is 1.5 beats, skipped
+    assert [w['chord'] for w in resolutions['windows'][1]] == ['CM', 'GM']
+    assert resolutions['suggested_sample_rate'] == 1
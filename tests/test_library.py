@@ -0,0 +1,33 @@
+from utils.library import RhythmLibrary, GRID_RESOLUTION
+
+
+def _library():
+    return RhythmLibrary(rhythms=[
+        {'name': 'Tresillo', 'rhythm': 'b - - b - - b -', 'bars': 1, 'time_signature': '4/4'},
+        {'name': 'Tresillo 3/4', 'rhythm': 'b - - b - - b -', 'bars': 1, 'time_signature': '3/4'},
+        {'name': 'Five', 'rhythm': 'b - b - b - b - b -', 'bars': 1, 'time_signature': '5/4'},
+        {'name': 'Double Tresillo', 'rhythm': 'b - - b - - b - b - - b - - b -', 'bars': 2, 'time_signature': '4/4'},
+    ], patterns=[])
+
+
+def test_similar_compares_at_query_meter():
+    library = _library()
+    distances = dict(library.similar('Tresillo', k=10))
+
+    # same rhythm in another meter lines up once compiled at the query's
+    assert distances['Tresillo 3/4'] == 0
+    # 5 even beats over a 4/4 bar share only the downbeat with Tresillo
+    assert distances['Five'] == 6
+    assert len(library.onset_grid('Five', '4/4', 1)) == GRID_RESOLUTION
+
+
+def test_similar_uses_query_preset_meter():
+    library = _library()
+    distances = dict(library.similar('Five', k=10))
+    assert distances['Tresillo'] == distances['Tresillo 3/4']
+    assert len(library.onset_grid('Tresillo', '5/4', 1)) == GRID_RESOLUTION * 5 // 4
+
+
+def test_similar_rhythm_string_defaults_to_4_4():
+    library = _library()
+    assert library.similar('b - - b - - b -', k=1) == [('Tresillo', 0)]
@@ -0,0 +1,23 @@
+import os
+
+from utils.generators.markov import get_melody_model, train_melody_model, CORPUS_DIR, DEFAULT_MODEL_PATH
+
+
+def test_paths_do_not_depend_on_working_directory():
+    assert os.path.isabs(DEFAULT_MODEL_PATH)
+    assert os.path.isdir(CORPUS_DIR)
+
+
+def test_get_melody_model_sees_retrained_model(tmp_path):
+    model_path = str(tmp_path / 'melody_model.npz')
+    corpus = sorted(os.path.join(CORPUS_DIR, f) for f in os.listdir(CORPUS_DIR))
+
+    train_melody_model(corpus[:2], model_path=model_path)
+    first = get_melody_model(model_path)
+    assert get_melody_model(model_path) is first
+
+    train_melody_model(corpus[2:4], model_path=model_path)
+    second = get_melody_model(model_path)
+    assert second is not first
+    assert second.num_sequences > first.num_sequences
+    assert second.signature() != first.signature()
@@ -0,0 +1,30 @@
+import pytest
+import musicpy as mp
+
+from utils.operators.midi import note_to_midi, names_to_midi, midi_to_names
+
+
+def test_round_trip():
+    midis = names_to_midi(['C-1', 'C4', 'Db4', 'G9', mp.note('A', 3)])
+    assert midis.tolist() == [0, 60, 61, 127, 57]
+    assert midi_to_names(midis).tolist() == ['C-1', 'C4', 'C#4', 'G9', 'A3']
+
+
+def test_unknown_spelling_raises():
+    with pytest.raises(ValueError, match='H4'):
+        names_to_midi(['C4', 'H4'])
+    with pytest.raises(ValueError, match='H4'):
+        note_to_midi('H4')
+
+
+def test_names_outside_midi_range_raise():
+    with pytest.raises(ValueError, match='C10'):
+        note_to_midi('C10')
+    with pytest.raises(ValueError, match='132'):
+        names_to_midi(['C4', 'C10'])
+
+
+@pytest.mark.parametrize('midis', [[-1], [60, 128]])
+def test_midi_outside_range_raises(midis):
+    with pytest.raises(ValueError, match=str(midis[-1])):
+        midi_to_names(midis)
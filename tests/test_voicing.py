@@ -0,0 +1,28 @@
+import musicpy as mp
+
+from utils.operators.chord import voice_progression, _voicing_candidates, MAX_VOICING_CANDIDATES, MAX_VOICING_PITCH_CLASSES
+from utils.operators.midi import names_to_midi
+
+
+def test_voice_progression_example():
+    voiced = voice_progression([mp.C('C'), mp.C('F'), mp.C('G'), mp.C('C')], note_as_string=True)
+    assert voiced == [['C3', 'E3', 'G3'], ['C3', 'F3', 'A3'], ['D3', 'G3', 'B3'], ['E3', 'G3', 'C4']]
+
+
+def test_candidates_are_capped():
+    for n in range(1, 13):
+        candidates = _voicing_candidates(tuple(range(n)))
+        assert 0 < len(candidates) <= MAX_VOICING_CANDIDATES
+        assert candidates.shape[1] == n
+
+
+def test_large_chords_keep_every_pitch_class():
+    cluster = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#']
+    thirteenth = ['C', 'E', 'G', 'B', 'D', 'F#', 'A']
+    assert len(cluster) > MAX_VOICING_PITCH_CLASSES
+
+    voiced = voice_progression([cluster, thirteenth, mp.C('F'), cluster], note_as_string=True)
+    for chord, voicing in zip([cluster, thirteenth, ['F', 'A', 'C'], cluster], voiced):
+        midis = names_to_midi(voicing)
+        assert sorted(set((midis % 12).tolist())) == sorted(set((names_to_midi(chord) % 12).tolist()))
+        assert list(midis) == sorted(midis)
@@ -0,0 +1,190 @@
+import numpy as np
+import musicpy as mp
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from utils.constants import RHYTHM_VARIANTS
+from utils.generators.generator import PopGenerator
+from utils.generators.generation_cache import to_tables, from_tables
+from utils.generators.markov import get_melody_model
+from utils.operators.templates import get_template, scale_table
+from utils.operators.rhythm import compile_rhythm
+
+
+# One generated variation. tables are NoteTables of (chords, bass, melody), cheap to send between processes.
+BatchResult = namedtuple('BatchResult', ['seed', 'tables', 'metrics', 'score'])
+
+DEFAULT_MELODY_DURATIONS = [3/8, 5/8, 1/8, 1/2, 1/4, mp.beat(1/2,1), mp.beat(1/8,1)]
+DEFAULT_BASS_RHYTHMS = [RHYTHM_VARIANTS[0]['rhythm']] # list of rhythm strings, the generator uses the first
+DEFAULT_CHORD_NOTES_NUM = [4]
+
+
+
+def build_pop_generator(params:dict, seed=None, cache:dict=None):
+    """
+    PopGenerator from the song generator parameters (state['generator_params'] in apps/songgen.py).
+    Custom chords in params['chord_list'] win over the progression.
+
+    params: dict
+        EG: {'key': 'C', 'mode': 'major', 'progression': '6451', 'length': 16, 'bpm': 120, ...}
+        params['melody_mode'] == 'markov' uses the shared MelodyModel for melodies.
+
+    Returns:
+        PopGenerator, chords set, nothing generated yet
+    """
+    pg = PopGenerator(
+        scale=mp.scale(params.get('key', 'C'), params.get('mode', 'major')),
+        length=params.get('length', 10),
+        bpm=params.get('bpm', 120),
+        chord_instrument=params.get('chord_instrument', 47),
+        melody_instrument=params.get('melody_instrument', 25),
+
+        chord_notes_num=params.get('chord_notes_num', DEFAULT_CHORD_NOTES_NUM),
+        chord_duration=params.get('chord_duration', 1),
+        selected_chord_intervals=params.get('chord_intervals', [1/8, 0]),
+        melody_durations=params.get('melody_durations', DEFAULT_MELODY_DURATIONS),
+        melody_octave=params.get('melody_octave', 3),
+
+        bass_octave=params.get('bass_octave', 2),
+        bass_rhythms=params.get('bass_rhythms', DEFAULT_BASS_RHYTHMS),
+
+        melody_model=get_melody_model() if params.get('melody_mode') == 'markov' else None,
+        seed=seed,
+        cache=cache,
+    )
+
+    chords = params.get('chord_list', [])
+    if chords != []:
+        for chorddict in chords:
+            pg.add_chord(chorddict['chord'], chorddict['pitch'], chorddict['pattern'], interval=chorddict['intervals'])
+    else:
+        pg.set_chord_progressions(progression=params.get('progression', None))
+    return pg
+
+
+def melody_metrics(table):
+    """
+    Cheap shape measures of a melody NoteTable.
+
+    Returns:
+        dict of
+            'range': semitones between the lowest and highest note
+            'mean_leap': mean absolute semitone step between consecutive notes
+            'max_leap': largest step
+            'repetition': share of steps that repeat the previous note
+    """
+    degrees = table.degrees
+    if len(degrees) < 2:
+        return {'range': 0, 'mean_leap': 0.0, 'max_leap': 0, 'repetition': 0.0}
+
+    leaps = np.abs(np.diff(degrees))
+    return {
+        'range': int(np.ptp(degrees)),
+        'mean_leap': float(leaps.mean()),
+        'max_leap': int(leaps.max()),
+        'repetition': float(np.mean(leaps == 0)),
+    }
+
+
+def default_score(metrics:dict):
+    """
+    Higher is more singable: small steps, range within about an octave and a half, a bit of repetition but not a drone.
+    """
+    range_penalty = max(0, metrics['range'] - 19) * 0.5
+    leap_penalty = metrics['mean_leap'] + max(0, metrics['max_leap'] - 12) * 0.25
+    repetition_bonus = min(metrics['repetition'], 0.3) * 5
+    return round(repetition_bonus - leap_penalty - range_penalty, 4)
+
+
+def _warm_worker(params:dict):
+    """
+    Process pool initializer. Fills the chord template, diatonic table, rhythm and melody model caches once per worker
+    instead of once per seed.
+    """
+    chords = params.get('chord_list', [])
+    for chorddict in chords:
+        get_template(chorddict['chord'], chorddict['pitch'])
+    if chords == []:
+        scale = mp.scale(params.get('key', 'C'), params.get('mode', 'major'))
+        scale = scale.relative_key() if 'minor' in scale.mode else scale # PopGenerator builds chords on the relative major
+        for n_notes in params.get('chord_notes_num', DEFAULT_CHORD_NOTES_NUM):
+            scale_table(scale, n_notes)
+    bass_rhythms = params.get('bass_rhythms', DEFAULT_BASS_RHYTHMS)
+    if bass_rhythms:
+        compile_rhythm(bass_rhythms[0], 1)
+    if params.get('melody_mode') == 'markov':
+        get_melody_model().tables
+
+
+def generate_variation(params:dict, seed:int, flags:dict=None, score_fn=default_score):
+    """
+    One song for one seed. Runs in a worker process, returns plain arrays only.
+
+    flags: dict
+        Passed to generate_all(). EG: {'generate_bass': False}
+    """
+    pg = build_pop_generator(params, seed=seed)
+    pg.generate_all(**(flags or {}))
+    tables = to_tables([pg.chords_part, pg.bass_part, pg.melody_part])
+    metrics = melody_metrics(tables[2])
+    return BatchResult(seed=seed, tables=tables, metrics=metrics, score=score_fn(metrics))
+
+
+def generate_batch(params:dict, seeds:list, flags:dict=None, max_workers:int=None, score_fn=default_score):
+    """
+    Generates one variation per seed across a process pool and yields them as they finish, not in seed order.
+    Every variation is reproducible from its seed, see PopGenerator(seed=...).
+
+    params: dict
+        Same as build_pop_generator()
+
+    seeds: list of int
+
+    max_workers: int
+        Size of the process pool. 1 generates in this process, without a pool.
+
+    score_fn: callable
+        metrics dict >> float, see melody_metrics(). Must be picklable (module level function).
+
+    Yields:
+        BatchResult
+
+    Example:
+        results = rank_batch(generate_batch(params, seeds=range(20)))
+        piece = batch_piece(params, results[0])
+    """
+    if max_workers == 1:
+        _warm_worker(params)
+        for seed in seeds:
+            yield generate_variation(params, seed, flags, score_fn)
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_warm_worker, initargs=(params,)) as executor:
+        futures = [executor.submit(generate_variation, params, seed, flags, score_fn) for seed in seeds]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def rank_batch(results, key:str='score', reverse:bool=True):
+    """
+    Sorts batch results, best first.
+
+    key: str
+        'score', or a melody_metrics() field. EG: 'mean_leap' with reverse=False for the smoothest melodies first.
+    """
+    if key == 'score':
+        return sorted(results, key=lambda r: r.score, reverse=reverse)
+    return sorted(results, key=lambda r: r.metrics[key], reverse=reverse)
+
+
+def batch_piece(params:dict, result:BatchResult):
+    """
+    mp.piece of one batch result, same tracks and instruments as PopGenerator.generate_all().
+    """
+    pg = PopGenerator(
+        bpm=params.get('bpm', 120),
+        chord_instrument=params.get('chord_instrument', 47),
+        melody_instrument=params.get('melody_instrument', 25),
+    )
+    pg.chords_part, pg.bass_part, pg.melody_part = from_tables(result.tables)
+    return pg.build_piece()
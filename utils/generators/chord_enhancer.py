@@ -1,33 +1,124 @@
-import musicpy as mp 
+import musicpy as mp
 import pandas as pd
-from copy import deepcopy
+from copy import copy
 import random
 
 
-from utils.operators.chord import accenting_rhythm_chord
-from utils.constants import PATTERN_VARIANTS
+from utils.operators.chord import accenting_rhythm_chord, join_chords
+from utils.library import get_library
 from utils.operators.chord import clamp_chord_pattern, detect_chord_name, lengthen_note_duration_in_chord
+from utils.operators.templates import get_template
+from utils.operators.rhythm import compile_rhythm, tile_rhythm
+
+
+
+def _freeze(value):
+    """Lists to tuples, so operation params can be part of a cache key."""
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _chord_signature(chord:mp.chord):
+    return (
+        tuple((n.name, n.num, n.duration, n.volume) for n in chord.notes),
+        tuple(chord.interval),
+        chord.start_time,
+    )
 
 
 
 class ChordEnhancer:
-    def __init__(self):
+    """
+    Columnar store of chords, one list per field. The apply_* methods do not touch any chord, they record
+    an operation plan per row:
+        voice: the last apply_rhythm() or apply_patterns(), applied to the added chord. Earlier ones are dropped.
+        steps: apply_bass() and reconcile_length() calls made after the voice operation, run in call order.
+               EG: reconcile then bass leaves the bass uncut, bass then reconcile trims it to the row.
+    Rows are built once in to_chords() / to_chord(). Pass a dict as cache (eg: from session state) and rows
+    with the same chord and plan are reused between runs instead of built again.
+
+    USAGE:
+    ce = ChordEnhancer(cache=state['chord_enhancer_cache'])
+    ce.load_preset_chords()
+    ce.apply_patterns(indices=[0, 2])
+    ce.reconcile_length()
+    track = ce.to_chord()
+    """
+    COLUMNS = ['chord_obj', 'chord_name', 'start', 'end', 'intervals', 'pattern', 'rhythm']
+    MAX_CACHE_ROWS = 256
+
+    def __init__(self, cache:dict=None, max_cache_rows:int=MAX_CACHE_ROWS):
+        """
+        cache: dict
+            Built rows keyed by chord content and operation plan. Shared between enhancers.
+            Kept in least recently used order, the oldest rows are dropped past max_cache_rows.
+
+        max_cache_rows: int
+            Most rows kept in the cache. Rows of the latest build are never dropped, even if there are more of them.
+        """
         self.time_signature = [4,4]
-        self.chord_df = pd.DataFrame(columns=['chord_obj', 'chord_name', 'start', 'end', 'intervals', 'pattern'])
-        pass 
-
-    def __get_basic_row_info(self, row):
-        chord = deepcopy(row['chord_obj'])
-        chord_name = row['chord_name']
-        start = row['start']
-        end = row['end']
-        bars = end - start
-        return chord, chord_name, start, end, bars
-    
+        self.cache = cache if cache is not None else {}
+        self.max_cache_rows = max_cache_rows
+        self.clear()
+
+    def __len__(self):
+        return len(self.chord_objs)
+
+    def clear(self):
+        self.chord_objs = [] # chords as added, operations never modify them
+        self.chord_names = []
+        self.starts = []
+        self.ends = []
+        self.voice_ops = [] # None, ('rhythm', ...) or ('pattern', ...) per row
+        self.steps = [] # list of ('bass', ...) and ('reconcile',) per row, in call order
+
+    def _selected(self, indices:list=None):
+        """Valid row indices to operate on, all rows if None or empty."""
+        if indices in [None, []]:
+            return list(range(len(self)))
+        selected = set(indices)
+        return [i for i in range(len(self)) if i in selected]
+
+    def _bars(self, i:int):
+        return self.ends[i] - self.starts[i]
+
+    def _set_voice(self, i:int, op:tuple):
+        self.voice_ops[i] = op
+        self.steps[i] = [] # bass and reconcile done on the old voicing are gone with it
+
+    @property
+    def patterns(self):
+        return [list(op[1]) if op and op[0] == 'pattern' else None for op in self.voice_ops]
+
+    @property
+    def intervals(self):
+        return [list(op[2]) if op and op[0] == 'pattern' else None for op in self.voice_ops]
+
+    @property
+    def rhythms(self):
+        return [op[1] if op and op[0] == 'rhythm' else None for op in self.voice_ops]
+
+    @property
+    def chord_df(self):
+        """DataFrame view for display, builds every row. Edit through the methods instead."""
+        return pd.DataFrame({
+            'chord_obj': self.to_chords(),
+            'chord_name': self.chord_names,
+            'start': self.starts,
+            'end': self.ends,
+            'intervals': self.intervals,
+            'pattern': self.patterns,
+            'rhythm': self.rhythms,
+        }, columns=self.COLUMNS)
+
     def to_dict(self):
-        df_copy = self.chord_df.copy()
-        df_copy.drop(columns=['chord_obj'], inplace=True)
-        return df_copy.to_dict(orient='records')
+        """Rows and their recorded operations. Nothing is built."""
+        return [
+            {'chord_name': name, 'start': start, 'end': end, 'intervals': intervals, 'pattern': pattern, 'rhythm': rhythm}
+            for name, start, end, intervals, pattern, rhythm
+            in zip(self.chord_names, self.starts, self.ends, self.intervals, self.patterns, self.rhythms)
+        ]
 
     def show(self):
         print(self.to_dict())
@@ -36,54 +127,68 @@ class ChordEnhancer:
     def set_time_signature(self, time_signature:list=[4,4]):
         self.time_signature = time_signature
 
-    
+
     def load_preset_chords(self):
-        self.chord_df = pd.DataFrame(columns=['chord_obj', 'chord_name', 'start', 'end', 'intervals', 'pattern'])
+        self.clear()
         cnames = ['Fmaj7', 'G7, b9, omit 5', 'Am7', 'D7', 'FmM7', 'G7,#5', 'Cmaj7', 'Bdim7']
         chords = [
             mp.C('Fmaj7',3),
-            mp.C('G7, b9, omit 5',3), 
-            mp.C('Am7', 3), 
-            mp.C('D7', 3) ^ 2, 
-            mp.C('FmM7', 3) ^ 2, 
-            mp.C('G7,#5', 3), 
-            mp.C('Cmaj7',4), 
-            mp.C('Bdim7',3), 
+            mp.C('G7, b9, omit 5',3),
+            mp.C('Am7', 3),
+            mp.C('D7', 3) ^ 2,
+            mp.C('FmM7', 3) ^ 2,
+            mp.C('G7,#5', 3),
+            mp.C('Cmaj7',4),
+            mp.C('Bdim7',3),
         ]
-        for i, chord in enumerate(chords):
-            self.add_chord(chord, chord_name=cnames[i])
+        self.add_chords(chords, chord_names=cnames)
 
 
     def add_chord(self, chord:mp.chord, chord_name:str=None, start:int=None, end:int=None, intervals:list=None, pattern:list=None):
-        """ 
-        Adds a chord to the chord_df. Using df because it is easier to search and filter and apply functions
+        """
+        Adds a chord as a new row. Without start and end, it lasts 1 bar after the last row.
+        Pattern and intervals, if both given, are recorded like apply_patterns() on this row.
         """
         if chord_name == None:
             chord_name = detect_chord_name(chord)
 
-        latest_end = self.chord_df.iloc[-1]['end'] if len(self.chord_df) > 0 else 0
-        cdict = {
-            "chord_name": chord_name,
-            "chord_obj": chord,
-            "start": latest_end if start == None else start,
-            "end": latest_end + 1 if end == None else end,
-        }
-        self.chord_df.loc[len(self.chord_df)] = cdict
+        latest_end = self.ends[-1] if len(self) > 0 else 0
+        self.chord_objs.append(chord)
+        self.chord_names.append(chord_name)
+        self.starts.append(latest_end if start == None else start)
+        self.ends.append(latest_end + 1 if end == None else end)
+        self.voice_ops.append(None)
+        self.steps.append([])
+        if pattern is not None and intervals is not None:
+            self._set_voice(len(self) - 1, ('pattern', _freeze(pattern), _freeze(intervals)))
+
+
+    def add_chords(self, chords:list, chord_names:list=None):
+        """
+        Adds several chords back to back, 1 bar each.
+
+        Example:
+            ce.add_chords([mp.C('Am7', 3), mp.C('Fmaj7', 3)], chord_names=['Am7', 'Fmaj7'])
+        """
+        if chord_names is None:
+            chord_names = [None] * len(chords)
+        for chord, chord_name in zip(chords, chord_names):
+            self.add_chord(chord, chord_name=chord_name)
 
 
     def apply_rhythm(
-        self, 
-        rhythm_str:str=None, 
+        self,
+        rhythm_str:str=None,
         bars:int=None,
-        indices:list=None, 
-        accent:bool=False, 
-        high_volume:int=100, 
+        indices:list=None,
+        accent:bool=False,
+        high_volume:int=100,
         low_volume:int=80
     ):
         """
-        OVERWRITES apply_patterns()
+        OVERWRITES apply_patterns() and any apply_bass() recorded before it.
 
-        Applies rhythm to all chords in the chord_df or selected indices. 
+        Applies rhythm to all rows or selected indices.
 
         rhythm_str: str
             Rhythm string in the form of 'b b b b b b b b'
@@ -100,79 +205,59 @@ class ChordEnhancer:
         low_volume: int
             Volume of the low beats.
         """
-        # apply rhythm to all records if None
-        if indices in [None, []]:
-            indices = range(len(self.chord_df))
-
-        for i, row in self.chord_df.iterrows():
-            if i in indices:
-                chord, chord_name, start, end, default_bars = self.__get_basic_row_info(row)
-                if bars == None:
-                    bars = default_bars
-            
-                if accent == True:
-                    chord = accenting_rhythm_chord(chord, rhythm_str, bars, high_volume, low_volume)
-                else:
-                    rhythm = mp.rhythm(rhythm_str, bars)
-                    chord = chord.from_rhythm(rhythm)
-                self.chord_df.at[i, 'chord_obj'] = chord
-
-    
+        for i in self._selected(indices):
+            row_bars = self._bars(i) if bars == None else bars
+            self._set_voice(i, ('rhythm', rhythm_str, row_bars, bool(accent), high_volume, low_volume))
+
+
     def apply_patterns(
-        self, 
-        indices:list=None, 
-        pattern_list:list=None, 
-        interval_list:list=None, 
+        self,
+        indices:list=None,
+        pattern_list:list=None,
+        interval_list:list=None,
         round_robin:bool=True
     ):
         """
-        OVERWRITES apply_rhythm() 
+        OVERWRITES apply_rhythm() and any apply_bass() recorded before it.
+
+        Applies pattern to all rows or selected indices.
 
-        Applies pattern to all chords in the chord_df or selected indices. 
-        
         indices: list
             List of indices to apply pattern to. If None, applies to all chords.
 
         pattern: list
-            List of floats representing the pattern. 
-            
+            List of floats representing the pattern.
+
         intervals: list
-            List of floats representing the intervals between notes. 
-            
+            List of floats representing the intervals between notes.
+
         round_robin: bool
-            If True, the pattern and interval is applied in round robin fashion. Else, applies P and I to random indices. 
+            If True, the pattern and interval is applied in round robin fashion. Else, applies P and I to random indices.
+            Random choices are made here, so a built row does not change between to_chord() calls.
         """
-        if indices in [None, []]:
-            indices = range(len(self.chord_df)) 
-
         if pattern_list == None or interval_list == None:
-            # get all patterns from pattern name map
-            pattern_name_map = {p['name']: p for p in PATTERN_VARIANTS} 
-            pattern_list = [pattern_name_map[p]['pattern'] for p in pattern_name_map]
-            interval_list = [pattern_name_map[p]['intervals'] for p in pattern_name_map]
-        
+            # get all patterns from the library
+            patterns = get_library().patterns.values()
+            pattern_list = [p['pattern'] for p in patterns]
+            interval_list = [p['intervals'] for p in patterns]
+
         for i, (pattern, interval) in enumerate(zip(pattern_list, interval_list)):
             if len(pattern) != len(interval):
                 raise ValueError(f'Pattern and intervals must have the same length. Error at index {i}')
-            
-        for i, row in self.chord_df.iterrows():
-            if i in indices:
-                chord, chord_name, start, end, bars = self.__get_basic_row_info(row)
-                
-                if round_robin == True:
-                    pattern = pattern_list[i % len(pattern_list)]
-                    interval = interval_list[i % len(interval_list)]
-                else:
-                    random_idx = random.randint(0, len(pattern_list)-1)
-                    pattern = pattern_list[random_idx]
-                    interval = interval_list[random_idx]
-
-                # clamp pattern if it contains notes outside the chord range
-                clamped_pattern = clamp_chord_pattern(mp.C(chord_name), pattern)
-                new_chord = chord @ clamped_pattern % (interval, interval)
-                new_chord = lengthen_note_duration_in_chord(new_chord)
-                self.chord_df.at[i, 'chord_obj'] = new_chord
-            
+
+        for i in self._selected(indices):
+            if round_robin == True:
+                pattern = pattern_list[i % len(pattern_list)]
+                interval = interval_list[i % len(interval_list)]
+            else:
+                random_idx = random.randint(0, len(pattern_list)-1)
+                pattern = pattern_list[random_idx]
+                interval = interval_list[random_idx]
+
+            # clamp pattern if it contains notes outside the chord range
+            clamped_pattern = clamp_chord_pattern(get_template(self.chord_names[i]), pattern)
+            self._set_voice(i, ('pattern', _freeze(clamped_pattern), _freeze(interval)))
+
 
     def apply_bass(
         self,
@@ -184,39 +269,76 @@ class ChordEnhancer:
         pitch_diff:int=-2,
     ):
         """
-        WILL BE OVERWRITTEN if function is called before apply_rhythm() or apply_patterns(). Recommend to do it last.
+        Stacks a bass line on the root of the chord. Dropped if apply_rhythm() or apply_patterns() is called on the row afterwards,
+        so call it last.
         """
-        if indices in [None, []]:
-            indices = range(len(self.chord_df))
-
         if rhythm == None:
             rhythm = 'b b b b b b b b'
 
-        for i, row in self.chord_df.iterrows():
-            if i in indices:
-                chord, chord_name, start, end, bars = self.__get_basic_row_info(row)
-                root = chord.notes[0]
-                bass = mp.chord(f"{root}") 
-                bass = bass + (pitch_diff * 12)
-                
-                # apply accent if required
-                if accent == True:
-                    bass = accenting_rhythm_chord(bass, rhythm, bars, bounce_low_notes=True)
-                else:
-                    r = mp.rhythm(rhythm, bars)
-                    bass = bass.from_rhythm(r)
-
-                new_chord = chord & bass 
-                self.chord_df.at[i, 'chord_obj'] = new_chord
+        for i in self._selected(indices):
+            self.steps[i].append(('bass', rhythm, bool(accent), pitch_diff))
 
-                
 
-
-
-    def reconcile_length(self): 
-        """ 
-        Reconciles the duration of every chord object in chord df according to their respective start and end
+    def reconcile_length(self):
+        """
+        Reconciles the duration of every chord object according to their respective start and end, when rows are built.
+        Recorded as a step of every current row, so it only covers what was applied before it.
+        Dropped like apply_bass() if apply_rhythm() or apply_patterns() is called on the row afterwards.
         """
+        for i in range(len(self)):
+            self.steps[i].append(('reconcile',))
+
+
+    #-----------
+    # materialization
+    #-----------
+    def _row_key(self, i:int):
+        return (
+            _chord_signature(self.chord_objs[i]),
+            self._bars(i),
+            self.voice_ops[i],
+            tuple(self.steps[i]),
+        )
+
+
+    def _build_row(self, i:int):
+        """Runs the operation plan of one row. Every step returns a new chord, the added chord is never modified."""
+        chord = self.chord_objs[i]
+        bars = self._bars(i)
+
+        voice = self.voice_ops[i]
+        if voice is not None and voice[0] == 'rhythm':
+            _, rhythm_str, rhythm_bars, accent, high_volume, low_volume = voice
+            if accent == True:
+                chord = accenting_rhythm_chord(chord, rhythm_str, rhythm_bars, high_volume, low_volume)
+            else:
+                chord = tile_rhythm(chord, compile_rhythm(rhythm_str, rhythm_bars))
+
+        elif voice is not None and voice[0] == 'pattern':
+            _, pattern, interval = voice
+            chord = chord @ list(pattern) % (list(interval), list(interval))
+            chord = lengthen_note_duration_in_chord(chord)
+
+        for step in self.steps[i]:
+            if step[0] == 'reconcile':
+                chord = self._reconcile_row(chord, bars)
+                continue
+
+            _, rhythm, accent, pitch_diff = step
+            root = chord.notes[0]
+            bass = mp.chord(f"{root}")
+            bass = bass + (pitch_diff * 12)
+
+            # apply accent if required
+            if accent == True:
+                bass = accenting_rhythm_chord(bass, rhythm, bars, bounce_low_notes=True)
+            else:
+                bass = tile_rhythm(bass, compile_rhythm(rhythm, bars))
+            chord = chord & bass
+        return chord
+
+
+    def _reconcile_row(self, chord:mp.chord, bars:float):
         def get_last_notes(chord):
             # Find the index of the last note in the chord
             last_note_index = len(chord.notes)-1
@@ -229,27 +351,40 @@ class ChordEnhancer:
                     break
             return last_notes_indices
 
-        # go through all records in df
-        for i, row in self.chord_df.iterrows():
-            chord, chord_name, start, end, bars = self.__get_basic_row_info(row)
-
-            # Get the indices of the last notes
-            last_notes_indices = get_last_notes(chord)
-
-            # Set the duration of the last notes to bars
-            for idx in last_notes_indices:
-                chord.notes[idx].duration = bars
-
-            # Trim the chord by bars
-            new_chord = chord.cut(ind1=0, ind2=bars, cut_extra_duration=True, cut_extra_interval=True, round_duration=True, round_cut_interval=True)
-
-            # Update the chord in the DataFrame
-            self.chord_df.at[i, 'chord_obj'] = new_chord
-
-
-
+        # Set the duration of the last notes to bars. Only those notes are copied, cut() copies the rest
+        notes = list(chord.notes)
+        for idx in get_last_notes(chord):
+            notes[idx] = copy(notes[idx])
+            notes[idx].duration = bars
+        chord = mp.chord(notes, interval=list(chord.interval), start_time=chord.start_time)
 
+        # Trim the chord by bars
+        return chord.cut(ind1=0, ind2=bars, cut_extra_duration=True, cut_extra_interval=True, round_duration=True, round_cut_interval=True)
 
 
+    def to_chords(self):
+        """
+        Builds every row once, reusing rows found in self.cache. Used rows move to the end of the cache,
+        then the least recently used ones are dropped down to max_cache_rows.
 
-        
\ No newline at end of file
+        Returns:
+            list of mp.chord obj, one per row. Shared with the cache, do not modify them.
+        """
+        chords = []
+        used = set()
+        for i in range(len(self)):
+            key = self._row_key(i)
+            row = self.cache.pop(key) if key in self.cache else self._build_row(i)
+            self.cache[key] = row # dicts keep insertion order, the end is the most recently used
+            used.add(key)
+            chords.append(row)
+
+        # rows just used sit at the end, so only older ones are dropped
+        while len(self.cache) > max(self.max_cache_rows, len(used)):
+            del self.cache[next(iter(self.cache))]
+        return chords
+
+
+    def to_chord(self):
+        """All rows joined into one track."""
+        return join_chords(self.to_chords())
@@ -0,0 +1,74 @@
+import hashlib
+import random
+import numpy as np
+import musicpy as mp
+
+from utils.operators.track_builder import TrackBuilder
+
+
+
+def make_rng(seed=None):
+    """
+    Random source of a generator.
+
+    seed: int, random.Random or None
+        None keeps the global random module, so random.seed() still applies. 
+        An int gives a private random.Random(seed), a Random instance is used as is.
+
+    Example:
+        rng = make_rng(42)
+        rng.choice([1, 2, 3]) >> same value on every run
+    """
+    if seed is None:
+        return random
+    if isinstance(seed, random.Random):
+        return seed
+    return random.Random(seed)
+
+
+def make_np_rng(seed=None):
+    """
+    NumPy Generator of a generator, for vectorized sampling next to make_rng().
+
+    seed: int, random.Random or None
+        An int seeds it directly. A Random instance, or the global random module for None, seeds it with 64 bits drawn from it,
+        so random.seed() still applies.
+
+    Example:
+        make_np_rng(42).random(2) >> same values on every run
+    """
+    if seed is None:
+        seed = random.getrandbits(64)
+    elif isinstance(seed, random.Random):
+        seed = seed.getrandbits(64)
+    return np.random.default_rng(seed)
+
+
+def generation_key(params, rng):
+    """
+    Content key of one generation, a hash of the parameters and the random state right before generating.
+    Same parameters + same seed >> same key >> same song.
+
+    params: anything with a stable repr. EG: tuple of settings, chord signatures
+    """
+    content = repr((params, rng.getstate()))
+    return hashlib.sha1(content.encode()).hexdigest()
+
+
+def chord_signature(chord:mp.chord):
+    """Plain tuple of the note data of a chord, for generation keys."""
+    return (
+        tuple((n.name, n.num, n.duration, n.volume) for n in chord.notes),
+        tuple(chord.interval),
+        chord.start_time,
+    )
+
+
+def to_tables(chords:list):
+    """mp.chord objs >> NoteTables, what a generation cache stores."""
+    return [TrackBuilder(chord).to_table() for chord in chords]
+
+
+def from_tables(tables:list):
+    """NoteTables >> new mp.chord objs, safe to modify."""
+    return [TrackBuilder.from_table(table).to_chord() for table in tables]
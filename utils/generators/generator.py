@@ -1,9 +1,18 @@
 import musicpy as mp
-import random
-import re
-from copy import deepcopy
+from collections import namedtuple
 
 from utils.constants import RHYTHM_VARIANTS
+from utils.operators.templates import get_template, scale_table
+from utils.operators.track_builder import TrackBuilder
+from utils.operators.chord import apply_legato
+from utils.operators.rhythm import compile_rhythm, tile_rhythm
+from utils.generators.melody_sampler import MelodySampler
+from utils.generators.generation_cache import make_rng, make_np_rng, generation_key, chord_signature, to_tables, from_tables
+
+
+# One chord of PopGenerator.chords as plain tuples, read by the generators instead of deep copies of the chord.
+# length and end are chord.bars(mode=0) and chord.bars(mode=1), non_chord_names are the scale notes outside the chord (by pitch class)
+ChordSpan = namedtuple('ChordSpan', ['names', 'nums', 'durations', 'volumes', 'channels', 'intervals', 'start_time', 'non_chord_names', 'length', 'end'])
 
 
 class PopGenerator:
@@ -12,7 +21,7 @@ class PopGenerator:
 
     s = mp.scale('C', 'minor')
 
-    pg = PopGenerator(scale=s, bpm=120)
+    pg = PopGenerator(scale=s, bpm=120, seed=42)
     """
     def __init__(
         self,
@@ -37,7 +46,23 @@ class PopGenerator:
         harmonize:bool=False,
         num_harmony_notes:int=1,
         variance:float=100,
+        melody_model=None,
+
+        seed:int=None,
+        cache:dict=None,
     ):
+        """
+        melody_model: MelodyModel
+            Melodies follow its pitch and duration n-grams instead of uniform picks from melody_durations and the chord/scale notes.
+            EG: get_melody_model() from utils.generators.markov
+
+        seed: int or random.Random
+            Makes generation reproducible. None uses the global random module like before.
+
+        cache: dict
+            Generated parts keyed by parameters + random state, see generate_all(). 
+            Pass the same dict between generators (eg: from session state) so a known (parameters, seed) is never generated twice.
+        """
         if scale:
             self.scale = scale if not 'minor' in scale.mode else scale.relative_key()
         else:
@@ -70,6 +95,14 @@ class PopGenerator:
         self.harmonize = harmonize
         self.num_harmony_notes = num_harmony_notes
         self.variance = variance
+        self.melody_model = melody_model
+        self.melody_context = None # n-gram context carried from one chord to the next, see generate_melody()
+
+        # reproducibility
+        self.seed = seed
+        self.rng = make_rng(seed)
+        self.np_rng = make_np_rng(seed) # melody sampling, see generate_melody()
+        self.cache = cache
 
         # generated objects
         self.chords = []
@@ -77,24 +110,12 @@ class PopGenerator:
         self.chord_intervals = []
         self.chord_index = 0 
         self.length_count = 0
+        self._spans = {} # chord index >> (chord, scale, ChordSpan), see _span()
+        self._sampler = None # (melody_durations, MelodySampler), see _melody_sampler()
         self.chords_part = mp.chord([])
         self.melody_part = mp.chord([])
         self.bass_part = mp.chord([])
 
-    def _apply_legato(self, chord:mp.chord, intervals:list):
-        chord = chord.copy()
-        for i, note in enumerate(chord.notes):
-            if intervals[i] == 0:
-                # Find the next non-zero interval
-                next_non_zero = next((x for x in intervals[i+1:] if x != 0), None)
-                if next_non_zero is not None:
-                    note.duration = next_non_zero
-                else:
-                    note.duration = 0  # Fallback if no non-zero interval is found
-            else:
-                note.duration = intervals[i]
-        return chord
-
 
     def add_chord(self, chord_name:str, pitch:int=4, pattern:list=[], interval:list=[]):
         """ 
@@ -114,8 +135,8 @@ class PopGenerator:
             self.chord_progressions = None
             print('Chord progression reset to None after adding custom chords')
 
-        chd = mp.C(chord_name, pitch=pitch) @ pattern % (interval, interval) # setting interval and duration to be equal, but both ARE NOT THE SAME THING! 
-        chd = self._apply_legato(chd, interval)
+        chd = get_template(chord_name, pitch=pitch).to_chord() @ pattern % (interval, interval) # setting interval and duration to be equal, but both ARE NOT THE SAME THING! 
+        chd = apply_legato(chd)
 
         self.chords.append(chd)
         if self.verbose > 0:
@@ -134,17 +155,22 @@ class PopGenerator:
         Choose chord progression where int represents the sequence. Example 1234 >> I ii III IV
         """
         if progression in [None]:
-            chord_progression = random.choice(mp.database.choose_chord_progressions_list)
+            chord_progression = self.rng.choice(mp.database.choose_chord_progressions_list)
         else:
             chord_progression = progression
 
         # # will create a sequence of chords at constant intervals
-        self.chords = self.scale % (
-            chord_progression,  # progression: 12346451
-            self.chord_duration, # 1
-            0, # interval: 0
-            random.choice(self.chord_notes_num) # 4 notes per chord
-        )
+        n_notes = self.rng.choice(self.chord_notes_num) # 4 notes per chord
+        try:
+            # diatonic chords of the scale are built once per process, only copied here
+            self.chords = scale_table(self.scale, n_notes).chords(chord_progression, self.chord_duration, 0)
+        except ValueError: # scale without a mode, or degrees past 8
+            self.chords = self.scale % (
+                chord_progression,  # progression: 12346451
+                self.chord_duration, # 1
+                0, # interval: 0
+                n_notes,
+            )
         self.chord_progressions = chord_progression
         
         print(f"Chord progression: {self.chord_progressions}")
@@ -194,7 +220,7 @@ class PopGenerator:
         param: probability: int
             Probability of reversing a chord for each chord in list. Default is 100.
         """
-        self.chords = [chord.reverse() if random.randint(0, 100) < probability else chord for chord in self.chords]
+        self.chords = [chord.reverse() if self.rng.randint(0, 100) < probability else chord for chord in self.chords]
         print(f"Chords reversed")
 
     
@@ -213,7 +239,7 @@ class PopGenerator:
         Applies inversion to all chords in the list.
         """
         if inversion is not None:
-            self.chords = [i ^ inversion if random.randint(0, 100) < probability else i for i in self.chords]
+            self.chords = [i ^ inversion if self.rng.randint(0, 100) < probability else i for i in self.chords]
             self.inversion_highest_num = inversion
         print(f"Chord inversion: {self.inversion_highest_num}")
 
@@ -225,30 +251,31 @@ class PopGenerator:
         Generates the arp pattern based on chords and rhythm.
         Melody and bass must be generated simulatenously with the chords.
         """
-        from copy import deepcopy
-
         length_count = 0
         chord_index = 0
-        chords_part = mp.chord([])
-        melody_part = mp.chord([])
-        bass_part = mp.chord([])
-        melody_octave = self.melody_octave
+        chords_part = TrackBuilder()
+        bass_part = TrackBuilder()
+        melody_names = [] # every melody note is in melody_octave and lasts its interval
+        melody_durations = []
+        melody_length = 0 # running melody_part.bars(mode=0)
 
         # fill length with chords
         while length_count < self.length:
-            current_chord = self.chords[chord_index]
+            span = self._span(chord_index)
 
             if self.verbose > 0:
                 print(f"Current scale index: {chord_index}")
-                print(f"Current chord: {current_chord}")
+                print(f"Current chord: {self.chords[chord_index]}")
 
-            current_chord_interval = random.choice(self.selected_chord_intervals)
+            current_chord_interval = self.rng.choice(self.selected_chord_intervals)
             if isinstance(current_chord_interval, mp.beat):
                 current_chord_interval = current_chord_interval.get_duration()
             
-            current_chord = current_chord.set(interval=current_chord_interval)
-            chords_part += current_chord
-            length_count = chords_part.bars(mode=0)
+            chords_part.append_arrays(
+                span.names, span.nums, span.durations, [current_chord_interval] * len(span.names),
+                volumes=span.volumes, channels=span.channels, start_time=span.start_time,
+            )
+            length_count = chords_part.bars()
 
             # generate bass part 
             progression_index = str(self.chord_progressions)[chord_index]
@@ -259,41 +286,43 @@ class PopGenerator:
             if self.bass_rhythms is None:
                 current_bass_part = mp.chord([current_chord_tonic]) % (length_count, length_count)
             else:
-                current_bass_part = mp.get_chords_from_rhythm(
+                current_bass_part = tile_rhythm(
                     mp.chord([current_chord_tonic]),
-                    mp.rhythm(self.bass_rhythms[0], 1),
+                    compile_rhythm(self.bass_rhythms[0], 1),
                 )
                 if len(current_bass_part) > 1:
                     for i in range(len(current_bass_part)):
                         if i % 2 != 0:
                             current_bass_part[i] += 12
-            bass_part += current_bass_part
+            bass_part.append(current_bass_part)
 
             # generate melody concurrently with chords
-            while melody_part.bars(mode=0) < chords_part.bars(mode=0):
-                passing_note = random.randint(0, 100)
+            while melody_length < length_count:
+                passing_note = self.rng.randint(0, 100)
 
                 # 30% chance of using a non-chord note
                 if passing_note < non_chord_prob:
-                    non_chord_notes = [note for note in self.scale.notes if note not in current_chord.notes]
-                    current_melody = random.choice(non_chord_notes) # get a random note from the scale
+                    current_melody = self.rng.choice(span.non_chord_names or span.names) # get a random note from the scale
                 else:
-                    current_melody = random.choice(current_chord.notes) # get a random note from the chords
+                    current_melody = self.rng.choice(span.names) # get a random note from the chords
 
-                current_chord_duration = random.choice(self.melody_durations)
+                current_chord_duration = self.rng.choice(self.melody_durations)
                 if isinstance(current_chord_duration, mp.beat):
                     current_chord_duration = current_chord_duration.get_duration()
-                current_melody.duration = current_chord_duration
 
-                current_melody.num = melody_octave
-                melody_part.notes.append(current_melody)
-                melody_part.interval.append( deepcopy(current_melody.duration) )
+                melody_names.append(current_melody)
+                melody_durations.append(current_chord_duration)
+                melody_length += current_chord_duration
         
             # keep moving up the chord progression
             chord_index += 1
             if chord_index >= len(self.chords):
                 chord_index = 0
 
+        chords_part = chords_part.to_chord()
+        bass_part = bass_part.to_chord()
+        melody_part = self._melody_chord(melody_names, melody_durations)
+
         chords_part.set_volume(70)
         bass_part.set_volume(60)
 
@@ -312,26 +341,64 @@ class PopGenerator:
         return piece
     
 
+    def _span(self, index:int):
+        """
+        ChordSpan of self.chords[index]. Built once per chord and scale, rebuilt if either was replaced (eg: by apply_inversion()).
+        """
+        chord = self.chords[index]
+        cached = self._spans.get(index)
+        if cached is not None and cached[0] is chord and cached[1] is self.scale:
+            return cached[2]
+
+        notes = chord.notes
+        pitch_classes = {n.degree % 12 for n in notes}
+        scale_notes = self.scale.notes if self.scale else []
+        span = ChordSpan(
+            names=tuple(n.name for n in notes),
+            nums=tuple(n.num for n in notes),
+            durations=tuple(n.duration for n in notes),
+            volumes=tuple(n.volume for n in notes),
+            channels=tuple(n.channel for n in notes),
+            intervals=tuple(chord.interval),
+            start_time=chord.start_time,
+            non_chord_names=tuple(n.name for n in scale_notes if n.degree % 12 not in pitch_classes),
+            length=chord.bars(mode=0),
+            end=chord.bars(mode=1),
+        )
+        self._spans[index] = (chord, self.scale, span)
+        return span
+
+
+    def _melody_chord(self, names:list, durations:list):
+        """New mp.chord of melody notes in melody_octave, each note lasting its interval."""
+        builder = TrackBuilder().append_arrays(names, [self.melody_octave] * len(names), durations, durations)
+        return builder.to_chord()
+
+
     def generate_chord(self):
         """
-        Generates a chord for the current chord progression.
+        Generates a chord for the current chord progression. New note objects, self.chords is never modified.
         """
-        current_chord = deepcopy(self.chords[self.chord_index]) 
-        if self.chord_progressions == None:
-            return current_chord 
-        
-        current_chord_interval = random.choice(self.selected_chord_intervals)
-        if current_chord_interval != 0:
-            current_chord = current_chord.set(interval=current_chord_interval)
-        return current_chord 
+        span = self._span(self.chord_index)
+        intervals = span.intervals
+        if self.chord_progressions != None:
+            current_chord_interval = self.rng.choice(self.selected_chord_intervals)
+            if current_chord_interval != 0:
+                intervals = [current_chord_interval] * len(span.names)
+
+        builder = TrackBuilder().append_arrays(
+            list(span.names), list(span.nums), list(span.durations), list(intervals),
+            volumes=list(span.volumes), channels=list(span.channels), start_time=span.start_time,
+        )
+        return builder.to_chord()
     
     
     def generate_bass(self):
         """
         Generates a bass line for the current chord progression.
         """
-        current_chord = deepcopy(self.chords[self.chord_index])
-        chord_duration = current_chord.bars(mode=0) # sum of intervals
+        span = self._span(self.chord_index)
+        chord_duration = span.length # sum of intervals
 
         if self.chord_progressions != None:
             # Use the root note of the scale based on the chord progression
@@ -340,122 +407,132 @@ class PopGenerator:
                 self.scale[ int(progression_index)- 1].name, 
                 self.bass_octave
             )
-            chord_duration = current_chord.bars(mode=1) # FK the bars() method. WTF IS MODE 1 AND 0 and why do they always cause bugs?! 
+            chord_duration = span.end # FK the bars() method. WTF IS MODE 1 AND 0 and why do they always cause bugs?! 
         else:
             # Use the root note of the custom chord. Naively assume the first note must be the root
-            current_chord_tonic = current_chord.notes[0]
-            current_chord_tonic.num = self.bass_octave    
+            current_chord_tonic = mp.note(span.names[0], self.bass_octave, volume=span.volumes[0], channel=span.channels[0])
 
         # Calculate the number of notes needed based on the chord duration
         bass_rhythm = self.bass_rhythms[0] # 'b b b b'
-        br_list = bass_rhythm.split() # ['b', 'b', 'b', 'b']
         note_count = int(chord_duration / (1/8))
 
-        # Truncate or extend the rhythm string if chord duration is less/more than rhythm string (1 by default)
-        if chord_duration < len(br_list) * (1/8):
-            adjusted_rhythm = ' '.join(br_list[:note_count])
-        else:
-            multiplier = note_count // len(br_list)
-            remainder = note_count % len(br_list)
-            adjusted_rhythm = (' '.join(br_list) + ' ') * multiplier + ' '.join(br_list[:remainder])
+        # Truncate or cycle the rhythm if chord duration is less/more than rhythm string (1 by default). Compiled once per length
+        rhythm = compile_rhythm(bass_rhythm, chord_duration, steps=note_count)
 
         # apply rhythm to root
-        current_bass_part = mp.get_chords_from_rhythm(
-            mp.chord([current_chord_tonic]),
-            mp.rhythm(adjusted_rhythm, chord_duration)
-        )
+        current_bass_part = tile_rhythm(mp.chord([current_chord_tonic]), rhythm)
         return current_bass_part 
     
 
     def harmonize_melody(self, melody:mp.note, chord:mp.chord, num_notes:int=1):
         """
+        Stacks the melody note with random chord notes of other pitch classes, all lasting melody.duration.
+        Harmony notes are new objects, the chord is not modified.
         """
         if num_notes < 1 or num_notes > 3:
             raise ValueError('Number of notes must be between 1 and 3') 
         
-        harmonized = mp.chord([])
-        harmony = [melody] # mp.chord obj
-        available_notes = [n for n in chord.notes if n not in harmony]
+        available_notes = [n for n in chord.notes if n.degree % 12 != melody.degree % 12]
         extra_notes = min(num_notes, len(available_notes))
-        harmony += random.sample(available_notes, extra_notes)
+        harmony = [melody] + [
+            mp.note(n.name, n.num, duration=melody.duration, volume=n.volume, channel=n.channel)
+            for n in self.rng.sample(available_notes, extra_notes)
+        ]
         harmony.sort()
 
-        # set interval to 0 to stack chords. set duration to 0 for now
-        for i, note in enumerate(harmony):
-            note.interval = 0
-            note.duration = 0
-
-        # stack chords
-        for note in harmony:
-            harmonized &= mp.chord([note])
+        # interval 0 to stack the notes
+        harmonized = mp.chord([])
+        harmonized.notes = harmony
+        harmonized.interval = [0] * len(harmony)
         return harmonized
     
 
+    def _melody_sampler(self):
+        """MelodySampler of self.melody_durations, rebuilt only if the list is replaced."""
+        if self._sampler is None or self._sampler[0] is not self.melody_durations:
+            self._sampler = (self.melody_durations, MelodySampler(self.melody_durations))
+        return self._sampler[1]
+
+
+    def _model_melody(self, root:str, length:float):
+        """
+        Notes from self.melody_model over `length`, continuing self.melody_context. Pitch classes are taken above
+        the chord root (naively the first note) and spelled like the scale where possible.
+        """
+        pitches, durations, self.melody_context = self.melody_model.sample(length, self.np_rng, self.melody_context)
+
+        spelling = {n.degree % 12: n.name for n in self.scale.notes} if self.scale else {}
+        root_degree = mp.note(root, 4).degree
+        names = []
+        for pitch in pitches:
+            pitch_class = (root_degree + pitch) % 12
+            names.append(spelling.get(pitch_class, mp.database.standard_reverse[pitch_class]))
+        return names, durations
+
+
     def generate_melody(self, probability:float=30, harmonize:bool=False, num_harmony_notes:int=1):
         """ 
+        Melody for the current chord, sampled in one go with self.np_rng. By MelodySampler, or by self.melody_model if set,
+        in which case probability is not used.
+
         BUG: When exporting to MIDI, possible to have overlapping notes. From FL piano roll, select overlapping notes and delete them.
         """
         # BRUH THE FKING RHYTHM IS CAUSING SO MUCH BUGS
         # bar mode 1 if chord progression is set, bar mode 0 if not
+        span = self._span(self.chord_index)
         if self.chord_progressions != None:
-            mode = 1
+            chord_duration = span.end
+            chord_names, non_chord_names = span.names, span.non_chord_names
         else:
-            mode = 0
-
-        melody_for_chord = mp.chord([])
-        current_chord = deepcopy(self.chords[self.chord_index])
-        chord_duration = current_chord.bars(mode=mode)
-        remainder = chord_duration
-
-        # fill chord with random notes in chord notes and scale notes
-        while melody_for_chord.bars(mode=mode) < chord_duration:
-            passing_note = random.randint(0, 100)
-
-            if self.chord_progressions == None:
-                try:
-                    weighted_options = current_chord.notes + self.scale.notes
-                    current_melody = random.choice(weighted_options)
-                except Exception as e:
-                    current_melody = random.choice(current_chord.notes)
-
-            elif passing_note < probability:
-                non_chord_notes = [note for note in self.scale.notes if note not in current_chord]
-                current_melody = random.choice(non_chord_notes) # get a random note from the scale
-            else:
-                current_melody = random.choice(current_chord.notes) # get a random note from the chords
-
-            # set duration for the melody note
-            current_melody_duration = random.choice(self.melody_durations)
-            if isinstance(current_melody_duration, mp.beat):
-                current_melody_duration = current_melody_duration.get_duration()
-            elif isinstance(current_melody_duration, str): # from app, rest(0.1875)
-                float_value = float(re.search(r'\d+\.\d+', current_melody_duration).group()) # remove 'rest(' and ')' from string
-                current_melody_duration = float_value
-
-            current_melody_duration = min(current_melody_duration, remainder)
-            remainder -= current_melody_duration
-            current_melody.duration = current_melody_duration
-            current_melody.num = self.melody_octave
-            
-            if harmonize:
-                current_melody = self.harmonize_melody(current_melody, current_chord, num_harmony_notes)
-                for note in current_melody.notes:
-                    note.duration = current_melody_duration
-                melody_for_chord += current_melody
-            else:
-                melody_for_chord.notes.append(current_melody)
-                melody_for_chord.interval.append( deepcopy(current_melody.duration) )
+            # custom chords: chord notes and scale notes, all equally likely
+            chord_duration = span.length
+            chord_names = span.names + tuple(n.name for n in self.scale.notes) if self.scale else span.names
+            non_chord_names = ()
+
+        if self.melody_model is not None:
+            melody_names, melody_durations = self._model_melody(span.names[0], chord_duration)
+        else:
+            melody_names, melody_durations = self._melody_sampler().sample(
+                chord_names, non_chord_names, length=chord_duration, probability=probability, rng=self.np_rng,
+            )
 
+        if not harmonize:
+            return self._melody_chord(melody_names, melody_durations)
 
-        return melody_for_chord    
+        harmony_part = TrackBuilder() # harmonized notes are whole chords, added with += rules
+        for name, duration in zip(melody_names, melody_durations):
+            melody_note = mp.note(name, self.melody_octave, duration=duration)
+            harmony_part.append(self.harmonize_melody(melody_note, self.chords[self.chord_index], num_harmony_notes))
+        return harmony_part.to_chord()
 
 
     def generate_all(self, generate_bass=True, generate_melody=True, generate_chords=True):
         """ 
         Simulataneously generate all parts by cycling chord progressions. 
+
+        With self.cache set, the parts are looked up by (parameters, random state) first and stored as NoteTables after generating.
+        A hit also moves both random states to where the generation left them, so the next call continues the same sequence.
         """
+        key = None
+        if self.cache is not None:
+            key = self._generation_key(generate_bass, generate_melody, generate_chords)
+            if key in self.cache:
+                cached = self.cache[key]
+                self.chords_part, self.bass_part, self.melody_part = from_tables(cached['tables'])
+                self.rng.setstate(cached['rng_state'])
+                self.np_rng.bit_generator.state = cached['np_rng_state']
+                if self.verbose > 0:
+                    print(f"Loaded cached generation {key[:8]}")
+                return self.build_piece()
+
         length_count = 0
         self.chord_index = 0
+        self.melody_context = None
+
+        # continue from any existing parts, materialized once at the end
+        chords_builder = TrackBuilder(self.chords_part)
+        bass_builder = TrackBuilder(self.bass_part)
+        melody_builder = TrackBuilder(self.melody_part)
 
         while length_count < self.length:
             if self.verbose > 0:
@@ -466,18 +543,51 @@ class PopGenerator:
             length_count += chd.bars(mode=0)
 
             if generate_chords == True:
-                self.chords_part += chd
+                chords_builder.append(chd)
             if generate_bass == True:
                 bass = self.generate_bass()
-                self.bass_part += bass
+                bass_builder.append(bass)
             if generate_melody == True:
                 melody = self.generate_melody(probability=self.variance, harmonize=self.harmonize, num_harmony_notes=self.num_harmony_notes)
-                self.melody_part += melody
+                melody_builder.append(melody)
 
             self.chord_index += 1
             if self.chord_index >= len(self.chords):
                 self.chord_index = 0
 
+        self.chords_part = chords_builder.to_chord()
+        self.bass_part = bass_builder.to_chord()
+        self.melody_part = melody_builder.to_chord()
+
+        if key is not None:
+            self.cache[key] = {
+                'tables': to_tables([self.chords_part, self.bass_part, self.melody_part]),
+                'rng_state': self.rng.getstate(),
+                'np_rng_state': self.np_rng.bit_generator.state,
+            }
+        return self.build_piece()
+
+
+    def _generation_key(self, *flags):
+        """Everything generate_all() reads, plus the random state. See generation_key()."""
+        params = (
+            [(n.name, n.num) for n in self.scale.notes] if self.scale else None,
+            self.length, self.chord_progressions, self.chord_duration, self.selected_chord_intervals,
+            self.melody_durations, self.melody_octave, self.bass_octave, self.bass_rhythms,
+            self.harmonize, self.num_harmony_notes, self.variance,
+            [chord_signature(chd) for chd in self.chords],
+            [chord_signature(part) for part in (self.chords_part, self.bass_part, self.melody_part)],
+            flags,
+            self.melody_model.signature() if self.melody_model is not None else None,
+            self.np_rng.bit_generator.state,
+        )
+        return generation_key(params, self.rng)
+
+
+    def build_piece(self):
+        """
+        mp.piece of the generated parts: melody, chords and bass on channels 0-2.
+        """
         t1 = mp.track(self.melody_part, instrument=self.melody_instrument, channel=0, start_time=0, volume=mp.volume(80))
         t2 = mp.track(self.chords_part, instrument=self.chord_instrument, channel=1, start_time=0, volume=mp.volume(60))
         t3 = mp.track(self.bass_part, instrument=38, channel=2, start_time=0, volume=mp.volume(60))
@@ -1,9 +1,297 @@
 import random
+import itertools
+import numpy as np
 import musicpy as mp
-from operators.chord import join_chords
+from functools import lru_cache
 
+from utils.operators.chord import join_chords
+from utils.operators.templates import get_template, diatonic_table, scale_table, progression_indices
+from utils.operators.reconstruct import pattern_rows, entry_notes, entry_degrees
+from utils.operators.track_builder import NoteTable
+from utils.generators.generation_cache import make_rng
 
 
+# chord type suffixes tried first when naming a chord shape, the rest come from musicpy's chord database
+PREFERRED_SUFFIXES = ['', 'm', 'dim', 'aug', 'maj7', 'm7', '7', 'm7b5', 'dim7', 'mM7', 'maj9', 'm9', '9', 'm11', '11', 'maj13', 'm13', '13']
+
+
+
+#-----------
+# chord names
+#-----------
+@lru_cache(maxsize=1)
+def _chord_suffixes():
+    """
+    Semitone shape of a root position chord >> chord type suffix, for every type mp.C() can parse. Built once.
+    EG: (0, 3, 7, 10) >> 'm7'
+    """
+    candidates = list(PREFERRED_SUFFIXES)
+    for aliases in mp.database.chordTypes.dic:
+        # plain names, shortest first. EG: 'm7b5' over 'ø7'
+        candidates += sorted((a for a in aliases if a.isascii() and a[:1].isalnum()), key=len)
+
+    suffixes = {}
+    for suffix in candidates:
+        try:
+            template = get_template('C' + suffix)
+        except Exception:
+            continue
+        if not template.fixed:
+            suffixes.setdefault(tuple(template.intervals.tolist()), suffix)
+    return suffixes
+
+
+@lru_cache(maxsize=4096)
+def shape_name(names:tuple, nums:tuple, degrees:tuple):
+    """
+    Name of a root position chord from its notes, without chord detection. Root + chord type if the shape is a
+    chord type musicpy knows, else the literal notes, which get_template() keeps as they are.
+
+    Returns:
+        (chord name, pitch), so get_template(name, pitch) has the same degrees
+
+    Example:
+        shape_name(('B', 'D', 'F', 'A'), (3, 4, 4, 4), (59, 62, 65, 69)) >> ('Bm7b5', 3)
+        shape_name(('B', 'D', 'F', 'A', 'C'), (3, 4, 4, 4, 5), (59, 62, 65, 69, 72)) >> ('B3, D4, F4, A4, C5', 3)
+    """
+    suffix = _chord_suffixes().get(tuple(d - degrees[0] for d in degrees))
+    if suffix is not None:
+        name = names[0] + suffix
+        try:
+            if get_template(name, nums[0]).degrees.tolist() == list(degrees): # EG: 'B' + 'b5' would read as Bb
+                return name, nums[0]
+        except Exception:
+            pass
+    return ', '.join(f'{name}{num}' for name, num in zip(names, nums)), nums[0]
+
+
+@lru_cache(maxsize=4096)
+def _detect(notes:tuple):
+    return mp.alg.detect(mp.chord(list(notes))).split(' ')[0]
+
+
+def chord_name(chord:mp.chord):
+    """
+    mp.alg.detect() name of a chord, eg 'Cmaj7'. Detected once per distinct set of notes.
+    """
+    return _detect(tuple(str(n) for n in chord.notes))
+
+
+
+#-----------
+# per scale rows, shared by every progression
+#-----------
+def _pattern_value(index:int, octaves:int):
+    """Note `index` of a chord moved by `octaves`, as a pattern value. EG: (0, 0) >> 1, (2, 1) >> 3.1, (0, -1) >> -1.1"""
+    if octaves == 0:
+        return index + 1
+    if octaves > 0:
+        return float(f'{index + 1}.{octaves}')
+    return float(f'-{index + 1}.{-octaves}')
+
+
+@lru_cache(maxsize=1024)
+def _row_entries(table, root_table, pattern:tuple):
+    """
+    Chord json (name, pitch, pattern) of every degree of a table, played with `pattern`, or all notes in order if empty.
+    Chords are named after the root position chord of the degree (root_table), the inversion and omissions
+    go into the pattern, so reconstruct_chord_json() gives back the same notes.
+    """
+    entries = []
+    for voiced, root in zip(table.templates, root_table.templates):
+        offsets = voiced.degrees[:, None] - root.degrees[None, :]
+        index = (offsets % 12 == 0).argmax(axis=1) # note of the root position chord each voiced note comes from
+        octaves = offsets[np.arange(len(voiced)), index] // 12
+        if pattern:
+            rows, shifts = pattern_rows(list(pattern), len(voiced), voiced.name)
+            index, octaves = index[rows], octaves[rows] + shifts // 12
+
+        name, pitch = shape_name(root.names, root.nums, tuple(root.degrees.tolist()))
+        entries.append((name, pitch, tuple(_pattern_value(i, o) for i, o in zip(index.tolist(), octaves.tolist()))))
+    return tuple(entries)
+
+
+@lru_cache(maxsize=1024)
+def _row_columns(table, root_table, pattern:tuple, duration:float, interval:float):
+    """
+    Note columns of every degree of a table, (names, nums, degrees, durations, intervals) arrays of shape (8, notes per chord).
+    Without a pattern the notes are the table chords as they are (same spelling as scale %), with one they are
+    read back from _row_entries() like a chord json.
+
+    interval: float
+        Time between notes. None for block chords, notes start together and the next chord starts after `duration`.
+
+    Returns:
+        tuple of 8 rows, and the same columns stacked as 2d arrays (None if chords have different sizes)
+    """
+    rows = []
+    for template, (name, pitch, entry_pattern) in zip(table.templates, _row_entries(table, root_table, pattern)):
+        if pattern:
+            entry = {'chord': name, 'pitch': pitch, 'pattern': list(entry_pattern), 'intervals': list(entry_pattern)}
+            names, nums, _ = entry_notes(entry)
+            degrees, _, _ = entry_degrees(entry)
+        else:
+            names, nums, degrees = template.names, template.nums, template.degrees
+
+        size = len(names)
+        if interval is None:
+            durations = np.full(size, duration, dtype=float)
+            intervals = np.zeros(size)
+            intervals[-1] = duration
+        else:
+            durations = np.full(size, interval, dtype=float)
+            intervals = np.full(size, interval, dtype=float)
+        rows.append((np.array(names, dtype=object), np.array(nums, dtype=np.int64), np.array(degrees, dtype=np.int64), durations, intervals))
+
+    stacked = None
+    if len({len(row[0]) for row in rows}) == 1:
+        stacked = tuple(np.stack(column) for column in zip(*rows))
+    return tuple(rows), stacked
+
+
+
+#-----------
+# batch generation
+#-----------
+def random_progressions(k:int, seed=None):
+    """
+    k progressions drawn from musicpy's progression list. EG: random_progressions(3, seed=42) >> ['6415', '3456', '6451']
+    """
+    rng = make_rng(seed)
+    return [rng.choice(mp.database.choose_chord_progressions_list) for _ in range(k)]
+
+
+def _tables(scale, n_notes:int, inversion:int, omit:list):
+    """Voiced table of a scale and the root position table its chords are named after."""
+    table = scale_table(scale, n_notes, inversion, tuple(omit))
+    return table, diatonic_table(table.key, table.mode, table.pitch, n_notes)
+
+
+def _batch(scale, progressions:list, n_notes:int, omit:list, inversion:int, pattern:list, duration:float, interval:float, as_json:bool, volume:int):
+    """
+    Shared by generate_chord_batch() and generate_arp_batch(). Each progression is a gather of the per degree rows,
+    with one fancy index for all progressions when every chord has the same number of notes.
+    """
+    table, root_table = _tables(scale, n_notes, inversion, omit)
+    indices = [progression_indices(progression) for progression in progressions]
+
+    if as_json:
+        entries = _row_entries(table, root_table, tuple(pattern))
+        rows, _ = _row_columns(table, root_table, tuple(pattern), duration, interval)
+        return [
+            [
+                {'chord': entries[i][0], 'intervals': rows[i][4].tolist(), 'pattern': list(entries[i][2]), 'pitch': entries[i][1]}
+                for i in chord_indices
+            ]
+            for chord_indices in indices
+        ]
+
+    rows, stacked = _row_columns(table, root_table, tuple(pattern), duration, interval)
+    if stacked is not None:
+        flat = np.fromiter(itertools.chain.from_iterable(indices), dtype=np.int64)
+        columns = [column[flat] for column in stacked] # (chords of all progressions, notes per chord)
+        bounds = np.cumsum([0] + [len(chord_indices) for chord_indices in indices]).tolist()
+        progression_columns = [[column[start:stop].ravel() for column in columns] for start, stop in zip(bounds[:-1], bounds[1:])]
+    else:
+        progression_columns = [
+            [np.concatenate([rows[i][c] for i in chord_indices]) if chord_indices else np.array([]) for c in range(5)]
+            for chord_indices in indices
+        ]
+
+    tables = []
+    for names, nums, degrees, durations, intervals in progression_columns:
+        tables.append(NoteTable(
+            names=names,
+            nums=nums,
+            degrees=degrees,
+            durations=durations,
+            volumes=np.full(len(names), volume),
+            channels=np.full(len(names), None, dtype=object),
+            intervals=intervals,
+            onsets=np.concatenate(([0.0], np.cumsum(intervals[:-1]))) if len(intervals) else np.array([]),
+            start_time=0,
+        ))
+    return tables
+
+
+def generate_chord_batch(
+    scale,
+    progressions:list,
+    n_notes:int=4,
+    duration:float=1,
+    omit:list=[],
+    inversion:int=None,
+    as_json:bool=False,
+    volume:int=100,
+):
+    """
+    Block chords of many progressions in one call. The diatonic chords of the scale are built once per process
+    (see diatonic_table()), every progression is then an array gather, no chord objects or chord detection.
+
+    progressions: list of int or str
+        EG: [6451, '1564', 14561451], or random_progressions(100)
+
+    duration: float
+        Length of every chord. EG: 1 for a bar
+
+    as_json: bool
+        Chord json per progression instead, same format as jsons/ (see reconstruct_chord_json())
+
+    Returns:
+        list of NoteTable, one per progression (TrackBuilder.from_table(t).to_chord() for a mp.chord)
+
+    Example:
+        tables = generate_chord_batch(mp.scale('C', 'major'), [6451, 1564], n_notes=3)
+        tables[0].degrees >> array([69, 72, 76, 65, 69, 72, 67, 71, 74, 60, 64, 67])
+        generate_chord_batch(mp.scale('C', 'major'), [6451], as_json=True)[0][0]
+        >> {'chord': 'Am7', 'intervals': [0.0, 0.0, 0.0, 1.0], 'pattern': [1, 2, 3, 4], 'pitch': 4}
+    """
+    return _batch(scale, progressions, n_notes, omit, inversion, [], duration, None, as_json, volume)
+
+
+def generate_arp_batch(
+    scale,
+    progressions:list,
+    n_notes:int=4,
+    interval:float=1/8,
+    omit:list=[],
+    inversion:int=None,
+    pattern:list=[],
+    as_json:bool=False,
+    volume:int=100,
+):
+    """
+    Arpeggios of many progressions in one call, same notes as generate_arp_from_scale() for each progression.
+    The pattern is resolved once per scale degree, every progression is then an array gather.
+
+    pattern: list of int
+        Arpeggio pattern over the (inverted, omitted) chord. EG: [1, 2, 3, 1.1]. Empty plays the chord notes in order.
+
+    Returns:
+        list of NoteTable, or of chord json lists with as_json
+
+    Example:
+        generate_arp_batch(mp.scale('A', 'minor'), random_progressions(100, seed=1), n_notes=3, pattern=[1, 2, 3, 2])
+    """
+    return _batch(scale, progressions, n_notes, omit, inversion, pattern, None, interval, as_json, volume)
+
+
+
+#-----------
+# single progressions
+#-----------
+def _scale_chords(scale, progression, n_notes:int, duration:float, interval:float, omit:list, inversion:int):
+    """Chords of a progression from the scale's diatonic table, scale % (...) for scales without a mode."""
+    try:
+        return scale_table(scale, n_notes, inversion, tuple(omit)).chords(progression, duration, interval)
+    except ValueError: # scale without a mode, or degrees past 8
+        chords = scale % (progression, duration, interval, n_notes)
+        for o in omit:
+            chords = [chord.omit(o) for chord in chords]
+        if inversion:
+            chords = [chord.inversion_highest(inversion) for chord in chords]
+        return chords
+
 
 def chords_to_dict_list(chords:list=[]):
     """ 
@@ -19,8 +307,8 @@ def chords_to_dict_list(chords:list=[]):
     """
     dict_list = []
     for chd in chords:
-        inferred_chord = mp.alg.detect(chd).split(' ')[0]
-        n_notes = len(mp.C(inferred_chord).notes)
+        inferred_chord = chord_name(chd)
+        n_notes = len(get_template(inferred_chord))
 
         # Create a pattern by cycling through 1 to n_notes
         pattern = []
@@ -48,34 +336,31 @@ def generate_chord_from_scale(
     omit:list=[],
     inversion:int=None,
     return_as_chord:bool=False,
+    duration:float=1/4,
 ):
     """
     Generates chords based on the given scale and chord progression.
 
     :param scale: The scale object (e.g., mp.scale)
     :param progression: Chord progression positions (e.g., 6451)
-    :param rhythm_duration: Duration of each chord
-    :return: List of chords
+    :param duration: Duration of each chord, before the rhythm is applied
+    :return: List of chord dicts, or one mp.chord with return_as_chord
     """
-    chords = scale % (progression, n_notes)  # Default to 4 notes per chord
-
-    # Apply omission if specified
-    if omit != []:
-        for o in omit:
-            chords = [chord.omit(o) for chord in chords]
-
-    # Apply inversion if specified
-    if inversion:
-        chords = [chord.inversion_highest(inversion) for chord in chords]
+    chords = _scale_chords(scale, progression, n_notes, duration, 0, omit, inversion)
 
     if rhythm:
         chords = [chd.from_rhythm(rhythm) for chd in chords]
 
     if return_as_chord:
         return join_chords(chords)
-    
-    dict_list = chords_to_dict_list(chords)
-    return dict_list
+
+    if rhythm:
+        return chords_to_dict_list(chords)
+
+    try:
+        return generate_arp_batch(scale, [progression], n_notes, 0, omit, inversion, as_json=True)[0]
+    except ValueError: # scale without a mode
+        return chords_to_dict_list(chords)
 
 
 
@@ -125,6 +410,8 @@ def generate_arp_from_scale(
 ):
     """
     Generates an arpeggio based on the given scale, chord progression, and transformations.
+    Chord dicts are named from the scale's diatonic table, with the inversion and omissions in their pattern,
+    so reconstruct_chord_json() plays the same notes. See generate_arp_batch() for many progressions at once.
 
     scale: The scale object (e.g., mp.scale)
     
@@ -147,16 +434,13 @@ def generate_arp_from_scale(
         Arpeggio pattern. EG: [1,2,3,1.1] for a simple arpeggio
 
     """
-    chords = scale % (progression, interval, interval, n_notes)
+    if not return_as_chord:
+        try:
+            return generate_arp_batch(scale, [progression], n_notes, interval, omit, inversion, pattern, as_json=True)[0]
+        except ValueError: # scale without a mode
+            pass
 
-    # Apply omission if specified
-    if omit != []:
-        for o in omit:
-            chords = [chord.omit(o) for chord in chords]
-
-    # Apply inversion if specified
-    if inversion:
-        chords = [chord.inversion_highest(inversion) for chord in chords]
+    chords = _scale_chords(scale, progression, n_notes, interval, interval, omit, inversion)
 
     if pattern == []:
         if return_as_chord:
@@ -169,10 +453,9 @@ def generate_arp_from_scale(
     new_chords = []
     for chd in chords:
         new_chords.append(chd @ pattern % (interval, interval))
-        cname = mp.alg.detect(chd).split(' ')[0] # eg: 'Cmaj7'
         chord_dict = {
-            'chord': cname,
-            'intervals': [interval] * len(chd.notes),
+            'chord': chord_name(chd), # eg: 'Cmaj7'
+            'intervals': [interval] * len(pattern),
             'pattern': pattern,
             'pitch': chd.notes[0].num,
         }
@@ -228,9 +511,8 @@ def generate_arp_from_chords(
         chds.append(chd)
 
         # add to dict_list
-        cname = mp.alg.detect(chd).split(' ')[0] # eg: 'Cmaj7'
         chord_dict = {
-            'chord': cname,
+            'chord': chord_name(chd), # eg: 'Cmaj7'
             'intervals': [interval] * len(chd.notes),
             'pattern': pattern,
             'pitch': chd.notes[0].num,
@@ -240,17 +522,3 @@ def generate_arp_from_chords(
     if return_as_chord == False:
         return dict_list
     return join_chords(chds)
-
-
-
-
-
-
-
-
-
-
-
-
-
-
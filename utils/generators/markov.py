@@ -0,0 +1,305 @@
+import os
+import sys
+import math
+import json
+import hashlib
+import numpy as np
+import musicpy as mp
+from functools import lru_cache
+
+from utils.operators.reconstruct import entry_degrees
+from utils.parsers.chord_parser import ChordParser
+from utils.parsers.drums import is_drum_json
+
+
+PITCH_CLASSES = 12 # melody pitch relative to the chord root, 0 is the root
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # repo root, same from any working directory
+CORPUS_DIR = os.path.join(ROOT_DIR, 'jsons')
+DEFAULT_MODEL_PATH = os.path.join(ROOT_DIR, 'assets', 'melody_model.npz')
+
+
+
+def melody_line(entries:list, duration_step:float=1/16, max_steps:int=16):
+    """
+    Top note per onset of a chord json, as tokens for MelodyModel. Entries that cannot be built are skipped.
+        pitch: semitones above the root of the entry chord, mod 12
+        steps: time to the next onset in duration_step units, clipped to 1-max_steps
+
+    Returns:
+        (pitches, steps), np.arrays of int
+
+    Example:
+        melody_line([{'chord': 'Am', 'intervals': [0, 0.25, 0.25], 'pattern': [1, 3, 1.1], 'pitch': 2}])
+        >> (array([7, 0]), array([4, 4]))
+    """
+    pitches = []
+    lengths = []
+    for entry in entries:
+        try:
+            degrees, intervals, root = entry_degrees(entry)
+        except Exception:
+            continue
+
+        # notes with a 0 interval start together with the next one, keep the highest of each stack
+        top = None
+        length = 0
+        for degree, interval in zip(degrees.tolist(), intervals):
+            top = degree if top is None else max(top, degree)
+            length += interval
+            if interval > 0:
+                pitches.append((top - root) % PITCH_CLASSES)
+                lengths.append(length)
+                top = None
+                length = 0
+        if top is not None:
+            pitches.append((top - root) % PITCH_CLASSES)
+            lengths.append(length)
+
+    steps = np.clip(np.rint(np.array(lengths, dtype=float) / duration_step), 1, max_steps).astype(np.int64)
+    return np.array(pitches, dtype=np.int64), steps
+
+
+def _add_ngrams(counts:np.ndarray, tokens:np.ndarray, start:int, order:int):
+    """Counts every (context, next token) of one sequence in place. The sequence start is padded with the start token."""
+    padded = np.concatenate([np.full(order, start, dtype=np.int64), tokens])
+    index = tuple(padded[i:i + len(tokens)] for i in range(order)) + (tokens,)
+    np.add.at(counts, index, 1)
+
+
+def _cdf_table(counts:np.ndarray, smoothing:float):
+    """
+    Cumulative next token probabilities per context. Counts are smoothed towards the overall token frequencies,
+    so contexts never seen in training fall back to them.
+    """
+    counts = counts.astype(float)
+    prior = counts.reshape(-1, counts.shape[-1]).sum(axis=0) + 1
+    prior /= prior.sum()
+    cdf = np.cumsum(counts + smoothing * prior, axis=-1)
+    cdf /= cdf[..., -1:]
+    cdf[..., -1] = 1.0 # no float gap above the last token
+    cdf.setflags(write=False)
+    return cdf
+
+
+
+class MelodyModel:
+    """
+    Pitch and duration n-grams of melodies, counted in fixed size uint32 arrays.
+    Pitches are chord relative pitch classes (0-11) and durations are steps of duration_step (1 to max_steps),
+    each conditioned on the previous `order` tokens of its own kind.
+
+    Train with partial_fit() on chord jsons (the jsons/ corpus, ChordParser output), as many times as needed.
+    Probability tables are built once after training and shared by every sample() call.
+
+    USAGE:
+    model = MelodyModel(order=2)
+    model.fit_paths(['jsons', 'my_song.mid'])
+    model.save('assets/melody_model.npz')
+
+    model = MelodyModel.load('assets/melody_model.npz')
+    pitches, durations, context = model.sample(length=1, rng=np.random.default_rng(42))
+    """
+    def __init__(self, order:int=2, duration_step:float=1/16, max_steps:int=16, smoothing:float=1.0):
+        """
+        order: int
+            Number of previous tokens a token depends on. EG: 2 for trigrams
+
+        smoothing: float
+            Weight of the overall token frequencies added to every context. Higher is more random.
+        """
+        if order < 1:
+            raise ValueError(f'Order must be at least 1, got {order}')
+
+        self.order = order
+        self.duration_step = duration_step
+        self.max_steps = max_steps
+        self.smoothing = smoothing
+        self.num_sequences = 0
+
+        # last axis is the next token, the others the context. Index PITCH_CLASSES / max_steps is the start token
+        self.pitch_counts = np.zeros((PITCH_CLASSES + 1,) * order + (PITCH_CLASSES,), dtype=np.uint32)
+        self.step_counts = np.zeros((max_steps + 1,) * order + (max_steps,), dtype=np.uint32)
+        self._tables = None
+
+
+    def partial_fit(self, entries:list):
+        """
+        Adds one chord json as one melody.
+
+        entries: list of dict with chord, intervals, pattern, pitch
+        """
+        pitches, steps = melody_line(entries, self.duration_step, self.max_steps)
+        if len(pitches) == 0:
+            return self
+
+        _add_ngrams(self.pitch_counts, pitches, PITCH_CLASSES, self.order)
+        _add_ngrams(self.step_counts, steps - 1, self.max_steps, self.order)
+        self.num_sequences += 1
+        self._tables = None
+        return self
+
+
+    def fit_chord(self, chord:mp.chord, sample_rate:float=1.0):
+        """
+        Adds a track, eg: from an uploaded MIDI, through ChordParser.deconstruct_bass(). Drum tracks are skipped.
+        """
+        parser = ChordParser(chord)
+        if parser.is_drum():
+            return self
+        parser.deconstruct_bass(sample_rate)
+        return self.partial_fit(parser.deconstructed_bass or [])
+
+
+    def fit_paths(self, paths:list):
+        """
+        Adds chord jsons and MIDI files. Directories are read one level deep, drum jsons are skipped.
+
+        paths: list of str
+            EG: ['jsons', 'song.mid']
+
+        Returns:
+            int, number of melodies added
+        """
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                files += [os.path.join(path, f) for f in sorted(os.listdir(path))]
+            else:
+                files.append(path)
+
+        before = self.num_sequences
+        for file in files:
+            extension = os.path.splitext(file)[1].lower()
+            if extension == '.json':
+                with open(file) as f:
+                    data = json.load(f)
+                if isinstance(data, list) and not is_drum_json(data):
+                    self.partial_fit(data)
+            elif extension in ['.mid', '.midi']:
+                piece = mp.read(file)
+                for track in piece.tracks:
+                    self.fit_chord(track)
+        return self.num_sequences - before
+
+
+    @property
+    def tables(self):
+        """(pitch cdf, step cdf), rebuilt only after training."""
+        if self._tables is None:
+            self._tables = (_cdf_table(self.pitch_counts, self.smoothing), _cdf_table(self.step_counts, self.smoothing))
+        return self._tables
+
+
+    def signature(self):
+        """Hash of the counts and settings, for generation keys."""
+        content = hashlib.sha1(self.pitch_counts.tobytes())
+        content.update(self.step_counts.tobytes())
+        content.update(repr((self.order, self.duration_step, self.max_steps, self.smoothing)).encode())
+        return content.hexdigest()
+
+
+    def sample(self, length:float=1, rng:np.random.Generator=None, context:tuple=None):
+        """
+        Notes filling `length`, the last one shortened to fit. All random numbers are drawn in one call,
+        each note is then a lookup in the probability tables.
+
+        context: tuple
+            Context returned by the previous call, to continue the same melody (eg: over the next chord). None starts a new one.
+
+        Returns:
+            (pitches, durations, context)
+            pitches: list of chord relative pitch classes
+            durations: list of floats
+
+        Example:
+            model.sample(1, np.random.default_rng(42)) >> ([0, 7, 0, 7], [0.125, 0.125, 0.375, 0.375], ((0, 7), (5, 5)))
+        """
+        if context is None:
+            context = ((PITCH_CLASSES,) * self.order, (self.max_steps,) * self.order)
+        pitch_context, step_context = context
+        if length <= 0:
+            return [], [], context
+        if rng is None:
+            rng = np.random.default_rng()
+
+        pitch_cdf, step_cdf = self.tables
+        size = math.ceil(length / self.duration_step) + 1 # worst case, every note is one step
+        pitches = []
+        durations = []
+        total = 0
+        for pitch_draw, step_draw in rng.random((size, 2)).tolist():
+            pitch = int(pitch_cdf[pitch_context].searchsorted(pitch_draw, side='right'))
+            step = int(step_cdf[step_context].searchsorted(step_draw, side='right'))
+            pitch_context = pitch_context[1:] + (pitch,)
+            step_context = step_context[1:] + (step,)
+
+            duration = (step + 1) * self.duration_step
+            pitches.append(pitch)
+            durations.append(min(duration, length - total))
+            total += duration
+            if total >= length:
+                break
+        return pitches, durations, (pitch_context, step_context)
+
+
+    def save(self, path:str):
+        """Counts and settings as one .npz, a few KB."""
+        np.savez_compressed(
+            path,
+            pitch_counts=self.pitch_counts,
+            step_counts=self.step_counts,
+            settings=np.array([self.order, self.duration_step, self.max_steps, self.smoothing, self.num_sequences], dtype=float),
+        )
+
+
+    @classmethod
+    def load(cls, path:str):
+        with np.load(path) as data:
+            order, duration_step, max_steps, smoothing, num_sequences = data['settings'].tolist()
+            model = cls(order=int(order), duration_step=duration_step, max_steps=int(max_steps), smoothing=smoothing)
+            model.pitch_counts = data['pitch_counts'].astype(np.uint32)
+            model.step_counts = data['step_counts'].astype(np.uint32)
+        model.num_sequences = int(num_sequences)
+        return model
+
+
+
+def train_melody_model(paths:list, model_path:str=DEFAULT_MODEL_PATH, order:int=2):
+    """
+    Batch training job. Continues from the model at model_path if there is one, adds the paths and saves it back,
+    so new MIDIs and jsons can be added any time without retraining the corpus.
+
+    Example:
+        train_melody_model(['jsons'])
+        train_melody_model(['uploads/song.mid'])
+    """
+    model = MelodyModel.load(model_path) if os.path.exists(model_path) else MelodyModel(order=order)
+    added = model.fit_paths(paths)
+    model.save(model_path)
+    _load_melody_model.cache_clear() # get_melody_model() picks up the new model
+    print(f'Added {added} melodies, {model.num_sequences} in total. Saved to {model_path}')
+    return model
+
+
+def get_melody_model(model_path:str=DEFAULT_MODEL_PATH):
+    """
+    Shared MelodyModel, loaded once per saved version of the file. Trained on the jsons/ corpus if no model was saved yet.
+    """
+    mtime = os.path.getmtime(model_path) if os.path.exists(model_path) else None
+    return _load_melody_model(model_path, mtime)
+
+
+@lru_cache(maxsize=1)
+def _load_melody_model(model_path:str, mtime:float):
+    """Keyed on the file mtime as well, so a model saved by another process is loaded again."""
+    if mtime is not None:
+        return MelodyModel.load(model_path)
+    model = MelodyModel()
+    model.fit_paths([CORPUS_DIR])
+    return model
+
+
+
+if __name__ == '__main__':
+    # python -m utils.generators.markov jsons song.mid
+    train_melody_model(sys.argv[1:] or [CORPUS_DIR])
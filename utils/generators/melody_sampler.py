@@ -0,0 +1,117 @@
+import re
+import math
+import numpy as np
+import musicpy as mp
+
+
+
+def parse_durations(durations:list):
+    """
+    Melody durations as a float array, parsed once.
+
+    durations: list
+        floats, mp.beat objs, or 'rest(0.1875)' strings from the app
+
+    Example:
+        parse_durations([1/4, mp.beat(1/2, 1), 'rest(0.1875)']) >> array([0.25  , 0.75  , 0.1875])
+    """
+    values = []
+    for duration in durations:
+        if isinstance(duration, mp.beat):
+            duration = duration.get_duration()
+        elif isinstance(duration, str): # from app, rest(0.1875)
+            duration = float(re.search(r'\d+\.\d+', duration).group())
+        values.append(float(duration))
+
+    values = np.array(values, dtype=float)
+    if len(values) == 0 or values.max() <= 0:
+        raise ValueError(f'Melody durations need at least one positive duration, got {durations}')
+    return values[values > 0]
+
+
+def passing_share(probability:float):
+    """
+    Share of non-chord notes for a probability in percent. Same odds as `random.randint(0, 100) < probability`,
+    ie 101 outcomes. EG: 30 >> 30/101
+    """
+    return min(max(math.ceil(probability), 0), 101) / 101
+
+
+
+class MelodySampler:
+    """
+    Draws the melody of one chord in one go. Durations are parsed once, candidate notes and their cumulative weights once per chord,
+    then every pitch and duration of the chord comes from one Generator.random() call (inverse CDF) and is trimmed to the chord length.
+    Same odds per note as picking one note at a time with random.choice.
+
+    USAGE:
+    sampler = MelodySampler([1/4, 1/8, 3/8])
+    names, durations = sampler.sample(('C', 'E', 'G'), ('D', 'F', 'A', 'B'), length=1, probability=30, rng=np.random.default_rng(42))
+    """
+    def __init__(self, durations:list):
+        self.durations = parse_durations(durations)
+        self.min_duration = self.durations.min()
+        self._candidates = {} # (chord names, non chord names, probability) >> (names, weights, cumulative weights)
+
+
+    def _table(self, chord_names:tuple, non_chord_names:tuple, probability:float):
+        key = (tuple(chord_names), tuple(non_chord_names), probability)
+        if key in self._candidates:
+            return self._candidates[key]
+
+        share = passing_share(probability) if non_chord_names else 0
+        if share == 0:
+            non_chord_names = ()
+        names = np.array(list(chord_names) + list(non_chord_names), dtype=object)
+        weights = np.concatenate([
+            np.full(len(chord_names), (1 - share) / len(chord_names)),
+            np.full(len(non_chord_names), share / len(non_chord_names) if non_chord_names else 0),
+        ])
+        cdf = np.cumsum(weights)
+        cdf[-1] = 1.0 # no float gap above the last candidate
+        self._candidates[key] = (names, weights, cdf)
+        return self._candidates[key]
+
+
+    def candidates(self, chord_names:tuple, non_chord_names:tuple=(), probability:float=0):
+        """
+        Candidate note names of a chord and the chance of each. Chord notes share 1 - passing_share(probability),
+        non-chord notes share the rest. Without non-chord notes every chord note is equally likely.
+
+        Returns:
+            (np.array of names, np.array of weights)
+        """
+        names, weights, _ = self._table(chord_names, non_chord_names, probability)
+        return names, weights
+
+
+    def sample(self, chord_names:tuple, non_chord_names:tuple=(), length:float=1, probability:float=0, rng:np.random.Generator=None):
+        """
+        Notes filling `length`. Enough notes for the worst case (all shortest) are drawn at once, then cut where the
+        running length reaches `length`. The last note is shortened to fit.
+
+        rng: np.random.Generator
+            EG: np.random.default_rng(42)
+
+        Returns:
+            (names, durations), lists of the same length
+
+        Example:
+            sampler.sample(('A', 'C', 'E'), length=1, rng=rng) >> (['E', 'A', 'A', 'C'], [0.375, 0.25, 0.25, 0.125])
+        """
+        if length <= 0:
+            return [], []
+        if rng is None:
+            rng = np.random.default_rng()
+
+        names, _, cdf = self._table(chord_names, non_chord_names, probability)
+        size = math.ceil(length / self.min_duration) + 1
+        draws = rng.random((2, size))
+        durations = self.durations[(draws[0] * len(self.durations)).astype(np.int64)]
+        picks = np.searchsorted(cdf, draws[1], side='right')
+
+        ends = np.cumsum(durations)
+        count = int(np.searchsorted(ends, length)) + 1 # first note reaching length
+        durations = durations[:count]
+        durations[-1] = min(durations[-1], length - (ends[count - 2] if count > 1 else 0))
+        return names[picks[:count]].tolist(), durations.tolist()
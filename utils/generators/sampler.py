@@ -0,0 +1,100 @@
+import numpy as np
+from functools import lru_cache
+
+
+
+class WeightedSampler:
+    """
+    Weighted random choice with Walker's alias method. The table is built once in O(n), then every draw is O(1):
+    one uniform number picks a column and whether to keep it or take its alias.
+    Weights do not need to add up to 1.
+
+    USAGE:
+    sampler = WeightedSampler([('maj7', 0.15), ('m7', 0.15), ('7', 0.10)])
+    sampler.sample(rng) >> 'm7'
+    sampler.sample_many(8, rng) >> ['maj7', '7', 'm7', ...]
+
+    rng is anything with .random(): the random module, a random.Random, or a np.random.Generator.
+    """
+    def __init__(self, table:list):
+        """
+        table: list of (item, weight) or dict {item: weight}
+            EG: CHORD_TYPES_PROBABILITIES
+        """
+        if isinstance(table, dict):
+            table = list(table.items())
+        if len(table) == 0:
+            raise ValueError('Probability table is empty')
+
+        self.items = [item for item, _ in table]
+        weights = np.array([weight for _, weight in table], dtype=float)
+        if (weights < 0).any() or weights.sum() <= 0:
+            raise ValueError(f'Weights must be non-negative with a positive sum, got {weights.tolist()}')
+
+        self.probabilities = weights / weights.sum()
+        self.prob, self.alias = self._build(self.probabilities)
+        self._prob = self.prob.tolist() # python floats for scalar draws
+        self._alias = self.alias.tolist()
+
+
+    def __len__(self):
+        return len(self.items)
+
+
+    @staticmethod
+    def _build(probabilities:np.ndarray):
+        """Vose's variant: columns below average are topped up by one column above average."""
+        n = len(probabilities)
+        scaled = probabilities * n
+        prob = np.ones(n)
+        alias = np.arange(n)
+        small = [i for i in range(n) if scaled[i] < 1]
+        large = [i for i in range(n) if scaled[i] >= 1]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            prob[s] = scaled[s]
+            alias[s] = l
+            scaled[l] -= 1 - scaled[s]
+            (small if scaled[l] < 1 else large).append(l)
+        # leftovers are 1 up to float error
+        return prob, alias
+
+
+    def sample_index(self, rng):
+        u = rng.random() * len(self._prob)
+        column = min(int(u), len(self._prob) - 1) # u * n can round up to n
+        return column if u - column < self._prob[column] else self._alias[column]
+
+
+    def sample(self, rng):
+        """One item."""
+        return self.items[self.sample_index(rng)]
+
+
+    def sample_many(self, k:int, rng):
+        """
+        k items in one go. A np.random.Generator draws all of them as arrays.
+
+        Returns:
+            list of items
+        """
+        if isinstance(rng, np.random.Generator):
+            u = rng.random(k) * len(self._prob)
+        else:
+            u = np.array([rng.random() for _ in range(k)]) * len(self._prob)
+        columns = np.minimum(u.astype(np.int64), len(self._prob) - 1)
+        indices = np.where(u - columns < self.prob[columns], columns, self.alias[columns])
+        return [self.items[i] for i in indices.tolist()]
+
+
+
+@lru_cache(maxsize=64)
+def get_sampler(table:tuple):
+    """
+    WeightedSampler shared per probability table, so a table is only built once per process.
+
+    table: tuple of (item, weight)
+        Must be hashable. EG: tuple(CHORD_TYPES_PROBABILITIES)
+    """
+    return WeightedSampler(list(table))
@@ -0,0 +1,237 @@
+import json
+import numpy as np
+from functools import lru_cache
+
+from utils.constants import RHYTHM_VARIANTS, PATTERN_VARIANTS
+from utils.operators.rhythm import compile_rhythm
+
+
+GRID_RESOLUTION = 48 # grid steps per whole note, fits 16ths and 8th/16th triplets
+
+
+
+def parse_time_signature(time_signature):
+    """
+    EG: '9/8' >> (9, 8), [4, 4] >> (4, 4), None >> (4, 4)
+    """
+    if time_signature in [None, '', 'None']:
+        return (4, 4)
+    if isinstance(time_signature, str):
+        numerator, denominator = time_signature.split('/')
+        return (int(numerator), int(denominator))
+    numerator, denominator = time_signature
+    return (int(numerator), int(denominator))
+
+
+def _hamming(a:int, b:int):
+    return bin(a ^ b).count('1')
+
+
+
+class RhythmLibrary:
+    """
+    Rhythm and pattern presets, indexed once. Lookup by name, rhythms compiled per time signature,
+    onset grids as bitmasks for similarity search, and user patterns registered or loaded from JSON.
+    Use get_library() for the shared instance instead of building one per rerun.
+
+    USAGE:
+    library = get_library()
+    library.rhythms['Tresillo'] >> {'name': 'Tresillo', 'rhythm': 'b - - b - - b b', 'bars': 1, 'time_signature': '4/4'}
+    library.compiled('Tresillo').durations >> array([0.375, 0.375, 0.125, 0.125])
+    library.similar('Habanera', k=2) >> [('Quarter', 2), ('Tresillo', 2)]
+    """
+    def __init__(self, rhythms:list=RHYTHM_VARIANTS, patterns:list=PATTERN_VARIANTS):
+        self.rhythms = {} # {name: {'name', 'rhythm', 'bars', 'time_signature'}}, insertion ordered for selectboxes
+        self.patterns = {} # {name: {'name', 'pattern', 'intervals'}}
+        self._grids = {} # {(name, time_signature, bars): (grid, bitmask)}
+
+        for rhythm in rhythms:
+            self.register_rhythm(**rhythm)
+        for pattern in patterns:
+            self.register_pattern(**pattern)
+
+
+    def __contains__(self, name:str):
+        return name in self.rhythms or name in self.patterns
+
+
+    @property
+    def rhythm_names(self):
+        return list(self.rhythms)
+
+
+    @property
+    def pattern_names(self):
+        return list(self.patterns)
+
+
+    def register_rhythm(self, name:str, rhythm:str, bars:float=1, time_signature:str='4/4', overwrite:bool=False):
+        """
+        Adds a rhythm and precompiles its onset grid at its own time signature.
+
+        rhythm: str
+            EG: 'b 0 0 b 0 0 b 0'
+
+        Example:
+            library.register_rhythm('Offbeat', '0 b 0 b 0 b 0 b')
+        """
+        if name in self.rhythms and not overwrite:
+            raise ValueError(f'Rhythm {name} already exists. Use overwrite=True to replace it.')
+        if 'b' not in rhythm.split():
+            raise ValueError(f'Rhythm {name} has no beats: {rhythm}')
+
+        self.rhythms[name] = {
+            'name': name,
+            'rhythm': rhythm,
+            'bars': bars,
+            'time_signature': time_signature,
+        }
+        self._grids = {key: value for key, value in self._grids.items() if key[0] != name}
+        self._grid(name, time_signature)
+        return self.rhythms[name]
+
+
+    def register_pattern(self, name:str, pattern:list, intervals:list, overwrite:bool=False):
+        """
+        Adds an arp pattern. EG: library.register_pattern('Up', [1, 2, 3, 1.1], [1/8] * 4)
+        """
+        if name in self.patterns and not overwrite:
+            raise ValueError(f'Pattern {name} already exists. Use overwrite=True to replace it.')
+        if len(pattern) != len(intervals):
+            raise ValueError(f'Pattern and intervals must have the same length. Error at pattern {name}')
+
+        self.patterns[name] = {
+            'name': name,
+            'pattern': list(pattern),
+            'intervals': list(intervals),
+        }
+        return self.patterns[name]
+
+
+    def load_json(self, json_data, overwrite:bool=False):
+        """
+        Registers user rhythms and patterns.
+
+        json_data: str, dict or list
+            Path to a JSON file, or the loaded data. Either {'rhythms': [...], 'patterns': [...]}
+            or one list where entries with a 'rhythm' key are rhythms and entries with a 'pattern' key are patterns.
+
+        Returns:
+            (rhythm names, pattern names) that were added
+        """
+        if isinstance(json_data, str):
+            with open(json_data) as f:
+                json_data = json.load(f)
+
+        if isinstance(json_data, dict):
+            rhythms = json_data.get('rhythms', [])
+            patterns = json_data.get('patterns', [])
+        else:
+            rhythms = [entry for entry in json_data if 'rhythm' in entry]
+            patterns = [entry for entry in json_data if 'pattern' in entry]
+
+        added_rhythms = [self.register_rhythm(**entry, overwrite=overwrite)['name'] for entry in rhythms]
+        added_patterns = [self.register_pattern(**entry, overwrite=overwrite)['name'] for entry in patterns]
+        return added_rhythms, added_patterns
+
+
+    def get_rhythm(self, name:str):
+        if name not in self.rhythms:
+            raise KeyError(f'Rhythm {name} not found. Available: {self.rhythm_names}')
+        return self.rhythms[name]
+
+
+    def get_pattern(self, name:str):
+        if name not in self.patterns:
+            raise KeyError(f'Pattern {name} not found. Available: {self.pattern_names}')
+        return self.patterns[name]
+
+
+    def compiled(self, name:str, bars:float=None, time_signature=None):
+        """
+        CompiledRhythm of a preset, see compile_rhythm(). Defaults to the preset bars and time signature.
+        """
+        rhythm = self.get_rhythm(name)
+        bars = rhythm['bars'] if bars in [None, 0] else bars
+        time_signature = parse_time_signature(time_signature or rhythm['time_signature'])
+        return compile_rhythm(rhythm['rhythm'], bars, time_signature)
+
+
+    def _grid(self, name:str, time_signature=None, bars:float=None):
+        rhythm = self.get_rhythm(name)
+        time_signature = parse_time_signature(time_signature or rhythm['time_signature'])
+        bars = rhythm['bars'] if bars in [None, 0] else bars
+        key = (name, time_signature, bars)
+        if key not in self._grids:
+            self._grids[key] = self._onset_grid(self.compiled(name, bars, time_signature))
+        return self._grids[key]
+
+
+    @staticmethod
+    def _onset_grid(compiled):
+        numerator, denominator = compiled.time_signature
+        length = int(round(compiled.bars * numerator / denominator * GRID_RESOLUTION))
+        steps = np.rint((compiled.start_time + compiled.onsets) * GRID_RESOLUTION).astype(int)
+        grid = np.zeros(length, dtype=bool)
+        grid[steps[steps < length]] = True
+        grid.setflags(write=False)
+        bitmask = sum(1 << int(step) for step in np.flatnonzero(grid))
+        return grid, bitmask
+
+
+    def onset_grid(self, name:str, time_signature=None, bars:float=None):
+        """
+        Bool array with one step per 1/GRID_RESOLUTION of a whole note, True where a beat starts.
+
+        Example:
+            library.onset_grid('Quarter').nonzero() >> (array([ 0, 12, 24, 36]),)
+        """
+        return self._grid(name, time_signature, bars)[0]
+
+
+    def bitmask(self, name:str, time_signature=None, bars:float=None):
+        """Onset grid packed into an int, bit i is grid step i."""
+        return self._grid(name, time_signature, bars)[1]
+
+
+    def similar(self, query:str, k:int=5, bars:float=1, time_signature=None):
+        """
+        Closest rhythms by Hamming distance of the onset bitmasks, ie number of grid steps where only one of the two has a beat.
+        Every preset is compiled at the query's time signature and length, so the grids line up step for step.
+        EG: the 5/4 preset is stretched over one 4/4 bar when the query is Tresillo.
+
+        query: str
+            A preset name, or a rhythm string. EG: 'Tresillo', 'b 0 0 b 0 0 b 0'
+
+        bars: float
+            Length of a query rhythm string. Ignored for preset names, which keep their own length.
+
+        time_signature: str or tuple
+            Meter of the comparison. Defaults to the query preset's own, or 4/4 for a rhythm string.
+
+        Returns:
+            list of (name, distance), closest first. The query preset itself is left out.
+        """
+        if query in self.rhythms:
+            rhythm = self.rhythms[query]
+            bars = rhythm['bars']
+            time_signature = parse_time_signature(time_signature or rhythm['time_signature'])
+            query_mask = self.bitmask(query, time_signature, bars)
+        else:
+            time_signature = parse_time_signature(time_signature)
+            query_mask = self._onset_grid(compile_rhythm(query, bars, time_signature))[1]
+
+        distances = [
+            (name, _hamming(query_mask, self.bitmask(name, time_signature, bars)))
+            for name in self.rhythms if name != query
+        ]
+        return sorted(distances, key=lambda x: x[1])[:k]
+
+
+
+@lru_cache(maxsize=1)
+def get_library():
+    """
+    Shared RhythmLibrary, built once per process (survives streamlit reruns).
+    """
+    return RhythmLibrary()
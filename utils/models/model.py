@@ -2,8 +2,15 @@ from pydantic import BaseModel, Field
 from dataclasses import dataclass, field
 from typing import List, Union
 import musicpy as mp
-import random
 import warnings
+from functools import lru_cache
+
+from utils.operators.templates import get_template, scale_table
+from utils.operators.track_builder import TrackBuilder
+from utils.operators.rhythm import compile_rhythm, tile_rhythm
+from utils.operators.reconstruct import entry_notes
+from utils.generators.generation_cache import make_rng, generation_key, to_tables, from_tables
+from utils.generators.sampler import get_sampler
 
 
 class ChordJson(BaseModel):
@@ -46,6 +53,30 @@ CHORD_TYPES_PROBABILITIES = [
 
 
 
+@lru_cache(maxsize=4096, typed=True)
+def _arp_columns(chord_name:str, pitch:int, pattern:tuple, intervals:tuple):
+    """
+    Notes of get_template(chord_name, pitch).to_chord() @ pattern % (intervals, intervals) as (names, nums, intervals),
+    built once per combination.
+    """
+    names, nums, intervals = entry_notes({'chord': chord_name, 'pitch': pitch, 'pattern': list(pattern), 'intervals': list(intervals)})
+    return tuple(names), tuple(nums), tuple(intervals)
+
+
+@lru_cache(maxsize=4096)
+def _rhythm_columns(chord_name:str, pitch:int, rhythm_str:str):
+    """
+    Notes of tile_rhythm(get_template(chord_name, pitch).to_chord(), compile_rhythm(rhythm_str, 1))
+    as (names, nums, durations, intervals, start_time), built once per combination.
+    """
+    chd = tile_rhythm(get_template(chord_name, pitch).to_chord(), compile_rhythm(rhythm_str, 1))
+    return (
+        tuple(n.name for n in chd.notes), tuple(n.num for n in chd.notes), tuple(n.duration for n in chd.notes),
+        tuple(chd.interval), chd.start_time,
+    )
+
+
+
 
 
 
@@ -53,7 +84,7 @@ CHORD_TYPES_PROBABILITIES = [
 class PatternGenerator:
     """ 
     USAGE: 
-    pg = PatternGenerator()
+    pg = PatternGenerator(seed=42)
     """
     def __init__(
         self,
@@ -63,16 +94,31 @@ class PatternGenerator:
         time_signature:list=[4,4],
         chord_progression:int=6543,
         category:str='chord',
+        seed:int=None,
+        cache:dict=None,
     ):
+        """
+        seed: int or random.Random
+            Makes generation reproducible. None uses the global random module like before.
+
+        cache: dict
+            Generated chords keyed by settings + random state, see generate_chord().
+        """
         self.bars= bars
         self.key= key
         self.mode = mode
         self.category = category
         self.time_signature = time_signature
         self.chord_progression = chord_progression
-        self.chords = []
+        self.chords = [] # chords of the last generate_chord() call
         self.chord_choices = []
+        self.default_chords = CHORD_TYPES_PROBABILITIES # weighted chord types used when chord_choices is empty
+        self.chord_sampler = get_sampler(tuple(CHORD_TYPES_PROBABILITIES))
         self.patterns = []
+        self.verbose = 0
+        self.seed = seed
+        self.rng = make_rng(seed)
+        self.cache = cache
 
     # internal methods
     def _update_scale(self):
@@ -88,18 +134,18 @@ class PatternGenerator:
         print(f'Intervals: {self.intervals}')
     
     def random_settings(self):
-        self.set_bars(random.choice([4,8,12,16]))
-        self.set_key(random.choice(['C', 'D', 'E', 'F', 'G', 'A', 'B']))
-        self.set_mode(random.choice(['major', 'minor']))
-        self.set_category(random.choice(['chord', 'arp']))
-        self.set_progression(random.choice([6543, 2345, 1245, 6451, 4362, 6123]))
-        self.rhythms = [random.choice(['b - - -', 'b 0 0 b 0 0 b 0', 'b 0 0 b 0 0 b b'])]
+        self.set_bars(self.rng.choice([4,8,12,16]))
+        self.set_key(self.rng.choice(['C', 'D', 'E', 'F', 'G', 'A', 'B']))
+        self.set_mode(self.rng.choice(['major', 'minor']))
+        self.set_category(self.rng.choice(['chord', 'arp']))
+        self.set_progression(self.rng.choice([6543, 2345, 1245, 6451, 4362, 6123]))
+        self.rhythms = [self.rng.choice(['b - - -', 'b 0 0 b 0 0 b 0', 'b 0 0 b 0 0 b b'])]
         
         combos = [
             {"patterns": [1,2,4,2], "intervals": [1/4]*4},
             {"patterns": [1,2,3,5,1,2,5,3], "intervals": [1/8]*8},
         ]
-        selected = random.choice(combos)
+        selected = self.rng.choice(combos)
         pattern = selected['patterns']
         intervals = selected['intervals']
         self.set_pattern_and_intervals(pattern=pattern, intervals=intervals)
@@ -148,13 +194,28 @@ class PatternGenerator:
         Choices from mp.database.CHORD_TYPES. Do not include root notes
         """
         if chord_choices == []:
-            self.default_chords = CHORD_TYPES_PROBABILITIES # all types
+            self.set_chord_probabilities(CHORD_TYPES_PROBABILITIES) # all types
 
         for chord_type in chord_choices:
             if chord_type[0] in ['C', 'D', 'E', 'F', 'G', 'A', 'B']:
                 raise ValueError(f'Root notes in chord_choices not required. Please refer to mp.database.CHORD_TYPES')
         self.chord_choices = list(set(chord_choices))
 
+    def set_chord_probabilities(self, probabilities):
+        """
+        Weighted chord types used when chord_choices is empty. The alias table is built once per table.
+
+        params: probabilities: list of (chord type, weight) or dict # [('maj7', 0.5), ('m7', 0.3), ('7', 0.2)]
+        """
+        if isinstance(probabilities, dict):
+            probabilities = list(probabilities.items())
+        for chord_type, _ in probabilities:
+            if chord_type[0] in ['C', 'D', 'E', 'F', 'G', 'A', 'B']:
+                raise ValueError(f'Root notes in chord probabilities not required. Please refer to mp.database.CHORD_TYPES')
+
+        self.default_chords = [tuple(pair) for pair in probabilities]
+        self.chord_sampler = get_sampler(tuple(self.default_chords))
+
     def set_patterns(self, patterns:list=[]):
         """
         List of arpeggio patterns.
@@ -214,12 +275,16 @@ class PatternGenerator:
         
     # calculate methods
     def get_random_chord_from_default(self):
-        chord_types, probabilities = zip(*self.default_chords)
-        return random.choices(chord_types, weights=probabilities, k=1)[0]
+        return self.chord_sampler.sample(self.rng)
+
+    def get_random_chords_from_default(self, k:int):
+        """k weighted chord types in one go."""
+        return self.chord_sampler.sample_many(k, self.rng)
     
     def generate_chord(self, category='chord', use_self_patterns=True):
         """ 
         Generates a chord for the current chord progression.
+        self.chords is replaced by the chords of this call. Set self.verbose = 1 to print each pattern.
 
         params: use_self_patterns: bool
             If True, the chord will use the patterns set in the PatternGenerator. 
@@ -235,46 +300,74 @@ class PatternGenerator:
             adjusted_pattern = [min(p, n_notes) for p in pattern]
             return adjusted_pattern
 
-        scale = self.scale
-        chord = mp.chord("")
-
-        while chord.bars(mode=0) < self.bars:
+        key = None
+        if self.cache is not None:
+            key = generation_key((
+                self.bars, [(n.name, n.num) for n in self.scale.notes], self.time_signature, self.chord_progression, category, 
+                use_self_patterns, self.chord_choices, self.default_chords, self.patterns, self.intervals, getattr(self, 'rhythms', None),
+            ), self.rng)
+            if key in self.cache:
+                cached = self.cache[key]
+                self.chords = from_tables(cached['chords'])
+                self.rng.setstate(cached['rng_state'])
+                return from_tables([cached['track']])[0]
+
+        # root of every progression degree, from the scale's diatonic table
+        try:
+            roots = scale_table(self.scale).roots(self.chord_progression)
+        except ValueError: # scale without a mode, or degrees past 8
+            roots = []
             for string in str(self.chord_progression): # '6543'
-                degree = int(string)
-                root_note = scale.get_note_from_degree(degree) # mp.note obj
-                note_str = root_note.name
-                pitch = root_note.num 
+                root_note = self.scale.get_note_from_degree(int(string)) # mp.note obj
+                roots.append((root_note.name, root_note.num))
+
+        builder = TrackBuilder() # whole track, builder.length is the running duration
+        self.chords = []
+
+        while builder.bars() < self.bars:
+            # weighted chord types of the whole progression in one draw
+            default_types = self.get_random_chords_from_default(len(roots)) if self.chord_choices == [] else None
 
+            for i, (note_str, pitch) in enumerate(roots):
                 # get chord type
-                if self.chord_choices == []:
-                    chord_type = self.get_random_chord_from_default()
+                if default_types is not None:
+                    chord_type = default_types[i]
                 else:
-                    chord_type = random.choice(self.chord_choices)
+                    chord_type = self.rng.choice(self.chord_choices)
 
-                intervals = random.choice(self.intervals)
-                temp_c = mp.C(f"{note_str}{chord_type}", pitch=pitch)
-                n_notes = len(temp_c.notes)
+                intervals = self.rng.choice(self.intervals)
+                chord_name = f"{note_str}{chord_type}"
+                template = get_template(chord_name, pitch=pitch) # parsed once per chord name, not per bar
+                n_notes = len(template)
     
                 # generate pattern from self, or if chordtype cant support, generate random pattern
                 if use_self_patterns == True:
-                    pattern = random.choice(self.patterns)
+                    pattern = self.rng.choice(self.patterns)
                     pattern = adjust_pattern(pattern, n_notes)
                 else:
-                    pattern = (random.choices(range(1, n_notes+1), k=len(intervals)))
+                    pattern = (self.rng.choices(range(1, n_notes+1), k=len(intervals)))
 
-                print(f'Pattern: {pattern}, {note_str}{chord_type}')
+                if self.verbose > 0:
+                    print(f'Pattern: {pattern}, {chord_name}')
 
                 # arp chord or apply rhythm
                 if category == 'arp':
-                    chd = mp.C(f"{note_str}{chord_type}", pitch=pitch) @ pattern % (intervals, intervals)
+                    names, nums, arp_intervals = _arp_columns(chord_name, pitch, tuple(pattern), tuple(intervals))
+                    chd = TrackBuilder().append_arrays(list(names), list(nums), list(arp_intervals), list(arp_intervals)).to_chord()
                 else:
-                    chd = mp.C(f"{note_str}{chord_type}", pitch=pitch)
-                    chd = chd.from_rhythm(mp.rhythm(random.choice(self.rhythms), 1))
+                    names, nums, durations, rhythm_intervals, start_time = _rhythm_columns(chord_name, pitch, self.rng.choice(self.rhythms))
+                    chd = TrackBuilder().append_arrays(list(names), list(nums), list(durations), list(rhythm_intervals), start_time=start_time).to_chord()
 
                 self.chords.append(chd)
-                chord += chd
-
-        return chord
+                builder.append(chd)
+
+        if key is not None:
+            self.cache[key] = {
+                'chords': to_tables(self.chords),
+                'track': builder.to_table(),
+                'rng_state': self.rng.getstate(),
+            }
+        return builder.to_chord()
     
 
 
@@ -1,5 +1,10 @@
+import numpy as np
 import musicpy as mp
-from utils.operators.midi import note_to_midi, midi_to_note
+from functools import lru_cache
+
+from utils.operators.midi import midi_to_note, names_to_midi
+from utils.operators.track_builder import TrackBuilder
+from utils.operators.rhythm import accent_chord
 
 
 
@@ -7,16 +12,26 @@ from utils.operators.midi import note_to_midi, midi_to_note
 
 
 def join_chords(chords:list):
-    joined = mp.chord('')
-    for chd in chords:
-        joined += chd
-    return joined
+    """
+    Same as adding every chord with +=, in linear time. See TrackBuilder.
+    """
+    return TrackBuilder().extend(chords).to_chord()
+
+
+
+def _to_midi_array(chord):
+    """
+    Helper to get MIDI integers from a mp.chord or a list of notes, note strings or MIDI integers.
+    """
+    notes = chord.notes if isinstance(chord, mp.chord) else list(chord)
+    if all(isinstance(note, (int, np.integer)) for note in notes):
+        return np.asarray(notes, dtype=np.int64)
+    return names_to_midi(notes)
 
 
 
 def normalize_chord(chord, target_octave:int=5, note_as_string:bool=False):
-    midi_positions = [note_to_midi(note) for note in chord]
-    normalized_midi = [(midi % 12) + (target_octave * 12) for midi in midi_positions]
+    normalized_midi = [midi % 12 + (target_octave * 12) for midi in _to_midi_array(chord).tolist()]
     return [midi_to_note(midi, note_as_string) for midi in normalized_midi]
 
 
@@ -26,13 +41,9 @@ def voice_2_chords(chord1, chord2, note_as_string:bool=False):
     Converts all notes in both chords to MIDI. Then minimize the difference by rearranging
     each note by octaves to discover optimal inversion. 
     """
-    # Normalize both chords to pitch 4
-    chord1 = normalize_chord(chord1, 4, note_as_string)
-    chord2 = normalize_chord(chord2, 4, note_as_string)
-
-    # transform list of notes to MIDI numbers
-    c1_midi = [note_to_midi(note) for note in chord1]
-    c2_midi = [note_to_midi(note) for note in chord2]
+    # Normalize both chords to pitch 4, kept as MIDI numbers
+    c1_midi = [midi % 12 + (4 * 12) for midi in _to_midi_array(chord1).tolist()]
+    c2_midi = [midi % 12 + (4 * 12) for midi in _to_midi_array(chord2).tolist()]
 
     midi_best_range = float('inf')
     midi_combination = c2_midi # list of midi values
@@ -53,6 +64,178 @@ def voice_2_chords(chord1, chord2, note_as_string:bool=False):
 
 
 
+# voice_progression() search limits. Candidates grow about 3x per note, chords with more pitch classes
+# only get the rotations of their closed position, the same voicings voice_2_chords() picks from
+MAX_VOICING_PITCH_CLASSES = 6
+MAX_VOICING_CANDIDATES = 256
+
+
+@lru_cache(maxsize=512)
+def _voicing_candidates(pitch_classes:tuple, octave_range:tuple=(3, 5), max_span:int=24):
+    """
+    Helper for voice_progression(). Enumerates the octave placements of the pitch classes within octave_range,
+    one note at a time, dropping partial placements wider than max_span as it goes.
+    At most MAX_VOICING_CANDIDATES are kept, narrowest first.
+
+    pitch_classes: tuple of int
+        EG: (0, 4, 7) for C major
+
+    Returns:
+        2D np.array of sorted MIDI voicings, one row per candidate. Rows span at most max_span semitones.
+    """
+    low, high = octave_range
+    pcs = np.array(pitch_classes)
+    closed = np.sort(pcs + (low + 1) * 12) # musicpy C4 = 60
+
+    if len(pcs) > MAX_VOICING_PITCH_CLASSES:
+        rotations = [np.concatenate([closed[i:], closed[:i] + 12]) for i in range(len(closed))]
+        return np.unique(np.sort(rotations, axis=1), axis=0)
+
+    octave_offsets = (np.arange(low, high + 1) + 1) * 12
+    placements = (pcs[0] + octave_offsets)[:, None]
+    for pc in pcs[1:]:
+        placements = np.concatenate([
+            np.repeat(placements, len(octave_offsets), axis=0),
+            np.tile(pc + octave_offsets, len(placements))[:, None],
+        ], axis=1)
+        placements = placements[placements.max(axis=1) - placements.min(axis=1) <= max_span]
+
+    voicings = np.unique(np.sort(placements, axis=1), axis=0)
+    if len(voicings) > MAX_VOICING_CANDIDATES:
+        spans = voicings[:, -1] - voicings[:, 0]
+        voicings = voicings[np.sort(np.argsort(spans, kind='stable')[:MAX_VOICING_CANDIDATES])]
+
+    # widest search can still fail for very large chords, keep closed position as fallback
+    if len(voicings) == 0:
+        voicings = closed[None, :]
+    return voicings
+
+
+@lru_cache(maxsize=2048)
+def _voicing_motion(pitch_classes1:tuple, pitch_classes2:tuple, octave_range:tuple=(3, 5), max_span:int=24):
+    """
+    Helper for voice_progression(). Cost matrix of moving from every voicing of chord1 to every voicing of chord2.
+    Cached per chord pair since progressions reuse the same few transitions.
+
+    Returns:
+        2D np.array of shape (n_voicings1, n_voicings2). Sum of semitones moved by each voice.
+    """
+    v1 = _voicing_candidates(pitch_classes1, octave_range, max_span)
+    v2 = _voicing_candidates(pitch_classes2, octave_range, max_span)
+
+    # same number of voices: sorted voices pair up one to one
+    if v1.shape[1] == v2.shape[1]:
+        return np.abs(v1[:, None, :] - v2[None, :, :]).sum(axis=-1)
+
+    # different number of voices: every voice travels to its nearest voice in the other chord
+    distances = np.abs(v1[:, None, :, None] - v2[None, :, None, :])
+    return distances.min(axis=3).sum(axis=2) + distances.min(axis=2).sum(axis=2)
+
+
+def voice_progression(chords:list, octave_range:tuple=(3, 5), max_span:int=24, note_as_string:bool=False):
+    """
+    Voices a whole progression with the least total motion between consecutive chords.
+    Generalizes voice_2_chords() from 2 chords to N chords. 
+
+    Every octave placement of each chord is enumerated as MIDI integers, then dynamic programming picks
+    the sequence of voicings with the globally smallest motion instead of choosing greedily pair by pair.
+
+    chords: list
+        List of chords. Each chord is a mp.chord or a list of notes or note strings. 
+        EG: [mp.C('Cmaj7'), ['F', 'A', 'C', 'E'], 'G,B,D,F']
+
+    octave_range: tuple of int
+        Lowest and highest octave a note can be placed in.
+
+    max_span: int
+        Maximum distance in semitones between the lowest and highest note of a voicing.
+
+    Returns:
+        list of list of notes, one list per chord, sorted from low to high.
+
+    Example:
+        voice_progression([mp.C('C'), mp.C('F'), mp.C('G'), mp.C('C')], note_as_string=True)
+        >> [['C3', 'E3', 'G3'], ['C3', 'F3', 'A3'], ['D3', 'G3', 'B3'], ['E3', 'G3', 'C4']]
+    """
+    if len(chords) == 0:
+        return []
+
+    progression = []
+    for chord in chords:
+        notes = chord.split(',') if isinstance(chord, str) else chord
+        pitch_classes = sorted(set((_to_midi_array(notes) % 12).tolist()))
+        progression.append(tuple(pitch_classes))
+
+    octave_range = tuple(octave_range)
+
+    # forward pass: lowest total motion to reach every voicing of chord i
+    costs = np.zeros(len(_voicing_candidates(progression[0], octave_range, max_span)))
+    backpointers = []
+    for prev, curr in zip(progression[:-1], progression[1:]):
+        total = costs[:, None] + _voicing_motion(prev, curr, octave_range, max_span)
+        backpointers.append(total.argmin(axis=0))
+        costs = total.min(axis=0)
+
+    # backward pass: follow the cheapest path
+    choice = int(costs.argmin())
+    path = [choice]
+    for pointers in reversed(backpointers):
+        choice = int(pointers[choice])
+        path.append(choice)
+    path.reverse()
+
+    voiced = []
+    for pitch_classes, choice in zip(progression, path):
+        voicing = _voicing_candidates(pitch_classes, octave_range, max_span)[choice]
+        voiced.append([midi_to_note(int(midi), note_as_string) for midi in voicing])
+    return voiced
+
+
+
+def apply_legato(chord, percentage:float=100, overlap:float=0, gap:float=0):
+    """
+    Every note lasts until the next distinct onset, so stacked notes (0 intervals) all ring until the next chord.
+    Durations are set in one pass: the next non-zero interval of each note is found with a reverse scan.
+    Notes in a trailing stack with nothing after them keep their duration.
+    Modifies the chord in place and returns it.
+
+    chord: mp.chord obj
+
+    percentage: float
+        Share of the time to the next onset the note sounds. EG: 100 legato, 50 staccato
+
+    overlap: float
+        Bars added to every note, ringing into the next onset. EG: 1/32
+
+    gap: float
+        Bars removed from every note. Durations never go below 0.
+
+    Example:
+        chd = mp.chord('C4, E4, G4, A3') % ([1/8, 1/8, 1/8, 1/8], [0, 0, 1/2, 1/2])
+        apply_legato(chd).get_duration()
+        >> [0.5, 0.5, 0.5, 0.5]
+    """
+    notes = chord.notes
+    if len(notes) == 0:
+        return chord
+
+    intervals = np.asarray(chord.interval, dtype=float)
+    n = len(intervals)
+
+    # index of the first non-zero interval at or after each note, n if there is none
+    positions = np.where(intervals != 0, np.arange(n), n)
+    next_nonzero = np.minimum.accumulate(positions[::-1])[::-1]
+    spans = np.where(next_nonzero < n, intervals[np.minimum(next_nonzero, n - 1)], 0.0)
+
+    durations = np.maximum(spans * percentage / 100 + overlap - gap, 0.0)
+    for note, span, duration in zip(notes, spans.tolist(), durations.tolist()):
+        if span > 0:
+            note.duration = duration
+    return chord
+
+
+
+
 
 
 def lengthen_note_duration_in_chord(chord, duration:float=0.125):
@@ -125,7 +308,7 @@ def detect_chord_name(chord_obj):
 
 
 
-def accenting_rhythm_chord(chord, rhythm, bars, high_volume:int=80, low_volume:int=60, bounce_low_notes:bool=False, bounce_pattern:str='fifth'):
+def accenting_rhythm_chord(chord, rhythm, bars, high_volume:int=80, low_volume:int=60, bounce_low_notes:bool=False, bounce_pattern:str='fifth', humanize:int=0, ramp:int=0, seed:int=None):
     """ 
     Instead of applying rhythm to a chord, replaces all rests and sustains with beats and lowers volume.
 
@@ -146,38 +329,28 @@ def accenting_rhythm_chord(chord, rhythm, bars, high_volume:int=80, low_volume:i
         
     bounce_low_notes: bool 
         If True, the low notes will bounce up by 12 semitones.
-    """
-    r_list = rhythm.split()
-    new_r_list = ' '.join(['b' if x != 'b' else 'b' for x in r_list])
-    chd = chord.from_rhythm(mp.rhythm(new_r_list, bars))
-    notes = chd.notes
-    note_count = len(chord.notes)  # Number of simultaneous notes in the chord
-    rhythm_length = len(r_list)
-    bounce_counter = 0
-    
-    for i in range(0, len(notes), note_count):
-        chunk_index = (i // note_count) % rhythm_length
 
-        for j in range(note_count):
-            if r_list[chunk_index] == 'b':
-                notes[i + j].set_volume(high_volume)
-            else:
-                notes[i + j].set_volume(low_volume)
-                if bounce_low_notes == True:
-                    if bounce_pattern == 'octave':
-                        notes[i + j] += 12
-                    
-                    elif bounce_pattern == 'fifth':
-                        if bounce_counter % 2 == 0:
-                            notes[i + j] += 7
-                        else:
-                            notes[i + j] += 12
-                        bounce_counter += 1
+    bounce_pattern: str
+        'octave' or 'fifth'. Fifth alternates +7 and +12 over the low notes.
 
-                    else:
-                        raise ValueError(f'Bounce pattern {bounce_pattern} not supported.')
+    humanize: int
+        Max random velocity jitter per note.
 
-    return chd
+    ramp: int
+        Velocity added linearly over the steps. EG: 20 for a crescendo.
+
+    seed: int
+        Seed of the jitter.
+    """
+    return accent_chord(
+        chord, rhythm, bars,
+        high_volume=high_volume,
+        low_volume=low_volume,
+        bounce_pattern=bounce_pattern if bounce_low_notes == True else None,
+        humanize=humanize,
+        ramp=ramp,
+        seed=seed,
+    )
 
 
 
@@ -188,8 +361,10 @@ def clamp_chord_pattern(chord_obj, pattern):
 
     EG: 
     Cmaj : [1, 2.2, 3.1, 4.2] >> [1, 2.2, 3.1, 3.2]
+
+    chord_obj: mp.chord obj or ChordTemplate, only the number of notes is used
     """
-    n_notes = len(chord_obj.notes)
+    n_notes = len(chord_obj)
     clamped_pattern = []
 
     for index in pattern:
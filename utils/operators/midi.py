@@ -1,38 +1,109 @@
+import numpy as np
 import musicpy as mp
 
+
+#-----------
+# lookup tables
+#-----------
+# musicpy numbering: C4 = 60, so MIDI 0 is C-1
+MIDI_RANGE = range(128)
+NOTE_NAMES = [mp.database.standard_reverse[i] for i in range(12)] # ['C', 'C#', ..., 'B']
+
+# MIDI >> (name, octave). EG: MIDI_TO_NAME_OCTAVE[61] = ('C#', 4)
+MIDI_TO_NAME_OCTAVE = [(NOTE_NAMES[midi % 12], midi // 12 - 1) for midi in MIDI_RANGE]
+MIDI_TO_NAME = np.array([f'{name}{octave}' for name, octave in MIDI_TO_NAME_OCTAVE])
+
+# note string >> MIDI for every spelling musicpy knows. EG: 'C#4', 'Db4', 'db4' >> 61, 'C#' >> 61 (octave 4 by default)
+NAME_TO_MIDI = {}
+for _name, _number in mp.database.standard.items():
+    NAME_TO_MIDI[_name] = _number + 12 * (4 + 1)
+    for _octave in range(-1, 10):
+        _midi = _number + 12 * (_octave + 1)
+        if _midi in MIDI_RANGE:
+            NAME_TO_MIDI[f'{_name}{_octave}'] = _midi
+
+
+
+def _check_midi(midi:int, note):
+    """MIDI number of `note` if it is within 0-127, else ValueError naming the note."""
+    if midi not in MIDI_RANGE:
+        raise ValueError(f'Note {note!r} is MIDI {midi}, outside the MIDI range 0-127')
+    return midi
+
+
 # Function to convert a note to its MIDI position
 def note_to_midi(note):
-    try:
-        if isinstance(note, str):
-            # Check if the note has an octave indicator
-            if note[-1].isdigit():
-                note_str = note[:-1]
-                note_octave = int(note[-1]) # rmb to convert str to int
-                return mp.note(note_str, note_octave).degree
-            
-            # get note obj for str itself
-            else:
-                return mp.note(note).degree
+    """
+    Raises ValueError for unknown spellings and notes outside MIDI 0-127. EG: 'H4', 'C10'
+    """
+    if isinstance(note, str):
+        midi = NAME_TO_MIDI.get(note)
+        if midi is not None:
+            return midi
 
-        # access note method if is note instance already
-        return note.degree
+        # rare spellings outside the table, let musicpy parse it
+        try:
+            midi = mp.to_note(note).degree
+        except Exception as e:
+            raise ValueError(f'Unknown note {note!r}') from e
+        return _check_midi(midi, note)
 
-    except Exception as e:
-        print(f"Error converting note {note} to MIDI: {e}")
-        return None
+    # access note method if is note instance already
+    try:
+        midi = note.degree
+    except AttributeError as e:
+        raise ValueError(f'Cannot convert {note!r} to MIDI') from e
+    return _check_midi(midi, note)
 
 
 # Function to convert a MIDI position to a note
 def midi_to_note(midi_pos, note_as_string=False):
-    try:
-        note_obj = mp.note('C', 4) # init note obj
-        note_obj.degree = midi_pos
+    midi_pos = int(midi_pos)
+    if midi_pos in MIDI_RANGE:
+        name, octave = MIDI_TO_NAME_OCTAVE[midi_pos]
+    else:
+        name, octave = NOTE_NAMES[midi_pos % 12], midi_pos // 12 - 1
+
+    if note_as_string == True:
+        return f'{name}{octave}'
+    else:
+        return mp.note(name, octave) # note obj, not string!
+
+
+def names_to_midi(names):
+    """
+    Vectorized note_to_midi(). Known spellings are a single dict lookup each, no note objects are created.
+
+    names: array-like of note strings or mp.note objects
+        EG: ['C4', 'E4', 'G4', 'C4']
+
+    Returns:
+        np.array of int. EG: array([60, 64, 67, 60])
+
+    Raises ValueError for unknown spellings and notes outside MIDI 0-127.
+    """
+    lookup = NAME_TO_MIDI
+    midis = [
+        lookup[note] if note in lookup else note_to_midi(note)
+        for note in (note if isinstance(note, str) else f'{note.name}{note.num}' for note in names)
+    ]
+    return np.array(midis, dtype=np.int64)
+
+
+def midi_to_names(midis):
+    """
+    Vectorized midi_to_note() for strings.
+
+    midis: array-like of int within 0-127
+        EG: [60, 64, 67]
 
-        if note_as_string == True:
-            return str(note_obj)
-        else:
-            return note_obj # note obj, not string!
+    Returns:
+        np.array of note strings. EG: array(['C4', 'E4', 'G4'])
 
-    except Exception as e:
-        print(f"Error converting MIDI {midi_pos} to note: {e}")
-        return None
+    Raises ValueError for values outside 0-127, instead of numpy wrapping negative ones around.
+    """
+    midis = np.asarray(midis, dtype=np.int64)
+    outside = (midis < 0) | (midis >= len(MIDI_RANGE))
+    if outside.any():
+        raise ValueError(f'MIDI values {midis[outside].tolist()} are outside the MIDI range 0-127')
+    return MIDI_TO_NAME[midis]
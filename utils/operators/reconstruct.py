@@ -0,0 +1,216 @@
+import numpy as np
+import musicpy as mp
+from functools import lru_cache
+
+from utils.operators.midi import MIDI_TO_NAME_OCTAVE, NOTE_NAMES
+from utils.operators.templates import get_template
+from utils.operators.track_builder import TrackBuilder
+
+
+#-----------
+# cached lookups
+#-----------
+@lru_cache(maxsize=1024, typed=True)
+def _parse_pattern_value(value):
+    """
+    Pattern value >> (template index, semitone shift), same rules as mp.chord.get().
+    int i is note i. float 'n.o' is note n raised by o octaves, or note -n lowered by o octaves when n is negative.
+
+    EG: 1 >> (0, 0), 3.0 >> (2, 0), 1.1 >> (0, 12), -2.1 >> (1, -12)
+    Returns None for values musicpy would skip.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value - 1, 0
+    if isinstance(value, float):
+        num, octave = [int(j) for j in str(value).split('.')]
+        if num > 0:
+            return num - 1, octave * 12
+        return -num - 1, -octave * 12
+    return None
+
+
+def _degree_to_name(degree:int):
+    if 0 <= degree < len(MIDI_TO_NAME_OCTAVE):
+        return MIDI_TO_NAME_OCTAVE[degree]
+    return NOTE_NAMES[degree % 12], degree // 12 - 1
+
+
+
+#-----------
+# reconstruction
+#-----------
+def pattern_rows(pattern:list, size:int, chord_name:str='chord'):
+    """
+    Arp pattern >> (note indices, semitone shifts) into a chord of `size` notes, same notes as chord @ pattern.
+    Values musicpy would skip are dropped.
+
+    Example:
+        pattern_rows([1, 3, 1.1, -1.1], 3) >> (array([0, 2, 0, 0]), array([  0,   0,  12, -12]))
+    """
+    parsed = [p for p in map(_parse_pattern_value, pattern) if p is not None]
+    rows = np.array([p[0] for p in parsed], dtype=np.int64)
+    if rows.size and (rows.max() >= size or rows.min() < -size):
+        raise IndexError(f"Pattern {pattern} contains note outside chord range of {chord_name}")
+
+    rows = np.where(rows < 0, rows + size, rows) # python style negative indexing, same as chord.get()
+    shifts = np.array([p[1] for p in parsed], dtype=np.int64)
+    return rows, shifts
+
+
+def _entry_to_arrays(entry:dict):
+    """
+    One chord json entry >> (template rows, semitone shifts, intervals) without building any chord objects.
+    Mirrors mp.C(chord, pitch) @ pattern % (intervals, intervals).
+    """
+    chord_name = entry.get('chord', 'Unknown')
+    pattern = entry.get('pattern', []) or []
+    intervals = entry.get('intervals', []) or []
+    pitch = entry.get('pitch', 4)
+
+    template = get_template(chord_name, pitch) # literal notes like 'C#1' fall back to mp.chord(), same as the old loops
+    if sum(_parse_pattern_value(p) is not None for p in pattern) != len(intervals):
+        raise ValueError('please ensure the intervals between notes has the same numbers of the notes')
+
+    rows, shifts = pattern_rows(pattern, len(template), chord_name)
+    return template, rows, shifts, list(intervals)
+
+
+def entry_notes(entry:dict):
+    """
+    Note names and octaves of one chord json entry, same notes as mp.C(chord, pitch) @ pattern.
+
+    Returns:
+        (names, nums, intervals), lists
+
+    Example:
+        entry_notes({'chord': 'Am', 'intervals': [0.25, 0.25], 'pattern': [1.0, 3.0], 'pitch': 2})
+        >> (['A', 'E'], [2, 3], [0.25, 0.25])
+    """
+    template, rows, shifts, intervals = _entry_to_arrays(entry)
+    names = []
+    nums = []
+    degrees = template.degrees[rows] + shifts
+    for row, shift, degree in zip(rows.tolist(), shifts.tolist(), degrees.tolist()):
+        if shift == 0:
+            names.append(template.names[row]) # unshifted notes keep the template spelling, eg Bb
+            nums.append(template.nums[row])
+        else:
+            name, num = _degree_to_name(degree)
+            names.append(name)
+            nums.append(num)
+    return names, nums, intervals
+
+
+def entry_degrees(entry:dict):
+    """
+    MIDI degrees of one chord json entry, without building notes.
+
+    Returns:
+        (degrees, intervals, root) where root is the degree of the first template note
+
+    Example:
+        entry_degrees({'chord': 'Am', 'intervals': [0.25, 0.25], 'pattern': [1.0, 3.0], 'pitch': 2})
+        >> (array([45, 52]), [0.25, 0.25], 45)
+    """
+    template, rows, shifts, intervals = _entry_to_arrays(entry)
+    return template.degrees[rows] + shifts, intervals, int(template.degrees[0])
+
+
+def reconstruct_chord_json(entries, skip_errors:bool=False):
+    """
+    Rebuilds a whole track from a chord json in one pass. Same result as
+    chd += mp.C(chord, pitch=pitch) @ pattern % (intervals, intervals) for every entry, but pitches come from
+    cached chord templates with array indexing and the track is assembled once with a TrackBuilder,
+    instead of copying the accumulated chord on every +=.
+
+    entries: list of dict with chord, intervals, pattern, pitch
+        EG: [{'chord': 'Fmaj7', 'intervals': [0.125, 0.125], 'pattern': [1.0, 3.0], 'pitch': 2}, ...]
+
+    skip_errors: bool
+        Print and skip entries that cannot be built instead of raising.
+
+    Returns:
+        mp.chord obj
+
+    Example:
+        chord_json = [
+            {'chord': 'Am', 'intervals': [0.25, 0.25, 0.5], 'pattern': [1.0, 3.0, 1.1], 'pitch': 2},
+            {'chord': 'F', 'intervals': [0.5, 0.5], 'pattern': [1, 2], 'pitch': 2},
+        ]
+        reconstruct_chord_json(chord_json)
+        chord(notes=[A2, E3, A3, F2, A2], interval=[0.25, 0.25, 0.5, 0.5, 0.5], start_time=0)
+    """
+    builder = TrackBuilder()
+    for entry in entries:
+        try:
+            names, nums, entry_intervals = entry_notes(entry)
+        except Exception as e:
+            if not skip_errors:
+                raise
+            print(f"Error parsing chord: {entry.get('chord', 'Unknown')}. {e}")
+            continue
+        builder.append_arrays(names, nums, durations=entry_intervals, intervals=entry_intervals)
+
+    return builder.to_chord()
+
+
+def reconstruct_drum_json(drum_json:dict, channel:int=9):
+    """
+    Rebuilds a drum track from the output of utils.parsers.drums.analyze_drums().
+    Every hit lasts one grid step, voices hit on the same step start together.
+
+    drum_json: dict with steps_per_bar, bar_length, voices, patterns, bars
+
+    channel: int
+        MIDI channel of the notes, 9 is the General MIDI drum channel.
+
+    Returns:
+        mp.chord obj
+
+    Example:
+        reconstruct_drum_json(analyze_drums(track)) >> same hits as track, snapped to the grid
+    """
+    steps_per_bar = drum_json['steps_per_bar']
+    bar_length = drum_json.get('bar_length', 1)
+    step_length = bar_length / steps_per_bar
+    voices = drum_json.get('voices', {})
+    patterns = drum_json['patterns']
+
+    # one (step, degree) array per pattern, then offset per bar
+    pattern_hits = []
+    for pattern in patterns:
+        hits = [
+            (step, int(voice))
+            for voice, steps in pattern['hits'].items()
+            for step, symbol in enumerate(steps) if symbol == 'x'
+        ]
+        pattern_hits.append(np.array(hits, dtype=np.int64).reshape(-1, 2))
+
+    bar_hits = [
+        pattern_hits[index] + [bar * steps_per_bar, 0]
+        for bar, index in enumerate(drum_json['bars']) if index >= 0
+    ]
+    if not bar_hits:
+        return mp.chord([])
+
+    hits = np.concatenate(bar_hits)
+    hits = hits[np.lexsort((hits[:, 1], hits[:, 0]))]
+    onsets = hits[:, 0] * step_length
+    degrees = hits[:, 1].tolist()
+    intervals = np.append(np.diff(onsets), step_length).tolist()
+
+    names, nums = zip(*[_degree_to_name(degree) for degree in degrees])
+    volumes = [voices.get(str(degree), {}).get('velocity', 100) for degree in degrees]
+
+    builder = TrackBuilder()
+    builder.append_arrays(
+        list(names), list(nums),
+        durations=[step_length] * len(degrees),
+        intervals=intervals,
+        volumes=volumes,
+        channels=[channel] * len(degrees),
+        start_time=float(onsets[0]),
+    )
+    return builder.to_chord()
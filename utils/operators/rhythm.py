@@ -0,0 +1,278 @@
+import numpy as np
+import musicpy as mp
+from collections import namedtuple
+from functools import lru_cache
+
+
+# A rhythm string parsed once. Step arrays have one entry per token, beat arrays one entry per 'b'.
+CompiledRhythm = namedtuple('CompiledRhythm', [
+    'rhythm_str', 'bars', 'time_signature',
+    'steps', 'step_durations', 'beat_mask',     # per token. EG: ('b', '0', '-'), array([0.25, 0.25, 0.25]), array([True, False, False])
+    'onsets', 'durations', 'intervals',         # per beat, onsets are relative to start_time
+    'start_time',                               # leading rests and continues
+    'rhythm',                                   # the mp.rhythm obj, for chords that cannot be tiled
+])
+
+
+
+@lru_cache(maxsize=512)
+def compile_rhythm(rhythm_str:str, bars:float=1, time_signature:tuple=(4, 4), steps:int=None):
+    """
+    Parses a rhythm string once into onset, duration and accent arrays. Cached per arguments, so callers
+    can compile on every use.
+
+    rhythm_str: str
+        EG: 'b 0 0 b 0 0 b 0'. Same syntax as mp.rhythm()
+
+    bars: float
+        Length of the whole rhythm.
+
+    time_signature: tuple
+        EG: (4, 4), (3, 4)
+
+    steps: int
+        Cycle or truncate the tokens to this many steps before parsing. EG: 'b 0 -' with steps=5 >> 'b 0 - b 0'
+
+    Returns:
+        CompiledRhythm
+
+    Example:
+        r = compile_rhythm('0 b - b', 1)
+        r.durations  >> array([0.5 , 0.25])
+        r.intervals  >> array([0.5 , 0.25])
+        r.start_time >> 0.25
+    """
+    if steps is not None:
+        tokens = rhythm_str.split()
+        rhythm_str = ' '.join(tokens[i % len(tokens)] for i in range(steps))
+
+    rhythm = mp.rhythm(rhythm_str, bars, time_signature=list(time_signature))
+
+    # same bookkeeping as mp.get_chords_from_rhythm(), so floats add up in the same order
+    symbols = []
+    step_durations = []
+    durations = []
+    beat_intervals = []
+    start_time = 0
+    for each in rhythm:
+        duration = each.get_duration()
+        step_durations.append(duration)
+        if type(each) is mp.beat:
+            symbols.append('b')
+            durations.append(duration)
+            beat_intervals.append(duration)
+        elif type(each) is mp.continue_symbol:
+            symbols.append('-')
+            if not durations:
+                start_time += duration
+            else:
+                durations[-1] += duration
+                beat_intervals[-1] += duration
+        else:
+            symbols.append('0')
+            if not durations:
+                start_time += duration
+            else:
+                beat_intervals[-1] += duration
+
+    onsets = [0]
+    for interval in beat_intervals[:-1]:
+        onsets.append(onsets[-1] + interval)
+    # gaps as differences of onsets, like the & merge in musicpy, last one is the remaining length
+    intervals = [b - a for a, b in zip(onsets, onsets[1:])] + beat_intervals[-1:]
+
+    return CompiledRhythm(
+        rhythm_str=rhythm_str,
+        bars=bars,
+        time_signature=tuple(time_signature),
+        steps=tuple(symbols),
+        step_durations=_readonly(step_durations, float),
+        beat_mask=_readonly([s == 'b' for s in symbols], bool),
+        onsets=_readonly(onsets if durations else [], float),
+        durations=_readonly(durations, float),
+        intervals=_readonly(intervals, float),
+        start_time=start_time,
+        rhythm=rhythm,
+    )
+
+
+def _readonly(values, dtype):
+    array = np.array(values, dtype=dtype)
+    array.setflags(write=False)
+    return array
+
+
+def accent_rhythm(rhythm_str:str, bars:float=1, time_signature:tuple=(4, 4)):
+    """
+    The same rhythm with every rest and sustain turned into a beat, for accenting.
+    Beats of the original are in .beat_mask of compile_rhythm(rhythm_str, ...).
+    """
+    steps = len(rhythm_str.split())
+    return compile_rhythm(' '.join(['b'] * steps), bars, time_signature)
+
+
+def note_beat_mask(rhythm:CompiledRhythm, num_notes:int, chord_size:int):
+    """
+    Per note of an accented chord, whether its step is a beat in the original rhythm.
+    Notes come in chunks of chord_size, one chunk per step, cycling over the steps.
+
+    Example:
+        note_beat_mask(compile_rhythm('b 0'), 6, 3) >> array([ True,  True,  True, False, False, False])
+    """
+    chunk = np.arange(num_notes) // max(chord_size, 1)
+    return rhythm.beat_mask[chunk % len(rhythm.beat_mask)]
+
+
+BOUNCE_PATTERNS = {
+    'octave': (12,),
+    'fifth': (7, 12), # alternates over the low notes
+}
+
+
+def accent_velocities(is_beat:np.ndarray, high_volume:int=100, low_volume:int=80, chord_size:int=1, humanize:int=0, ramp:int=0, seed:int=None):
+    """
+    Per note velocity of an accented chord. Beats get high_volume, rests and sustains low_volume, then the curves are added.
+
+    is_beat: np.ndarray
+        Per note mask, from note_beat_mask()
+
+    chord_size: int
+        Notes per step. Ramp moves per step, so voices of one step keep the same ramp value.
+
+    humanize: int
+        Max random jitter, added per note in [-humanize, humanize].
+
+    ramp: int
+        Added linearly from 0 on the first step to `ramp` on the last. EG: 20 for a crescendo, -20 for a decrescendo.
+
+    seed: int
+        Seed of the jitter.
+
+    Returns:
+        np.ndarray of int, clipped to 0-127
+
+    Example:
+        accent_velocities(np.array([True, False, True, False]), 100, 60, ramp=30) >> array([100,  70, 120,  90])
+    """
+    velocities = np.where(is_beat, high_volume, low_volume).astype(float)
+    num_notes = len(velocities)
+    if ramp and num_notes:
+        step = np.arange(num_notes) // max(chord_size, 1)
+        last_step = step[-1]
+        velocities += ramp * (step / last_step if last_step else 0)
+    if humanize and num_notes:
+        rng = np.random.default_rng(seed)
+        velocities += rng.integers(-humanize, humanize, size=num_notes, endpoint=True)
+    return np.clip(velocities, 0, 127).astype(int)
+
+
+def bounce_offsets(is_beat:np.ndarray, bounce_pattern:str='fifth'):
+    """
+    Per note semitone offset. Rests and sustains (not is_beat) move up by the bounce pattern, cycling over those notes.
+
+    Example:
+        bounce_offsets(np.array([True, False, False, False]), 'fifth') >> array([ 0,  7, 12,  7])
+    """
+    if bounce_pattern not in BOUNCE_PATTERNS:
+        raise ValueError(f'Bounce pattern {bounce_pattern} not supported.')
+
+    pattern = np.array(BOUNCE_PATTERNS[bounce_pattern])
+    offsets = np.zeros(len(is_beat), dtype=int)
+    low = ~np.asarray(is_beat, dtype=bool)
+    offsets[low] = pattern[np.arange(low.sum()) % len(pattern)]
+    return offsets
+
+
+def accent_chord(
+    chord:mp.chord,
+    rhythm_str:str,
+    bars:float=1,
+    high_volume:int=100,
+    low_volume:int=80,
+    bounce_pattern:str=None,
+    humanize:int=0,
+    ramp:int=0,
+    seed:int=None,
+    time_signature:tuple=(4, 4),
+    ):
+    """
+    Replaces every rest and sustain of the rhythm with a beat at a lower velocity. Velocities and bounce offsets are
+    computed as arrays per step and broadcast over the chord voices, the notes are built once.
+
+    bounce_pattern: str
+        None, 'octave' or 'fifth'. Moves the low notes up, see bounce_offsets()
+
+    humanize, ramp, seed:
+        Velocity curves, see accent_velocities()
+
+    Returns:
+        new mp.chord obj
+
+    Example:
+        accent_chord(mp.C('Am', 3), 'b 0 - b', 1, 100, 60, bounce_pattern='octave', ramp=10)
+    """
+    chd = tile_rhythm(chord, accent_rhythm(rhythm_str, bars, time_signature))
+    notes = chd.notes
+    chord_size = len(chord.notes)
+    is_beat = note_beat_mask(compile_rhythm(rhythm_str, bars, time_signature), len(notes), chord_size)
+    velocities = accent_velocities(is_beat, high_volume, low_volume, chord_size, humanize, ramp, seed).tolist()
+
+    if bounce_pattern is None:
+        offsets = [0] * len(notes)
+    else:
+        offsets = bounce_offsets(is_beat, bounce_pattern).tolist()
+
+    # moved notes are respelled from the degree like note.up(), so Bb + 12 >> A#
+    reverse = mp.database.standard_reverse
+    new_notes = []
+    for note, velocity, offset in zip(notes, velocities, offsets):
+        if offset:
+            degree = note.degree + offset
+            new_notes.append(mp.note(reverse[degree % 12], degree // 12 - 1, duration=note.duration, volume=velocity, channel=note.channel))
+        else:
+            new_notes.append(mp.note(note.name, note.num, duration=note.duration, volume=velocity, channel=note.channel))
+    chd.notes = new_notes
+    return chd
+
+
+def _is_block(chord:mp.chord):
+    """All notes start together, the last interval does not matter."""
+    return all(interval == 0 for interval in chord.interval[:-1])
+
+
+def tile_rhythm(chord:mp.chord, rhythm:CompiledRhythm):
+    """
+    Same as chord.from_rhythm(mp.rhythm(...)) but the chord is tiled over the compiled beats with array repeats,
+    no per-beat chord copies and & merges. Chords whose notes do not start together (arpeggios) go through musicpy.
+
+    chord: mp.chord obj
+
+    rhythm: CompiledRhythm
+        From compile_rhythm()
+
+    Returns:
+        new mp.chord obj
+
+    Example:
+        tile_rhythm(mp.C('Am', 3), compile_rhythm('b - b 0', 1))
+        >> [A3, C4, E4, A3, C4, E4] with interval [0, 0, 0.5, 0, 0, 0.5]
+    """
+    notes = chord.notes
+    num_beats = len(rhythm.durations)
+    if not notes or num_beats == 0 or not _is_block(chord):
+        return chord.from_rhythm(rhythm.rhythm)
+
+    num_notes = len(notes)
+    durations = np.repeat(rhythm.durations, num_notes).tolist()
+    intervals = np.zeros(num_beats * num_notes)
+    intervals[num_notes - 1::num_notes] = rhythm.intervals
+    intervals = intervals.tolist()
+
+    result = mp.chord([])
+    result.notes = [
+        mp.note(note.name, note.num, duration=duration, volume=note.volume, channel=note.channel)
+        for note, duration in zip(notes * num_beats, durations)
+    ]
+    result.interval = intervals
+    result.start_time = rhythm.start_time
+    return result
@@ -0,0 +1,224 @@
+import numpy as np
+import musicpy as mp
+from dataclasses import dataclass
+from functools import lru_cache
+
+
+BASE_PITCH = 4 # pitch templates are parsed at, other pitches are derived by offset
+
+
+
+@dataclass(frozen=True, eq=False)
+class ChordTemplate:
+    """
+    Immutable, cached view of mp.C(name, pitch). Holds plain note data so hot loops never parse chord names.
+    Use get_template() instead of building one directly.
+
+    Example:
+        t = get_template('Bbmaj7', pitch=3)
+        t.names     >> ('Bb', 'D', 'F', 'A')
+        t.nums      >> (3, 4, 4, 4)
+        t.degrees   >> array([58, 62, 65, 69])
+        t.intervals >> array([0, 4, 7, 11]) # semitones from the root
+        t.to_chord() >> same notes as mp.C('Bbmaj7', pitch=3)
+    """
+    name: str
+    pitch: int
+    names: tuple
+    nums: tuple
+    degrees: np.ndarray
+    intervals: np.ndarray
+    fixed: bool = False # literal notes like 'C#1', pitch does not move them (same as mp.chord('C#1'))
+
+    def __len__(self):
+        return len(self.names)
+
+    def pitched(self, pitch:int):
+        """Same template at another pitch. Cached, only an offset of the base template."""
+        return get_template(self.name, pitch)
+
+    def to_chord(self, duration=1/4, interval=0, volume=100):
+        """
+        Fresh mp.chord with new note objects, safe to mutate. Same defaults as mp.C().
+        """
+        chord = mp.chord([])
+        chord.notes = [
+            mp.note(name, num, duration=duration, volume=volume)
+            for name, num in zip(self.names, self.nums)
+        ]
+        chord.interval = [interval] * len(self.names)
+        return chord
+
+
+def _readonly(values):
+    array = np.array(values, dtype=np.int64)
+    array.setflags(write=False)
+    return array
+
+
+@lru_cache(maxsize=2048)
+def get_template(chord_name:str, pitch:int=BASE_PITCH):
+    """
+    Memoized chord template registry. The name is parsed once by musicpy at BASE_PITCH,
+    every other pitch is the same notes moved by whole octaves (what mp.C does), so spelling like Bb is kept.
+    Names mp.C cannot parse fall back to mp.chord(name), eg literal notes 'C#1'.
+
+    chord_name: str
+        EG: 'Cmaj7', 'G7, b9, omit 5', 'C#1'
+
+    pitch: int
+        Octave of the root. EG: 3
+
+    Returns:
+        ChordTemplate
+    """
+    pitch = int(pitch)
+    if pitch != BASE_PITCH:
+        base = get_template(chord_name, BASE_PITCH)
+        if base.fixed:
+            return base
+
+        shift = pitch - BASE_PITCH
+        return ChordTemplate(
+            name=chord_name,
+            pitch=pitch,
+            names=base.names,
+            nums=tuple(num + shift for num in base.nums),
+            degrees=_readonly(base.degrees + 12 * shift),
+            intervals=base.intervals,
+        )
+
+    fixed = False
+    try:
+        chord = mp.C(chord_name, pitch=pitch)
+    except Exception:
+        chord = mp.chord(chord_name)
+        fixed = True
+
+    degrees = [n.degree for n in chord.notes]
+    return ChordTemplate(
+        name=chord_name,
+        pitch=pitch,
+        names=tuple(n.name for n in chord.notes),
+        nums=tuple(n.num for n in chord.notes),
+        degrees=_readonly(degrees),
+        intervals=_readonly([d - degrees[0] for d in degrees]),
+        fixed=fixed,
+    )
+
+
+
+@lru_cache(maxsize=256)
+def progression_indices(progression):
+    """
+    Chord progression >> row indices of a DiatonicTable. Same digits as scale % (progression, ...), 8 is the tonic an octave up.
+
+    Example:
+        progression_indices(6451) >> (5, 3, 4, 0)
+    """
+    indices = tuple(int(digit) - 1 for digit in str(progression))
+    for index in indices:
+        if not 0 <= index < 8:
+            raise ValueError(f'Progression digits must be 1-8, got {progression}')
+    return indices
+
+
+
+@dataclass(frozen=True, eq=False)
+class DiatonicTable:
+    """
+    The diatonic chords of one scale, one ChordTemplate per degree (1-7, and 8 for the tonic an octave up),
+    built once with the omissions and inversion applied. Use diatonic_table() instead of building one directly.
+
+    Example:
+        table = diatonic_table('C', 'major', n_notes=4)
+        table.templates[5].names  >> ('A', 'C', 'E', 'G')
+        table.gather(6451)[:, 0]  >> array([69, 65, 67, 60]) # bass degree of each chord
+        table.chords(6451, duration=1) >> same chords as mp.scale('C', 'major') % (6451, 1, 0, 4)
+    """
+    key: str
+    mode: str
+    pitch: int
+    templates: tuple
+    root_notes: tuple # (name, num) of the scale note each chord is built on, before inversion
+    degrees: np.ndarray # (8, notes per chord), None if omissions left rows of different sizes
+
+    def rows(self, progression):
+        """ChordTemplates of a progression. EG: table.rows('6451')"""
+        return [self.templates[i] for i in progression_indices(progression)]
+
+    def gather(self, progression):
+        """MIDI degrees of a progression, one row per chord, as one array index."""
+        if self.degrees is None:
+            raise ValueError('Chords of this table have different sizes, use rows() instead')
+        return self.degrees[list(progression_indices(progression))]
+
+    def roots(self, progression):
+        """(name, num) of the root of each chord, same as scale.get_note_from_degree()."""
+        return [self.root_notes[i] for i in progression_indices(progression)]
+
+    def chords(self, progression, duration=1/4, interval=0):
+        """New mp.chord objs of a progression, same as scale % (progression, duration, interval, n_notes)."""
+        return [template.to_chord(duration=duration, interval=interval) for template in self.rows(progression)]
+
+
+@lru_cache(maxsize=256)
+def diatonic_table(key:str, mode:str='major', pitch:int=BASE_PITCH, n_notes:int=4, inversion:int=None, omit:tuple=()):
+    """
+    Memoized table of the diatonic chords of a scale, shared process-wide.
+
+    key: str
+        Tonic. EG: 'C', 'Bb'
+
+    n_notes: int
+        Notes per chord, stacked in thirds. EG: 3 for triads, 4 for 7th chords
+
+    inversion: int
+        Applied to every chord with chord ^ inversion (inversion_highest)
+
+    omit: tuple of int
+        Applied to every chord with chord.omit(o), in order
+
+    Returns:
+        DiatonicTable
+    """
+    scale = mp.scale(mp.note(key, pitch), mode)
+    chords = scale % (12345678, 1/4, 0, n_notes)
+    roots = [(n.name, n.num) for n in (scale.get_note_from_degree(degree) for degree in range(1, 9))] # can sit an octave above the chord's lowest note
+    for o in omit:
+        chords = [chord.omit(o) for chord in chords]
+    if inversion:
+        chords = [chord ^ inversion for chord in chords]
+
+    templates = []
+    for chord in chords:
+        degrees = [n.degree for n in chord.notes]
+        templates.append(ChordTemplate(
+            name=f'{key} {mode} {len(templates) + 1}', # a label, not a chord name get_template() can parse
+            pitch=pitch,
+            names=tuple(n.name for n in chord.notes),
+            nums=tuple(n.num for n in chord.notes),
+            degrees=_readonly(degrees),
+            intervals=_readonly([d - degrees[0] for d in degrees]),
+            fixed=True,
+        ))
+
+    sizes = {len(template) for template in templates}
+    return DiatonicTable(
+        key=key,
+        mode=mode,
+        pitch=pitch,
+        templates=tuple(templates),
+        root_notes=tuple(roots),
+        degrees=_readonly([list(t.degrees) for t in templates]) if len(sizes) == 1 else None,
+    )
+
+
+def scale_table(scale:mp.scale, n_notes:int=4, inversion:int=None, omit:tuple=()):
+    """
+    diatonic_table() of a mp.scale obj. EG: scale_table(mp.scale('A', 'minor'), n_notes=3)
+    Raises ValueError for scales without a mode, eg: built from a list of notes.
+    """
+    if scale.mode is None:
+        raise ValueError(f'Scale {scale} has no mode, build its chords with scale % (...) instead')
+    return diatonic_table(scale.start.name, scale.mode, scale.start.num, n_notes, inversion, tuple(omit))
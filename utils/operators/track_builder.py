@@ -0,0 +1,200 @@
+import numpy as np
+import musicpy as mp
+from collections import namedtuple
+from functools import lru_cache
+
+
+# Column view of a track. Arrays are aligned per note, onsets are absolute (start_time included).
+NoteTable = namedtuple('NoteTable', ['names', 'nums', 'degrees', 'durations', 'volumes', 'channels', 'intervals', 'onsets', 'start_time'])
+
+
+@lru_cache(maxsize=128)
+def _pitch_class(name:str):
+    """Same lookup as note.degree, covers spellings missing from database.standard like 'Cx'. EG: 'Bb' >> 10"""
+    return mp.note(name, -1).degree
+
+
+
+class TrackBuilder:
+    """
+    Appends chords into growable columns (name, num, duration, volume, channel, interval) and materializes
+    one mp.chord at the end. Each append is linear in the segment only, where `track += chd` copies the whole
+    accumulated track every time.
+
+    Spacing rules are the same as musicpy's `+=`: the segment start_time becomes a rest, a trailing 0 interval is
+    pushed by the last note duration, and an empty track picks up the start_time of what is added.
+    Only notes are carried, tempo and pitch bend messages are not.
+
+    USAGE:
+    builder = TrackBuilder()
+    for chd in chords:
+        builder.append(chd)
+    track = builder.to_chord()
+    """
+    def __init__(self, chord:mp.chord=None):
+        """
+        chord: mp.chord obj
+            Optional track to continue from. It is copied, not modified.
+        """
+        self.names = []
+        self.nums = []
+        self.durations = []
+        self.volumes = []
+        self.channels = []
+        self.intervals = []
+        self.start_time = 0
+        self.length = 0 # running sum of intervals
+        if chord is not None:
+            self.append(chord)
+
+
+    @classmethod
+    def from_table(cls, table:NoteTable):
+        """
+        Builder holding the notes of a NoteTable, the inverse of to_table().
+
+        Example:
+            TrackBuilder.from_table(table).to_chord()
+        """
+        builder = cls()
+        builder.names = table.names.tolist()
+        builder.nums = table.nums.tolist()
+        builder.durations = table.durations.tolist()
+        builder.volumes = table.volumes.tolist()
+        builder.channels = table.channels.tolist()
+        builder.intervals = table.intervals.tolist()
+        builder.start_time = table.start_time
+        builder.length = sum(builder.intervals)
+        return builder
+
+
+    def __len__(self):
+        return len(self.names)
+
+
+    def bars(self):
+        """Same as chord.bars(mode=0), the sum of intervals. Kept as a running total, so it is O(1)."""
+        return self.length
+
+
+    def rest(self, length:float):
+        """Same as chord.rest(length)."""
+        if not self.names:
+            self.start_time += length
+        elif self.intervals[-1] != 0:
+            self.intervals[-1] += length
+            self.length += length
+        else:
+            self.intervals[-1] += self.durations[-1] + length
+            self.length += self.durations[-1] + length
+        return self
+
+
+    def append_arrays(self, names:list, nums:list, durations:list, intervals:list, volumes:list=None, channels:list=None, start_time:float=0):
+        """
+        Append a segment given as columns, without building note objects. Same spacing rules as append().
+
+        Example:
+            builder.append_arrays(['C', 'E', 'G'], [4, 4, 4], [1/4, 1/4, 1/4], [0, 0, 1/4])
+        """
+        if volumes is None:
+            volumes = [100] * len(names)
+        if channels is None:
+            channels = [None] * len(names)
+
+        if not self.names:
+            if names:
+                self.start_time += start_time
+            else:
+                self.start_time = max(self.start_time + start_time, self.start_time)
+        elif not names:
+            if start_time > 0:
+                self.rest(start_time)
+            return self
+        else:
+            self.rest(start_time)
+
+        self.names.extend(names)
+        self.nums.extend(nums)
+        self.durations.extend(durations)
+        self.volumes.extend(volumes)
+        self.channels.extend(channels)
+        self.intervals.extend(intervals)
+        self.length += sum(intervals)
+        return self
+
+
+    def append(self, chord:mp.chord):
+        """Same as `track += chord`."""
+        notes = chord.notes
+        return self.append_arrays(
+            names=[n.name for n in notes],
+            nums=[n.num for n in notes],
+            durations=[n.duration for n in notes],
+            intervals=list(chord.interval),
+            volumes=[n.volume for n in notes],
+            channels=[n.channel for n in notes],
+            start_time=chord.start_time,
+        )
+
+
+    def extend(self, chords:list):
+        for chord in chords:
+            self.append(chord)
+        return self
+
+
+    def append_note(self, note:mp.note, interval:float=None):
+        """
+        Same as track.notes.append(note); track.interval.append(interval).
+        Interval defaults to the note duration, ie the next note starts when this one ends.
+        """
+        self.names.append(note.name)
+        self.nums.append(note.num)
+        self.durations.append(note.duration)
+        self.volumes.append(note.volume)
+        self.channels.append(note.channel)
+        interval = note.duration if interval is None else interval
+        self.intervals.append(interval)
+        self.length += interval
+        return self
+
+
+    def to_chord(self):
+        """
+        Materialize as one mp.chord with new note objects.
+        """
+        chord = mp.chord([])
+        chord.notes = [
+            mp.note(name, num, duration=duration, volume=volume, channel=channel)
+            for name, num, duration, volume, channel in zip(self.names, self.nums, self.durations, self.volumes, self.channels)
+        ]
+        chord.interval = list(self.intervals)
+        chord.start_time = self.start_time
+        return chord
+
+
+    def to_table(self):
+        """
+        Materialize as a NoteTable of numpy arrays, no note objects at all.
+
+        Example:
+            table = TrackBuilder(mp.C('Am', 3) % (1/4, 1/4)).to_table()
+            table.degrees >> array([57, 60, 64])
+            table.onsets  >> array([0.  , 0.25, 0.5 ])
+        """
+        nums = np.array(self.nums, dtype=np.int64)
+        degrees = np.array([_pitch_class(name) for name in self.names], dtype=np.int64) + 12 * (nums + 1)
+        intervals = np.array(self.intervals, dtype=float)
+        onsets = self.start_time + np.concatenate(([0.0], np.cumsum(intervals[:-1]))) if len(intervals) else np.array([])
+        return NoteTable(
+            names=np.array(self.names, dtype=object),
+            nums=nums,
+            degrees=degrees,
+            durations=np.array(self.durations, dtype=float),
+            volumes=np.array(self.volumes),
+            channels=np.array(self.channels, dtype=object),
+            intervals=intervals,
+            onsets=onsets,
+            start_time=self.start_time,
+        )
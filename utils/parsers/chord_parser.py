@@ -1,23 +1,62 @@
+import hashlib
 import numpy as np
 import musicpy as mp
+from copy import deepcopy
+from fractions import Fraction
+from functools import lru_cache
 
 from utils.operators.chord import voice_2_chords, normalize_chord
+from utils.operators.reconstruct import reconstruct_chord_json, reconstruct_drum_json
+from utils.operators.templates import get_template
+from utils.parsers.harmony import analyze_resolutions
+from utils.parsers.drums import analyze_drums, STEPS_PER_BAR
+
+
+@lru_cache(maxsize=1024)
+def _interval_to_fraction(interval:float, quantize_limit:int=64):
+    """
+    Cached float interval to fraction string. Tracks reuse a handful of intervals, so this is mostly a lookup.
+    EG: 0.25 >> '1/4'
+    """
+    fraction = Fraction(interval).limit_denominator(quantize_limit)
+
+    # If float very small, return 0
+    if fraction.numerator == 0:
+        return '0'
+    return f"{fraction.numerator}/{fraction.denominator}"
 
 
 class ChordParser:
+    MAX_CACHE_SEGMENTS = 512
+
+    def __init__(self, chord, segment_cache:dict=None, max_cache_segments:int=MAX_CACHE_SEGMENTS):
+        """
+        chord: mp.chord obj
 
-    def __init__(self, chord):
+        segment_cache: dict
+            Analysis results per window, keyed by a hash of the window notes and parameters. 
+            Pass the same dict between parsers (eg: from session state) so a re-run only analyzes windows that changed.
+            Kept in least recently used order, the oldest windows are dropped past max_cache_segments.
+
+        max_cache_segments: int
+            Most windows kept in the cache. Windows of the latest parse are never dropped, even if there are more of them.
+        """
         self.chord = chord.standard_notation()
         self.pitch = None # set global pitch for all notes
         self.verbose = 0
+        self._groups = None # cached onset groups, see _group_by_onset()
+        self.segment_cache = segment_cache if segment_cache is not None else {}
+        self.max_cache_segments = max_cache_segments
 
         self.deconstructed_melody = None
         self.deconstructed_bass = None
+        self.deconstructed_drums = None
         self.deconstructed_intervals_chords = None
 
         self.reconstructed_bass = None
         self.reconstructed_intervals_chords = None
         self.reconstructed_melody = None
+        self.reconstructed_drums = None
 
 
     #-----------
@@ -76,6 +115,52 @@ class ChordParser:
         return piece
     
 
+    def _group_by_onset(self):
+        """
+        Groups notes that start at the same onset. Shared by to_dict(), to_md() and get_syntax().
+
+        A group closes on the first note with a non-zero interval. Notes in a group are sorted by degree.
+        The result is cached because the chord does not change after init.
+
+        Returns:
+            dict of 
+                'notes': list of list of note strings per group. EG: [['C4', 'E4'], ['G4']]
+                'onsets': np.array of group onsets in bars
+                'intervals': np.array of the interval that closes each group
+                'closed': bool, False if the last group is left open by trailing zero intervals
+        """
+        if self._groups is not None:
+            return self._groups
+
+        notes = self.chord.notes
+        n_notes = len(notes)
+        if n_notes == 0:
+            self._groups = {'notes': [], 'onsets': np.array([]), 'intervals': np.array([]), 'closed': True}
+            return self._groups
+
+        note_strs = [f"{note.name}{note.num}" for note in notes]
+        degrees = np.fromiter((note.degree for note in notes), dtype=np.int64, count=n_notes)
+        intervals = np.asarray(self.chord.interval, dtype=float)
+
+        # group id increases after every note with a non-zero interval
+        closes = intervals > 0
+        group_ids = np.concatenate(([0], np.cumsum(closes[:-1])))
+        onsets = np.concatenate(([0.0], np.cumsum(intervals[:-1])))
+
+        # sort by group, then by degree. lexsort is stable like sorted()
+        order = np.lexsort((degrees, group_ids))
+        starts = np.flatnonzero(np.concatenate(([True], group_ids[1:] != group_ids[:-1])))
+        ends = np.concatenate((starts[1:], [n_notes]))
+
+        self._groups = {
+            'notes': [[note_strs[i] for i in order[start:end]] for start, end in zip(starts, ends)],
+            'onsets': onsets[starts],
+            'intervals': intervals[ends - 1],
+            'closed': bool(closes[-1]),
+        }
+        return self._groups
+
+
     def to_dict(self, note_as_string=False, round_interval:int=16):
         """
         Converts the chord object to a list of dictionaries with notes and intervals.
@@ -90,28 +175,19 @@ class ChordParser:
              {'notes': ['G4'], 'interval': 0.125},
              {'notes': ['B4'], 'interval': 0.125}]
         """
-        chord_data = []
-        current_notes = []
-        for note, interval in zip(self.chord.notes, self.chord.interval):
-            note_str = f"{note.name}{note.num}"
-            # current_notes.append(note_str)
-            
-            note_degree = note.degree
-            current_notes.append((note_str, note_degree))  # eg: ('C4', 60)
-            
-            if interval > 0:
-                # Round the interval to the nearest 1/16
-                rounded_interval = round(interval * round_interval) / round_interval
-
-                # Sort current_notes by degree before appending
-                sorted_notes = sorted(current_notes, key=lambda x: x[1])   
-                chord_data.append({
-                    'notes': [note_str for note_str, _ in sorted_notes] if not note_as_string else ','.join(note_str for note_str, _ in sorted_notes),
-                    'interval': rounded_interval
-                })
-                current_notes = []  # Reset current notes
-
-        return chord_data
+        groups = self._group_by_onset()
+        group_notes = groups['notes'] if groups['closed'] else groups['notes'][:-1] # open group has no interval yet
+
+        # Round the interval to the nearest 1/16
+        rounded_intervals = np.round(groups['intervals'][:len(group_notes)] * round_interval) / round_interval
+
+        return [
+            {
+                'notes': ','.join(notes) if note_as_string else notes,
+                'interval': float(interval),
+            }
+            for notes, interval in zip(group_notes, rounded_intervals)
+        ]
     
 
     def to_md(self):
@@ -143,15 +219,7 @@ class ChordParser:
         """
         Converts a float interval to a simplified fraction string.
         """
-        from fractions import Fraction
-
-        denominators = {1, 2, 3, 4, 6, 8, 16, 32, 64}
-        fraction = Fraction(interval).limit_denominator(quantize_limit)
-
-         # If float very small, return 0
-        if fraction.numerator == 0:
-            return '0'
-        return f"{fraction.numerator}/{fraction.denominator}"
+        return _interval_to_fraction(float(interval), quantize_limit)
     
 
     #-----------
@@ -175,39 +243,13 @@ class ChordParser:
         
         assert c == chord
         """
-        notes = self.chord.notes # list of note objects
-        intervals = self.chord.interval # list of intervals in floats
-        syntaxes = [] 
-        current_notes = []
-
-        for i, (note, interval) in enumerate(zip(notes, intervals)): 
-            note_str = str(note)
-            note_degree = note.degree
-            formated_interval = self._format_interval(interval) # eg: '0.25 >> 1/4'
-
-            if interval == 0: 
-                # current_notes.append(note) # eg: ['C5'] 
-                current_notes.append((note_str, note_degree))  # Append as a tuple (note_str, note_degree) Eg: ('C4', 60)
-
-            else: 
-                if current_notes: 
-                    current_notes.append((note_str, note_degree)) # add last note of chord
-                    sorted_notes = sorted(current_notes, key=lambda x: x[1]) # sort current_notes by note degree
+        groups = self._group_by_onset()
 
-                    # Convert sorted notes back to string format
-                    chord_syntax = ','.join(note_str for note_str, _ in sorted_notes) + f'[{formated_interval};.]'
-                    syntaxes.append(chord_syntax)
-                    current_notes = [] # reset current chord
-
-                else:
-                    chord_syntax = f'{note_str}[{formated_interval};.]' # eg 'C5[1/4;.]'
-                    syntaxes.append(chord_syntax)
-
-        # If we are at the last note, append the current chord
-        if i == len(notes) - 1 and current_notes:
-            sorted_notes = sorted(current_notes, key=lambda x: x[1])
-            chord_syntax = ','.join(note_str for note_str, _ in sorted_notes) + f'[{formated_interval};.]'
-            syntaxes.append(chord_syntax)
+        # an open last group has no closing interval and is written with [0;.]
+        syntaxes = [
+            ','.join(notes) + f'[{self._format_interval(interval)};.]'
+            for notes, interval in zip(groups['notes'], groups['intervals'])
+        ]
 
         # test if syntax reconciles chord
         if reconcile: 
@@ -423,7 +465,10 @@ class ChordParser:
             reference_chord = mp.chord(literal_note)
             short_chord = f"{literal_note[:-1]}5(+octave)"
         else:
-            reference_chord = mp.C(short_chord, pitch=pitch)
+            template = get_template(short_chord, pitch=pitch)
+            if template.fixed:
+                raise ValueError(f"Unknown chord name {short_chord}") # mp.C() could not parse it
+            reference_chord = template.to_chord()
 
         # Create pattern if required
         pattern = []
@@ -438,10 +483,51 @@ class ChordParser:
         }
     
 
+    def _segment_key(self, chord_obj, include_pattern=True):
+        """
+        Content hash of a window for segment_cache. Covers everything _analyze_segment() reads: 
+        note names, intervals rounded to 1/16, pitch setting and whether a pattern is extracted.
+        """
+        notes = [f"{n.name}{n.num}" for n in chord_obj.notes]
+        intervals = [round(interval * 16) / 16 for interval in chord_obj.interval]
+        content = repr((notes, intervals, self.pitch, include_pattern))
+        return hashlib.sha1(content.encode()).hexdigest()
+
+
+    def _iter_windows(self, sample_rate:float=1.0):
+        """
+        Helper for deconstruct_bass. Slices the track into windows of sample_rate bars.
+
+        Notes are assigned to a window by their onset, computed once with a cumulative sum.
+        Cheaper than track.cut() per window, which deep copies the whole track every time.
+
+        Yields:
+            (start, end, chord_obj) for every non-empty window
+        """
+        notes = self.chord.notes
+        intervals = self.chord.interval
+        onsets = np.concatenate(([0.0], np.cumsum(intervals[:-1]))) if notes else np.array([])
+        num_bars = int(self.chord.bars())
+
+        for start in np.arange(0.0, float(num_bars)+1, sample_rate):  # +1 to make sure we get last bar 
+            end = start + sample_rate
+            lo, hi = np.searchsorted(onsets, [start, end], side='left')
+            if lo == hi:  # Skip if the window is empty
+                continue
+
+            sampled_chord = mp.chord([])
+            sampled_chord.notes = notes[lo:hi]
+            sampled_chord.interval = intervals[lo:hi]
+            sampled_chord.start_time = onsets[lo] - start
+            yield start, end, sampled_chord
+
+
     def deconstruct_bass(self, sample_rate:float=1.0):
         """
         Tries to reproduce bass lines by retrieving their chords. 
 
+        Windows are looked up in self.segment_cache first, so only windows whose notes changed are analyzed again.
+
         bass: mp.chord obj 
 
         sample_rate: float
@@ -460,29 +546,95 @@ class ChordParser:
                 'pitch': 1
             }]
         """        
-        track = self.chord.copy()
-        num_bars = int(track.bars()) 
+        if self.is_drum():
+            # chord detection means nothing for drums, see deconstruct_drums()
+            if self.verbose > 0:
+                print("Drum track detected. Use deconstruct_drums() instead, no chords are detected.")
+            self.deconstruct_drums()
+            self.deconstructed_bass = None
+            self.deconstructed_melody = None
+            return
+
         deconstructed = [] 
+        cache_hits = 0
+        used = set()
 
-        for i in np.arange(0.0, float(num_bars)+1, sample_rate):  # +1 to make sure we get last bar 
-            start = i
-            end = i + sample_rate 
-            sampled_chord = track.cut(ind1=start, ind2=end)
+        for start, end, sampled_chord in self._iter_windows(sample_rate):
+            key = self._segment_key(sampled_chord, include_pattern=True)
 
-            if not sampled_chord.notes:  # Skip if the chord is empty
+            if key in self.segment_cache:
+                segment = self.segment_cache.pop(key)
+                cache_hits += 1
+            else:
+                try:
+                    segment = self._analyze_segment(sampled_chord, include_pattern=True)
+                except Exception as e: 
+                    segment = None # remember failed windows too
+            self.segment_cache[key] = segment # dicts keep insertion order, the end is the most recently used
+            used.add(key)
+
+            if segment is None:
                 continue
 
-            try:
-                segment = self._analyze_segment(sampled_chord, include_pattern=True)
-                segment['start'] = start
-                segment['end'] = end
-                deconstructed.append(segment)
-            except Exception as e: 
-                continue
+            segment = deepcopy(segment) # cached segment is shared, do not hand it out
+            segment['start'] = start
+            segment['end'] = end
+            deconstructed.append(segment)
+
+        # windows just used sit at the end, so only older ones are dropped
+        while len(self.segment_cache) > max(self.max_cache_segments, len(used)):
+            del self.segment_cache[next(iter(self.segment_cache))]
+
+        if self.verbose > 0:
+            print(f"Reused {cache_hits} cached windows, analyzed {len(deconstructed) - cache_hits}")
 
         self.deconstructed_bass = deconstructed
         self.deconstructed_melody = deconstructed
         return
+
+
+    def deconstruct_drums(self, steps_per_bar:int=STEPS_PER_BAR, bar_length:float=1):
+        """
+        Drum pattern per bar, no chord detection. See utils.parsers.drums.analyze_drums().
+
+        Example:
+            cp = ChordParser(drum_track)
+            cp.deconstruct_drums()
+            cp.deconstructed_drums >> {'type': 'drums', 'patterns': [{'hits': {'36': 'x---x---x---x---', ...}}], 'bars': [0, 0, 1, 0], ...}
+        """
+        self.deconstructed_drums = analyze_drums(self.chord, steps_per_bar=steps_per_bar, bar_length=bar_length)
+
+        if self.verbose > 0:
+            print(f"Found {len(self.deconstructed_drums['patterns'])} distinct bars in {len(self.deconstructed_drums['bars'])} bars")
+        return self.deconstructed_drums
+
+
+    def analyze_resolutions(self, window_sizes=None, beats_per_bar:int=4, stability_threshold:float=0.75):
+        """
+        Chord labels at several window sizes in one pass, plus a suggested sample_rate for deconstruct_bass.
+        Much cheaper than running deconstruct_bass once per sample_rate to compare. See utils.parsers.harmony.
+
+        Example:
+            cp = ChordParser(track)
+            resolutions = cp.analyze_resolutions()
+            cp.deconstruct_bass(sample_rate=resolutions['suggested_sample_rate'])
+        """
+        if self.is_drum():
+            print("Drum track detected. Chord resolutions are not analyzed for drums.")
+            return None
+
+        resolutions = analyze_resolutions(
+            self.chord, 
+            window_sizes=window_sizes, 
+            beats_per_bar=beats_per_bar, 
+            stability_threshold=stability_threshold
+        )
+
+        if self.verbose > 0:
+            print(f"Label agreement per window size: {resolutions['agreement']}")
+            print(f"Suggested sample rate: {resolutions['suggested_sample_rate']}")
+
+        return resolutions
     
 
     
@@ -524,31 +676,23 @@ class ChordParser:
         return chord_obj
 
     
+    def reconstruct_drums(self):
+        """Drum track back from deconstructed_drums, hits snapped to the grid."""
+        self.reconstructed_drums = reconstruct_drum_json(self.deconstructed_drums)
+        return self.reconstructed_drums
+
+
     def reconstruct_bass(self):        
-        reconstructed = []
-        for info in self.deconstructed_bass:
-            chord = info.get('chord', None)
-            intervals = info.get('intervals', None)
-            pattern = info.get('pattern', None)
-            pitch = info.get('pitch', None)
+        if self.deconstructed_bass is None and self.deconstructed_drums is not None:
+            return self.reconstruct_drums()
 
-            if pattern == None:
-                print(f"Pattern is None for chord {chord}. You should try 'reconstruct_intervals_chords()' instead.")
+        for info in self.deconstructed_bass:
+            if info.get('pattern', None) == None:
+                print(f"Pattern is None for chord {info.get('chord', None)}. You should try 'reconstruct_intervals_chords()' instead.")
                 return 
-            
-            try:
-                chord_obj = mp.C(obj=chord, pitch=pitch) @ pattern % (intervals, intervals)
-                reconstructed.append(chord_obj) 
-            
-            except Exception as e:
-                # fail case is usually bc chord is a note name instead of chord name
-                chord_obj = mp.chord(chord) @ pattern % (intervals, intervals)
-                reconstructed.append(chord_obj)
-
-        bassline = mp.chord('')
-        for chd in reconstructed:
-            bassline += chd
 
+        # whole bassline in one pass, chord names that are literal notes fall back to mp.chord()
+        bassline = reconstruct_chord_json(self.deconstructed_bass)
         bassline = self._adjust_pitch(bassline)
         self.reconstructed_bass = bassline
         return self.reconstructed_bass
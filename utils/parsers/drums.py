@@ -0,0 +1,127 @@
+import numpy as np
+import musicpy as mp
+
+from utils.constants import DRUM_MAPPING, MAIN_DRUMS, METAL_DRUMS
+
+
+STEPS_PER_BAR = 16 # 16th note grid, max 64 so a bar fits in one uint64
+
+
+
+def drum_group(degree:int):
+    """EG: 36 >> 'main', 42 >> 'metal', 39 >> 'other'"""
+    if degree in MAIN_DRUMS:
+        return 'main'
+    if degree in METAL_DRUMS:
+        return 'metal'
+    return 'other'
+
+
+def drum_grids(chord:mp.chord, steps_per_bar:int=STEPS_PER_BAR, bar_length:float=1):
+    """
+    Buckets drum hits per voice (MIDI note) into one onset bitmask per bar. Bit i is grid step i of the bar.
+    Onsets are snapped to the nearest step.
+
+    chord: mp.chord obj
+        Drum track
+
+    bar_length: float
+        Length of a bar in musicpy units. EG: 1 for 4/4, 3/4 for 3/4
+
+    Returns:
+        (voices, grids, velocities)
+        voices: np.array of MIDI notes, sorted
+        grids: np.array of uint64, shape (num_voices, num_bars)
+        velocities: np.array of mean velocity per voice
+
+    Example:
+        kick_snare = mp.chord('C2, D2, C2, D2') % (1/4, 1/4)
+        drum_grids(kick_snare) >> (array([36, 38]), array([[257], [4112]], dtype=uint64), array([100., 100.]))
+    """
+    if not 0 < steps_per_bar <= 64:
+        raise ValueError(f'steps_per_bar must be between 1 and 64, got {steps_per_bar}')
+
+    notes = chord.notes
+    if not notes:
+        return np.array([], dtype=np.int64), np.zeros((0, 0), dtype=np.uint64), np.array([])
+
+    degrees = np.fromiter((n.degree for n in notes), dtype=np.int64, count=len(notes))
+    volumes = np.fromiter((n.volume for n in notes), dtype=float, count=len(notes))
+    intervals = np.asarray(chord.interval, dtype=float)
+    onsets = chord.start_time + np.concatenate(([0.0], np.cumsum(intervals[:-1])))
+
+    steps = np.rint(onsets / bar_length * steps_per_bar).astype(np.int64)
+    bars, steps = np.divmod(steps, steps_per_bar)
+    num_bars = int(bars.max()) + 1
+
+    voices, voice_index = np.unique(degrees, return_inverse=True)
+    grids = np.zeros((len(voices), num_bars), dtype=np.uint64)
+    np.bitwise_or.at(grids, (voice_index, bars), np.left_shift(np.uint64(1), steps.astype(np.uint64)))
+
+    velocities = np.bincount(voice_index, weights=volumes) / np.bincount(voice_index)
+    return voices, grids, velocities
+
+
+def _hits_string(mask:int, steps_per_bar:int):
+    """EG: 257, 8 >> 'x-------x' truncated to 8 steps >> 'x-------'"""
+    return ''.join('x' if mask >> i & 1 else '-' for i in range(steps_per_bar))
+
+
+def analyze_drums(chord:mp.chord, steps_per_bar:int=STEPS_PER_BAR, bar_length:float=1):
+    """
+    Drum pattern analysis without any chord detection. Bars are bucketed into per voice bitmask grids,
+    repeating bars are found by hashing their grids, and each distinct bar is stored once.
+
+    Returns:
+        dict, JSON serializable
+
+    Example:
+        analyze_drums(track)
+        {
+            'type': 'drums',
+            'steps_per_bar': 16,
+            'bar_length': 1,
+            'voices': {'36': {'name': 'Bass Drum 1', 'group': 'main', 'velocity': 100}, ...},
+            'patterns': [{'hits': {'36': 'x---x---x---x---', '42': 'x-x-x-x-x-x-x-x-'}}, ...],
+            'bars': [0, 0, 1, 0], # pattern index per bar, -1 for an empty bar
+        }
+    """
+    voices, grids, velocities = drum_grids(chord, steps_per_bar, bar_length)
+
+    pattern_index = {} # bar grid >> pattern number
+    patterns = []
+    bars = []
+    for column in grids.T:
+        hit = np.flatnonzero(column)
+        if len(hit) == 0:
+            bars.append(-1)
+            continue
+
+        key = tuple(zip(voices[hit].tolist(), column[hit].tolist()))
+        if key not in pattern_index:
+            pattern_index[key] = len(patterns)
+            patterns.append({
+                'hits': {str(voice): _hits_string(mask, steps_per_bar) for voice, mask in key}
+            })
+        bars.append(pattern_index[key])
+
+    return {
+        'type': 'drums',
+        'steps_per_bar': steps_per_bar,
+        'bar_length': bar_length,
+        'voices': {
+            str(voice): {
+                'name': DRUM_MAPPING.get(voice, 'Unknown'),
+                'group': drum_group(voice),
+                'velocity': int(round(velocity)),
+            }
+            for voice, velocity in zip(voices.tolist(), velocities.tolist())
+        },
+        'patterns': patterns,
+        'bars': bars,
+    }
+
+
+def is_drum_json(data):
+    """True for the output of analyze_drums(), chord and note JSONs are lists."""
+    return isinstance(data, dict) and data.get('type') == 'drums'
@@ -0,0 +1,204 @@
+import numpy as np
+import musicpy as mp
+from functools import lru_cache
+
+
+# chord types we label windows with, kept small so matching stays unambiguous
+TEMPLATE_TYPES = ['M', 'm', '7', 'maj7', 'm7', 'dim', 'aug', 'sus4', 'sus2', 'm7b5', '5']
+WINDOW_SIZES = (0.5, 1, 2, 4)
+
+
+
+@lru_cache(maxsize=None)
+def chord_templates(chord_types:tuple=tuple(TEMPLATE_TYPES)):
+    """
+    Unit pitch-class vectors for every root and chord type, built once.
+
+    Returns:
+        (names, templates)
+        names: list of chord names. EG: ['CM', 'C#M', ..., 'Bm7b5', 'B5']
+        templates: np.array of shape (12 * len(chord_types), 12), each row L2-normalized
+    """
+    roots = [mp.database.standard_reverse[i] for i in range(12)]
+    names = []
+    rows = []
+    for chord_type in chord_types:
+        base = np.zeros(12)
+        base[[n.degree % 12 for n in mp.C(f'C{chord_type}').notes]] = 1
+        base /= np.linalg.norm(base)
+        for i, root in enumerate(roots):
+            names.append(f'{root}{chord_type}')
+            rows.append(np.roll(base, i))
+
+    templates = np.array(rows)
+    templates.setflags(write=False)
+    return names, templates
+
+
+def beat_histogram(chord, beats_per_bar:int=4):
+    """
+    Per-beat pitch-class histogram of a track, weighted by how long each pitch class sounds inside the beat.
+
+    Every note adds a ramp (beat edge clipped to the note span), so the whole track is one vectorized
+    pass per pitch class instead of a loop over beats and notes.
+
+    chord: mp.chord obj
+
+    beats_per_bar: int
+        EG: 4 for 4/4, 3 for 3/4
+
+    Returns:
+        np.array of shape (num_beats, 12), in bars, counted from 0 so start_time shifts notes into later beats.
+        EG: a whole note C4 in 4/4 >> 4 rows of [0.25, 0, ...]
+    """
+    notes = chord.notes
+    if len(notes) == 0:
+        return np.zeros((0, 12))
+
+    intervals = np.asarray(chord.interval, dtype=float)
+    starts = chord.start_time + np.concatenate(([0.0], np.cumsum(intervals[:-1])))
+    ends = starts + np.array([n.duration for n in notes], dtype=float)
+    pitch_classes = np.array([n.degree % 12 for n in notes])
+
+    beat = 1 / beats_per_bar
+    num_beats = int(np.ceil(ends.max() / beat - 1e-9))
+    edges = np.arange(num_beats + 1) * beat
+
+    # time each pitch class sounds before every beat edge, then difference into beats
+    sounding = np.zeros((num_beats + 1, 12))
+    for pc in np.unique(pitch_classes):
+        mask = pitch_classes == pc
+        clipped = np.clip(edges[:, None], starts[mask], ends[mask]) - starts[mask]
+        sounding[:, pc] = clipped.sum(axis=1)
+
+    return np.diff(sounding, axis=0)
+
+
+def label_windows(histogram, templates=None):
+    """
+    Match each window histogram against chord templates with cosine similarity.
+
+    histogram: np.array of shape (num_windows, 12)
+
+    Returns:
+        (labels, scores)
+        labels: list of chord name or None for silent windows. EG: ['CM', 'Am', None]
+        scores: np.array of cosine similarity of the chosen label, 0 for silent windows
+    """
+    names, matrix = templates if templates is not None else chord_templates()
+
+    norms = np.linalg.norm(histogram, axis=1)
+    safe = np.where(norms > 0, norms, 1)
+    similarity = (histogram / safe[:, None]) @ matrix.T
+
+    best = similarity.argmax(axis=1)
+    scores = np.where(norms > 0, similarity[np.arange(len(best)), best], 0.0)
+    labels = [names[i] if norm > 0 else None for i, norm in zip(best, norms)]
+    return labels, scores
+
+
+def default_window_sizes(beats_per_bar:int=4):
+    """
+    WINDOW_SIZES that are a whole number of beats. EG: 4 >> (0.5, 1, 2, 4), 3 >> (1, 2, 4)
+    """
+    return tuple(size for size in WINDOW_SIZES if abs(size * beats_per_bar - round(size * beats_per_bar)) < 1e-9)
+
+
+def analyze_resolutions(chord, window_sizes=None, beats_per_bar:int=4, stability_threshold:float=0.75):
+    """
+    Chord labels for several window sizes from a single histogram pass.
+
+    The beat histogram is summed up level by level like a segment tree: a 1 bar window is the sum of its
+    two 1/2 bar children, a 2 bar window the sum of its two 1 bar children, and so on.
+    A level is stable when most windows keep the same label as their children, ie the chords do not change
+    inside the window. The suggested window size is the largest one reached while every level is stable.
+
+    chord: mp.chord obj
+
+    window_sizes: tuple of float
+        In bars, ascending. Each size must be a whole multiple of the previous one, the first a whole number of beats.
+        Defaults to default_window_sizes(beats_per_bar).
+
+    stability_threshold: float
+        Minimum share of windows agreeing with their children for a level to count as stable.
+
+    Returns:
+        dict of windows, agreement, suggested_sample_rate
+
+    Example:
+        progression = mp.C('C') % (1, [0, 0, 1]) | mp.C('Am') % (1, [0, 0, 1]) | mp.C('F') % (1, [0, 0, 1]) | mp.C('G') % (1, [0, 0, 1])
+        analyze_resolutions(progression)
+        {
+            'windows': {
+                0.5: [{'chord': 'CM', 'start': 0.0, 'end': 0.5, 'score': 1.0}, ...],
+                1: [{'chord': 'CM', 'start': 0, 'end': 1, 'score': 1.0}, {'chord': 'Am', 'start': 1, 'end': 2, 'score': 1.0}, ...],
+                ...
+            },
+            'agreement': {0.5: 1.0, 1: 1.0, 2: 0.0, 4: 0.0},
+            'suggested_sample_rate': 1
+        }
+    """
+    sizes = sorted(window_sizes or default_window_sizes(beats_per_bar))
+    base_beats = sizes[0] * beats_per_bar
+    if abs(base_beats - round(base_beats)) > 1e-9 or round(base_beats) < 1:
+        raise ValueError(f"Smallest window {sizes[0]} is not a whole number of beats in {beats_per_bar}/4")
+
+    ratios = [sizes[i + 1] / sizes[i] for i in range(len(sizes) - 1)]
+    if any(abs(r - round(r)) > 1e-9 or round(r) < 2 for r in ratios):
+        raise ValueError(f"Window sizes {sizes} must each be a whole multiple of the previous one")
+
+    beats = beat_histogram(chord, beats_per_bar)
+
+    # pad to whole windows of the largest size so every level reshapes cleanly
+    top_beats = int(round(sizes[-1] * beats_per_bar))
+    num_beats = max(top_beats, int(np.ceil(len(beats) / top_beats)) * top_beats)
+    beats = np.vstack([beats, np.zeros((num_beats - len(beats), 12))])
+
+    # leaf level, then sum children into parents
+    level = beats.reshape(-1, int(round(base_beats)), 12).sum(axis=1)
+    levels = [level]
+    for ratio in ratios:
+        level = level.reshape(-1, int(round(ratio)), 12).sum(axis=1)
+        levels.append(level)
+
+    templates = chord_templates()
+    windows = {}
+    agreement = {}
+    labels_per_level = []
+    for i, (size, level) in enumerate(zip(sizes, levels)):
+        labels, scores = label_windows(level, templates)
+        labels_per_level.append(labels)
+        windows[size] = [
+            {'chord': label, 'start': j * size, 'end': (j + 1) * size, 'score': round(float(score), 3)}
+            for j, (label, score) in enumerate(zip(labels, scores))
+            if label is not None
+        ]
+
+        if i == 0:
+            agreement[size] = 1.0
+            continue
+
+        # a window agrees when all its sounding children carry its own label
+        ratio = int(round(ratios[i - 1]))
+        children = labels_per_level[i - 1]
+        agreed = 0
+        total = 0
+        for j, label in enumerate(labels):
+            if label is None:
+                continue
+            total += 1
+            kids = [c for c in children[j * ratio:(j + 1) * ratio] if c is not None]
+            agreed += all(c == label for c in kids)
+        agreement[size] = agreed / total if total else 1.0
+
+    suggested = sizes[0]
+    for size in sizes[1:]:
+        if agreement[size] < stability_threshold:
+            break
+        suggested = size
+
+    return {
+        'windows': windows,
+        'agreement': agreement,
+        'suggested_sample_rate': suggested,
+    }
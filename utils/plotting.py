@@ -1,6 +1,7 @@
 import mido
 import pandas as pd
 import plotly.graph_objects as go
+import numpy as np
 import musicpy as mp
 
 
@@ -121,4 +122,36 @@ def plot_chords(chord, start_time=0, end_time=10, time_signature=4, height=500,
     # Parse the generated MIDI file
     df = parse_midi('temp.mid', start_time, end_time)
     fig = plot_midi_notes(df, time_signature, height, width, title=title)
-    return fig
\ No newline at end of file
+    return fig
+
+
+def plot_drums(drum_json:dict, height=300, width=None, title=None):
+    """
+    Step grid of a drum pattern JSON (see utils.parsers.drums.analyze_drums), one row per drum voice.
+    Drawn from the JSON directly, no MIDI file is written.
+    """
+    steps_per_bar = drum_json['steps_per_bar']
+    bar_length = drum_json.get('bar_length', 1)
+    voices = sorted(drum_json['voices'], key=int)
+    row_index = {voice: i for i, voice in enumerate(voices)}
+    num_bars = len(drum_json['bars'])
+
+    grid = np.zeros((len(voices), num_bars * steps_per_bar))
+    for bar, index in enumerate(drum_json['bars']):
+        if index < 0:
+            continue
+        for voice, steps in drum_json['patterns'][index]['hits'].items():
+            hits = np.frombuffer(steps.encode(), dtype=np.uint8) == ord('x')
+            grid[row_index[voice], bar * steps_per_bar:(bar + 1) * steps_per_bar] = hits
+
+    labels = [f"{voice} {drum_json['voices'][voice]['name']}" for voice in voices]
+    x = np.arange(num_bars * steps_per_bar) * bar_length / steps_per_bar
+    fig = go.Figure(go.Heatmap(z=grid, x=x, y=labels, colorscale=[[0, '#ffffff'], [1, '#71aa91']], showscale=False, xgap=1, ygap=1))
+    fig.update_layout(
+        title=title,
+        height=height,
+        width=width,
+        xaxis=dict(title='Bars', dtick=bar_length),
+        template='simple_white',
+    )
+    return fig